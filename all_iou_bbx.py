@@ -1,5 +1,8 @@
 import numpy as np
 
+from jit_kernels import box_ious, use_box_kernels
+from profiling import instrument
+
 
 def calculate_iou(box1, box2):
     x1_inter = max(box1[0], box2[0])
@@ -185,33 +188,301 @@ def calculate_mpdiou(box1, box2):
     return mpdiou
 
 
-# Test cases
-test_cases = [
-    ("完全重疊 (Complete Overlap)", [0, 0, 2, 2], [0, 0, 2, 2]),
-    ("部分重疊 (Partial Overlap)", [0, 0, 2, 2], [1, 1, 3, 3]),
-    ("不重疊 (No Overlap)", [0, 0, 2, 2], [3, 3, 5, 5]),
-    ("邊界接觸 (Touching at Edges)", [0, 0, 2, 2], [2, 2, 4, 4]),
-    ("小框在大框內 (Small Box Inside Large Box)", [1, 1, 2, 2], [0, 0, 3, 3]),
-    ("交錯重疊 (Interleaved Overlap)", [0, 0, 3, 3], [1, 1, 4, 4]),
-    ("不同形狀 (Different Shapes)", [0, 0, 2, 3], [1, 0, 3, 2]),
-    (
-        "相似形狀但位置偏移 (Similar Shapes but Offset)",
-        [0, 0, 2, 2],
-        [0.5, 0.5, 2.5, 2.5],
-    ),
-    ("大面積交疊 (Large Area Overlap)", [0, 0, 4, 4], [1, 1, 3, 3]),
-    ("一個框全為零 (One Box All Zero)", [0, 0, 0, 0], [1, 1, 2, 2]),
-]
-
-for description, b1, b2 in test_cases:
-    print(f"{description} - IoU:", calculate_iou(b1, b2))
-    print(f"{description} - GIoU:", calculate_giou(b1, b2))
-    print(f"{description} - DIoU:", calculate_diou(b1, b2))
-    print(f"{description} - CIoU:", calculate_ciou(b1, b2))
-    print(f"{description} - EIoU:", calculate_eiou(b1, b2))
-    print(f"{description} - Focal EIoU:", calculate_focal_eiou(b1, b2))
-    print(f"{description} - SIoU:", calculate_siou(b1, b2))
-    print(f"{description} - Alpha-IoU:", calculate_alpha_iou(b1, b2))
-    print(f"{description} - WIoU:", calculate_wiou(b1, b2))
-    print(f"{description} - MPDIoU:", calculate_mpdiou(b1, b2))
-    print()
+BOX_IOU_VARIANTS = (
+    "iou",
+    "giou",
+    "diou",
+    "ciou",
+    "eiou",
+    "focal_eiou",
+    "siou",
+    "alpha_iou",
+    "wiou",
+    "mpdiou",
+)
+
+# Variants that need the enclosing box, center distance or aspect-ratio terms
+_ENCLOSE_VARIANTS = {"giou", "diou", "ciou", "eiou", "focal_eiou", "mpdiou"}
+_ASPECT_VARIANTS = {"ciou", "siou"}
+
+
+def _as_boxes(boxes, batched=False):
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if boxes.ndim == 1:
+        boxes = boxes[None, :]
+    if boxes.shape[-1] != 4 or (boxes.ndim != 2 and not batched):
+        expected = "(..., N, 4)" if batched else "(N, 4)"
+        raise ValueError(f"Expected boxes of shape {expected}, got {boxes.shape}.")
+    return boxes
+
+
+@instrument(name="box_geometry", category="stage")
+def _box_geometry(b1, b2, enclose=True, aspect=True):
+    """
+    Compute the geometric intermediates shared by the IoU variants for two
+    broadcast-compatible (..., 4) box arrays.
+    """
+    inter_w = np.maximum(
+        0, np.minimum(b1[..., 2], b2[..., 2]) - np.maximum(b1[..., 0], b2[..., 0])
+    )
+    inter_h = np.maximum(
+        0, np.minimum(b1[..., 3], b2[..., 3]) - np.maximum(b1[..., 1], b2[..., 1])
+    )
+    inter_area = inter_w * inter_h
+
+    width1 = b1[..., 2] - b1[..., 0]
+    height1 = b1[..., 3] - b1[..., 1]
+    width2 = b2[..., 2] - b2[..., 0]
+    height2 = b2[..., 3] - b2[..., 1]
+    box1_area = width1 * height1
+    box2_area = width2 * height2
+    union = box1_area + box2_area - inter_area
+
+    # Zero-area pairs score 0.0, same as calculate_iou
+    zero_area = (box1_area == 0) | (box2_area == 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(zero_area, 0.0, inter_area / union)
+
+    geometry = {"iou": iou, "union": union, "zero_area": zero_area}
+
+    if enclose:
+        enclose_w = np.maximum(b1[..., 2], b2[..., 2]) - np.minimum(
+            b1[..., 0], b2[..., 0]
+        )
+        enclose_h = np.maximum(b1[..., 3], b2[..., 3]) - np.minimum(
+            b1[..., 1], b2[..., 1]
+        )
+        center_dx = (b1[..., 0] + b1[..., 2]) / 2 - (b2[..., 0] + b2[..., 2]) / 2
+        center_dy = (b1[..., 1] + b1[..., 3]) / 2 - (b2[..., 1] + b2[..., 3]) / 2
+        geometry["enclose_area"] = enclose_w * enclose_h
+        geometry["c_diag"] = np.sqrt(enclose_w * enclose_w + enclose_h * enclose_h)
+        geometry["distance"] = np.sqrt(center_dx * center_dx + center_dy * center_dy)
+
+    if aspect:
+        # Aspect-ratio term only exists when both heights are non-zero
+        with np.errstate(divide="ignore", invalid="ignore"):
+            atan1 = np.arctan(width1 / height1)
+            atan2 = np.arctan(width2 / height2)
+        geometry["zero_height"] = (height1 == 0) | (height2 == 0)
+        geometry["v"] = (4 / np.pi**2) * (atan1 - atan2) ** 2
+
+    return geometry
+
+
+def _distance_penalty(geometry):
+    # Cached on the geometry so variants sharing it only pay for it once
+    if "penalty" not in geometry:
+        c_diag = geometry["c_diag"]
+        zero_diag = c_diag == 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            penalty = geometry["distance"] ** 2 / c_diag**2
+        geometry["penalty"] = np.where(zero_diag, 0.0, penalty)
+        geometry["zero_diag"] = zero_diag
+    return geometry["penalty"], geometry["zero_diag"]
+
+
+def _variant_from_geometry(geometry, variant, gamma=2.0, alpha=0.5, weight=1):
+    iou = geometry["iou"]
+
+    if variant == "iou":
+        return iou
+
+    if variant == "giou":
+        enclose_area = geometry["enclose_area"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            giou = iou - (enclose_area - geometry["union"]) / enclose_area
+        return np.where(geometry["zero_area"], 0.0, giou)
+
+    if variant in ("diou", "eiou"):
+        if "eiou" not in geometry:
+            penalty, _ = _distance_penalty(geometry)
+            geometry["eiou"] = iou - penalty
+        return geometry["eiou"]
+
+    if variant == "ciou":
+        penalty, zero_diag = _distance_penalty(geometry)
+        v = geometry["v"]
+        denominator = 1 - iou + v
+        with np.errstate(divide="ignore", invalid="ignore"):
+            alpha_term = np.where(denominator == 0, 0.0, v / denominator)
+        ciou = iou - (penalty + alpha_term * v)
+        return np.where(geometry["zero_height"] | zero_diag, iou, ciou)
+
+    if variant == "focal_eiou":
+        eiou = _variant_from_geometry(geometry, "eiou")
+        # Ensure Focal EIoU is 1 when completely overlapped
+        return np.where(eiou == 1, 1.0, (1 - eiou) ** gamma * eiou)
+
+    if variant == "siou":
+        return np.where(geometry["zero_height"], iou, iou - geometry["v"])
+
+    if variant == "alpha_iou":
+        return iou**alpha
+
+    if variant == "wiou":
+        return iou * weight
+
+    if variant == "mpdiou":
+        penalty, zero_diag = _distance_penalty(geometry)
+        mpdiou = iou - penalty - np.minimum(geometry["distance"], geometry["c_diag"])
+        return np.where(zero_diag, iou, mpdiou)
+
+    raise ValueError(
+        f"Unknown IoU variant {variant!r}, expected one of {BOX_IOU_VARIANTS}."
+    )
+
+
+@instrument
+def calculate_pairwise_iou(
+    boxes1, boxes2, variant="iou", gamma=2.0, alpha=0.5, weight=1
+):
+    """
+    Compute an IoU-family variant between every box in boxes1 (N, 4) and every
+    box in boxes2 (M, 4) in one broadcasted pass, returning an (N, M) matrix.
+    Leading batch dimensions broadcast, e.g. (B, N, 4) and (B, M, 4) give (B, N, M).
+
+    Entry [i, j] equals the matching scalar function, e.g.
+    calculate_pairwise_iou(b1, b2, "ciou")[i, j] == calculate_ciou(b1[i], b2[j]).
+    """
+    if variant not in BOX_IOU_VARIANTS:
+        raise ValueError(
+            f"Unknown IoU variant {variant!r}, expected one of {BOX_IOU_VARIANTS}."
+        )
+    boxes1 = _as_boxes(boxes1, batched=True)
+    boxes2 = _as_boxes(boxes2, batched=True)
+    if (
+        boxes1.ndim == 2
+        and boxes2.ndim == 2
+        and use_box_kernels(len(boxes1) * len(boxes2), gamma, alpha, weight)
+    ):
+        return box_ious(boxes1, boxes2, (variant,), gamma, alpha, weight)[..., 0]
+    geometry = _box_geometry(
+        boxes1[..., :, None, :],
+        boxes2[..., None, :, :],
+        enclose=variant in _ENCLOSE_VARIANTS,
+        aspect=variant in _ASPECT_VARIANTS,
+    )
+    return _variant_from_geometry(
+        geometry, variant, gamma=gamma, alpha=alpha, weight=weight
+    )
+
+
+@instrument
+def calculate_paired_iou(boxes1, boxes2, variant="iou", gamma=2.0, alpha=0.5, weight=1):
+    """
+    Compute an IoU-family variant between row-aligned boxes, i.e. boxes1[k]
+    against boxes2[k] for two (K, 4) arrays, returning a (K,) vector.
+    """
+    if variant not in BOX_IOU_VARIANTS:
+        raise ValueError(
+            f"Unknown IoU variant {variant!r}, expected one of {BOX_IOU_VARIANTS}."
+        )
+    boxes1 = _as_boxes(boxes1)
+    boxes2 = _as_boxes(boxes2)
+    if boxes1.shape != boxes2.shape:
+        raise ValueError(
+            f"Paired boxes must have the same shape, got {boxes1.shape} and {boxes2.shape}."
+        )
+    if use_box_kernels(len(boxes1), gamma, alpha, weight):
+        values = box_ious(boxes1, boxes2, (variant,), gamma, alpha, weight, paired=True)
+        return values[..., 0]
+    geometry = _box_geometry(
+        boxes1,
+        boxes2,
+        enclose=variant in _ENCLOSE_VARIANTS,
+        aspect=variant in _ASPECT_VARIANTS,
+    )
+    return _variant_from_geometry(
+        geometry, variant, gamma=gamma, alpha=alpha, weight=weight
+    )
+
+
+@instrument
+def calculate_all_ious(
+    boxes1, boxes2, variants=BOX_IOU_VARIANTS, gamma=2.0, alpha=0.5, weight=1
+):
+    """
+    Compute several IoU-family variants between boxes1 (N, 4) and boxes2 (M, 4)
+    at once, sharing intersection, union, enclosing box, center distance and
+    aspect-ratio terms between them.
+
+    Returns an (N, M) structured array with one float64 field per variant, e.g.
+    calculate_all_ious(b1, b2)["ciou"] == calculate_pairwise_iou(b1, b2, "ciou").
+    """
+    variants = tuple(variants)
+    unknown = [variant for variant in variants if variant not in BOX_IOU_VARIANTS]
+    if unknown:
+        raise ValueError(
+            f"Unknown IoU variants {unknown}, expected any of {BOX_IOU_VARIANTS}."
+        )
+    boxes1 = _as_boxes(boxes1)
+    boxes2 = _as_boxes(boxes2)
+    dtype = [(variant, np.float64) for variant in variants]
+    if use_box_kernels(len(boxes1) * len(boxes2), gamma, alpha, weight):
+        # Compiled: the (N, M, V) values already have the report's layout
+        values = box_ious(boxes1, boxes2, variants, gamma, alpha, weight)
+        return values.view(dtype)[..., 0]
+
+    geometry = _box_geometry(
+        boxes1[:, None, :],
+        boxes2[None, :, :],
+        enclose=not _ENCLOSE_VARIANTS.isdisjoint(variants),
+        aspect=not _ASPECT_VARIANTS.isdisjoint(variants),
+    )
+
+    report = np.empty((len(boxes1), len(boxes2)), dtype=dtype)
+    for variant in variants:
+        report[variant] = _variant_from_geometry(
+            geometry, variant, gamma=gamma, alpha=alpha, weight=weight
+        )
+    return report
+
+
+if __name__ == "__main__":
+    # Test cases
+    test_cases = [
+        ("完全重疊 (Complete Overlap)", [0, 0, 2, 2], [0, 0, 2, 2]),
+        ("部分重疊 (Partial Overlap)", [0, 0, 2, 2], [1, 1, 3, 3]),
+        ("不重疊 (No Overlap)", [0, 0, 2, 2], [3, 3, 5, 5]),
+        ("邊界接觸 (Touching at Edges)", [0, 0, 2, 2], [2, 2, 4, 4]),
+        ("小框在大框內 (Small Box Inside Large Box)", [1, 1, 2, 2], [0, 0, 3, 3]),
+        ("交錯重疊 (Interleaved Overlap)", [0, 0, 3, 3], [1, 1, 4, 4]),
+        ("不同形狀 (Different Shapes)", [0, 0, 2, 3], [1, 0, 3, 2]),
+        (
+            "相似形狀但位置偏移 (Similar Shapes but Offset)",
+            [0, 0, 2, 2],
+            [0.5, 0.5, 2.5, 2.5],
+        ),
+        ("大面積交疊 (Large Area Overlap)", [0, 0, 4, 4], [1, 1, 3, 3]),
+        ("一個框全為零 (One Box All Zero)", [0, 0, 0, 0], [1, 1, 2, 2]),
+    ]
+
+    for description, b1, b2 in test_cases:
+        print(f"{description} - IoU:", calculate_iou(b1, b2))
+        print(f"{description} - GIoU:", calculate_giou(b1, b2))
+        print(f"{description} - DIoU:", calculate_diou(b1, b2))
+        print(f"{description} - CIoU:", calculate_ciou(b1, b2))
+        print(f"{description} - EIoU:", calculate_eiou(b1, b2))
+        print(f"{description} - Focal EIoU:", calculate_focal_eiou(b1, b2))
+        print(f"{description} - SIoU:", calculate_siou(b1, b2))
+        print(f"{description} - Alpha-IoU:", calculate_alpha_iou(b1, b2))
+        print(f"{description} - WIoU:", calculate_wiou(b1, b2))
+        print(f"{description} - MPDIoU:", calculate_mpdiou(b1, b2))
+        print()
+
+    # Batched: every box against every box in a single (N, M) matrix per variant
+    boxes_a = np.array([b1 for _, b1, _ in test_cases])
+    boxes_b = np.array([b2 for _, _, b2 in test_cases])
+    for variant in BOX_IOU_VARIANTS:
+        print(f"Pairwise {variant} ({len(boxes_a)}x{len(boxes_b)}):")
+        print(np.round(calculate_pairwise_iou(boxes_a, boxes_b, variant), 4))
+        print()
+
+    # Full metric report for the test pairs, sharing intermediates across variants
+    report = calculate_all_ious(boxes_a, boxes_b)
+    for i, (description, _, _) in enumerate(test_cases):
+        row = report[i, i]
+        print(f"{description} - All variants:")
+        print(
+            "  " + ", ".join(f"{name}={row[name]:.4f}" for name in report.dtype.names)
+        )
@@ -1,336 +1,438 @@
 import numpy as np
 
-
-def calculate_mask_iou(mask1, mask2):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-    if union == 0:
-        return 0.0
-    iou = intersection / union
-    return iou
-
-
-def calculate_mask_giou(mask1, mask2):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-
-    if union == 0:
-        return 0.0
-
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
-
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
-        return 0.0
-
-    enclose_x_min = min(mask1_nonzero[0].min(), mask2_nonzero[0].min())
-    enclose_x_max = max(mask1_nonzero[0].max(), mask2_nonzero[0].max())
-    enclose_y_min = min(mask1_nonzero[1].min(), mask2_nonzero[1].min())
-    enclose_y_max = max(mask1_nonzero[1].max(), mask2_nonzero[1].max())
-
-    enclose_area = (enclose_x_max - enclose_x_min + 1) * (
-        enclose_y_max - enclose_y_min + 1
+from cropped_mask import CroppedMask, as_cropped, cropped_intersection
+from jit_kernels import mask_overlap, use_mask_kernel
+from mask_stats import as_binary_mask, get_mask_stats, intersection_count
+from profiling import instrument
+from rle_mask import RLEMask, reject_rle, rle_mask_giou, rle_mask_iou
+
+
+def _mask_overlap(mask1, mask2, threshold=None):
+    if isinstance(mask1, CroppedMask) or isinstance(mask2, CroppedMask):
+        # Only the overlap of the two bounding-box tiles is scanned
+        crop1 = as_cropped(mask1, threshold)
+        crop2 = as_cropped(mask2, threshold)
+        intersection = cropped_intersection(crop1, crop2)
+        union = crop1.area() + crop2.area() - intersection
+        return crop1.stats(), crop2.stats(), intersection, union
+
+    if use_mask_kernel(mask1, mask2):
+        # Compiled: both masks' stats and the intersection in one fused pass
+        return mask_overlap(mask1, mask2, threshold)
+
+    # One pairwise pass for the intersection, the rest comes from cached stats
+    # (in-place writes are caught by the sample check in get_mask_stats)
+    stats1 = get_mask_stats(mask1, threshold)
+    stats2 = get_mask_stats(mask2, threshold)
+    intersection = intersection_count(mask1, mask2, threshold)
+    union = stats1.area + stats2.area - intersection
+    return stats1, stats2, intersection, union
+
+
+@instrument(name="enclosing_box", category="stage")
+def _enclose_extent(extent1, extent2):
+    return (
+        min(extent1[0], extent2[0]),
+        max(extent1[1], extent2[1]),
+        min(extent1[2], extent2[2]),
+        max(extent1[3], extent2[3]),
     )
 
-    giou = (intersection / union) - ((enclose_area - union) / enclose_area)
-    return giou
-
-
-def calculate_mask_diou(mask1, mask2):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-
-    if union == 0:
-        return 0.0
-
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
-
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
-        return 0.0
-
-    mask1_center = np.mean(np.argwhere(mask1 == 1), axis=0)
-    mask2_center = np.mean(np.argwhere(mask2 == 1), axis=0)
-
-    distance = np.linalg.norm(mask1_center - mask2_center)
 
-    enclose_x_min = min(mask1_nonzero[0].min(), mask2_nonzero[0].min())
-    enclose_x_max = max(mask1_nonzero[0].max(), mask2_nonzero[0].max())
-    enclose_y_min = min(mask1_nonzero[1].min(), mask2_nonzero[1].min())
-    enclose_y_max = max(mask1_nonzero[1].max(), mask2_nonzero[1].max())
-
-    c_diag = np.linalg.norm(
-        np.array([enclose_x_max, enclose_y_max])
-        - np.array([enclose_x_min, enclose_y_min])
+@instrument(name="distance", category="stage")
+def _center_distance_and_diagonal(stats1, stats2, extent1, extent2):
+    distance = np.linalg.norm(stats1.centroid - stats2.centroid)
+    enclose_x_min, enclose_x_max, enclose_y_min, enclose_y_max = _enclose_extent(
+        extent1, extent2
     )
-
-    diou = (intersection / union) - (distance**2 / c_diag**2)
-    return diou
-
-
-def calculate_mask_ciou(mask1, mask2):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-    if union == 0:
-        return 0.0
-
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
-
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
-        return 0.0
-
-    mask1_center = np.mean(np.argwhere(mask1 == 1), axis=0)
-    mask2_center = np.mean(np.argwhere(mask2 == 1), axis=0)
-    distance = np.linalg.norm(mask1_center - mask2_center)
-    enclose_x_min = min(mask1.nonzero()[0].min(), mask2.nonzero()[0].min())
-    enclose_x_max = max(mask1.nonzero()[0].max(), mask2.nonzero()[0].max())
-    enclose_y_min = min(mask1.nonzero()[1].min(), mask2.nonzero()[1].min())
-    enclose_y_max = max(mask1.nonzero()[1].max(), mask2.nonzero()[1].max())
     c_diag = np.linalg.norm(
         np.array([enclose_x_max, enclose_y_max])
         - np.array([enclose_x_min, enclose_y_min])
     )
-    mask1_shape = mask1.shape[0] / mask1.shape[1]
-    mask2_shape = mask2.shape[0] / mask2.shape[1]
-    v = (4 / np.pi**2) * (np.arctan(mask1_shape) - np.arctan(mask2_shape)) ** 2
-
-    denominator = 1 - intersection / union + v
-    if denominator != 0:
-        alpha = v / denominator
-    else:
-        alpha = 0
-
-    ciou = (intersection / union) - (distance**2 / c_diag**2 + alpha * v)
-    return ciou
-
-
-def calculate_mask_eiou(mask1, mask2):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
+    return distance, c_diag
+
+
+MASK_IOU_VARIANTS = (
+    "iou",
+    "giou",
+    "diou",
+    "ciou",
+    "eiou",
+    "focal_eiou",
+    "siou",
+    "alpha_iou",
+    "wiou",
+    "mpdiou",
+)
+
+
+def _variant_from_overlap(
+    stats1, stats2, intersection, union, variant, gamma=2.0, alpha=0.5, weight=1
+):
+    """
+    One IoU-family variant from the two masks' stats and their intersection
+    and union pixel counts, however those were gathered (dense, cropped or
+    tile by tile).
+    """
+    if variant not in MASK_IOU_VARIANTS:
+        raise ValueError(
+            f"Unknown IoU variant {variant!r}, expected one of {MASK_IOU_VARIANTS}."
+        )
     if union == 0:
         return 0.0
 
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
+    if variant == "iou":
+        iou = intersection / union
+        return iou
 
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
+    # Check if either mask has no non-zero elements
+    if stats1.area == 0 or stats2.area == 0:
         return 0.0
 
-    mask1_center = np.mean(np.argwhere(mask1 == 1), axis=0)
-    mask2_center = np.mean(np.argwhere(mask2 == 1), axis=0)
-    distance = np.linalg.norm(mask1_center - mask2_center)
-    enclose_x_min = min(mask1.nonzero()[0].min(), mask2.nonzero()[0].min())
-    enclose_x_max = max(mask1.nonzero()[0].max(), mask2.nonzero()[0].max())
-    enclose_y_min = min(mask1.nonzero()[1].min(), mask2.nonzero()[1].min())
-    enclose_y_max = max(mask1.nonzero()[1].max(), mask2.nonzero()[1].max())
-    c_diag = np.linalg.norm(
-        np.array([enclose_x_max, enclose_y_max])
-        - np.array([enclose_x_min, enclose_y_min])
+    def enclose_area():
+        enclose_x_min, enclose_x_max, enclose_y_min, enclose_y_max = _enclose_extent(
+            stats1.extent, stats2.extent
+        )
+        return (enclose_x_max - enclose_x_min + 1) * (enclose_y_max - enclose_y_min + 1)
+
+    def aspect():
+        mask1_shape = stats1.shape[0] / stats1.shape[1]
+        mask2_shape = stats2.shape[0] / stats2.shape[1]
+        return (4 / np.pi**2) * (np.arctan(mask1_shape) - np.arctan(mask2_shape)) ** 2
+
+    return _variant_from_terms(
+        intersection,
+        union,
+        variant,
+        enclose_area,
+        aspect,
+        lambda: _center_distance_and_diagonal(
+            stats1, stats2, stats1.extent, stats2.extent
+        ),
+        gamma=gamma,
+        alpha=alpha,
+        weight=weight,
     )
-    eiou = (intersection / union) - (distance**2 / c_diag**2)
-    return eiou
-
-
-def calculate_focal_mask_eiou(mask1, mask2, gamma=2.0):
-    # Calculate intersection and union
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-
-    if union == 0:
-        return 0.0
-
-    # Determine the non-zero elements
-    mask1_nonzero = np.argwhere(mask1 == 1)
-    mask2_nonzero = np.argwhere(mask2 == 1)
-
-    # Handle cases where the mask is entirely zeros
-    if mask1_nonzero.size == 0 or mask2_nonzero.size == 0:
-        return 0.0
-
-    # Calculate the center only if there are non-zero elements
-    mask1_center = np.mean(mask1_nonzero, axis=0)
-    mask2_center = np.mean(mask2_nonzero, axis=0)
 
-    distance = np.linalg.norm(mask1_center - mask2_center)
 
-    # Determine the enclosing box coordinates
-    enclose_x_min = min(mask1_nonzero[:, 0].min(), mask2_nonzero[:, 0].min())
-    enclose_x_max = max(mask1_nonzero[:, 0].max(), mask2_nonzero[:, 0].max())
-    enclose_y_min = min(mask1_nonzero[:, 1].min(), mask2_nonzero[:, 1].min())
-    enclose_y_max = max(mask1_nonzero[:, 1].max(), mask2_nonzero[:, 1].max())
-    c_diag = np.linalg.norm(
-        np.array([enclose_x_max, enclose_y_max])
-        - np.array([enclose_x_min, enclose_y_min])
-    )
-
-    # Ensure c_diag is non-zero to avoid division errors
-    if c_diag == 0:
-        eiou = 0.0  # Change to 0.0 for consistency
-    else:
+def _variant_from_terms(
+    intersection,
+    union,
+    variant,
+    enclose_area,
+    aspect,
+    distance_and_diagonal,
+    gamma=2.0,
+    alpha=0.5,
+    weight=1,
+):
+    """
+    The mask formula of one IoU-family variant for two non-empty masks. The
+    geometric terms are callables, evaluated only for the variants that need
+    them: enclose_area() in pixels, aspect() giving v, and
+    distance_and_diagonal() giving (centroid distance, enclosing diagonal).
+    volume_iou reuses it with N-dimensional terms.
+    """
+    if variant == "iou":
+        return intersection / union
+
+    if variant == "giou":
+        enclose_area = enclose_area()
+        giou = (intersection / union) - ((enclose_area - union) / enclose_area)
+        return giou
+
+    if variant in ("alpha_iou", "wiou"):
+        iou = intersection / union
+        return iou**alpha if variant == "alpha_iou" else iou * weight
+
+    if variant in ("ciou", "siou"):
+        v = aspect()
+        if variant == "siou":
+            siou = (intersection / union) - v
+            return siou
+
+    distance, c_diag = distance_and_diagonal()
+
+    if variant in ("diou", "eiou"):
         eiou = (intersection / union) - (distance**2 / c_diag**2)
+        return eiou
+
+    if variant == "ciou":
+        denominator = 1 - intersection / union + v
+        if denominator != 0:
+            alpha_term = v / denominator
+        else:
+            alpha_term = 0
+        ciou = (intersection / union) - (distance**2 / c_diag**2 + alpha_term * v)
+        return ciou
+
+    if variant == "focal_eiou":
+        # Ensure c_diag is non-zero to avoid division errors
+        if c_diag == 0:
+            eiou = 0.0  # Change to 0.0 for consistency
+        else:
+            eiou = (intersection / union) - (distance**2 / c_diag**2)
+
+        # Modify Focal EIoU formula to handle negative values
+        if eiou < 0:
+            focal_eiou = eiou * (1 + gamma)
+        else:
+            focal_eiou = eiou * (1 - (1 - eiou) ** gamma)
+        return focal_eiou
 
-    # Calculate Focal EIoU
-    # Modify Focal EIoU formula to handle negative values
-    if eiou < 0:
-        focal_eiou = eiou * (1 + gamma)
-    else:
-        focal_eiou = eiou * (1 - (1 - eiou) ** gamma)
+    mpdiou = (intersection / union) - (distance**2 / c_diag**2) - min(distance, c_diag)
+    return mpdiou
 
-    return focal_eiou
 
+@instrument
+def calculate_mask_iou(mask1, mask2, threshold=None):
+    if isinstance(mask1, RLEMask) or isinstance(mask2, RLEMask):
+        return rle_mask_iou(mask1, mask2, threshold)
+    return _variant_from_overlap(*_mask_overlap(mask1, mask2, threshold), "iou")
 
-def calculate_mask_siou(mask1, mask2):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-    if union == 0:
-        return 0.0
 
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
+@instrument
+def calculate_mask_giou(mask1, mask2, threshold=None):
+    if isinstance(mask1, RLEMask) or isinstance(mask2, RLEMask):
+        return rle_mask_giou(mask1, mask2, threshold)
+    return _variant_from_overlap(*_mask_overlap(mask1, mask2, threshold), "giou")
 
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
-        return 0.0
 
-    mask1_shape = mask1.shape[0] / mask1.shape[1]
-    mask2_shape = mask2.shape[0] / mask2.shape[1]
-    v = (4 / np.pi**2) * (np.arctan(mask1_shape) - np.arctan(mask2_shape)) ** 2
-    siou = (intersection / union) - v
-    return siou
+@instrument
+def calculate_mask_diou(mask1, mask2, threshold=None):
+    reject_rle("calculate_mask_diou", mask1, mask2)
+    return _variant_from_overlap(*_mask_overlap(mask1, mask2, threshold), "diou")
 
 
-def calculate_mask_alpha_iou(mask1, mask2, alpha=0.5):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-    if union == 0:
-        return 0.0
-
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
+@instrument
+def calculate_mask_ciou(mask1, mask2, threshold=None):
+    reject_rle("calculate_mask_ciou", mask1, mask2)
+    return _variant_from_overlap(*_mask_overlap(mask1, mask2, threshold), "ciou")
 
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
-        return 0.0
 
-    iou = intersection / union
-    alpha_iou = iou**alpha
-    return alpha_iou
+@instrument
+def calculate_mask_eiou(mask1, mask2, threshold=None):
+    reject_rle("calculate_mask_eiou", mask1, mask2)
+    return _variant_from_overlap(*_mask_overlap(mask1, mask2, threshold), "eiou")
 
 
-def calculate_mask_wiou(mask1, mask2, weight=1):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-    if union == 0:
-        return 0.0
+@instrument
+def calculate_focal_mask_eiou(mask1, mask2, gamma=2.0, threshold=None):
+    reject_rle("calculate_focal_mask_eiou", mask1, mask2)
+    return _variant_from_overlap(
+        *_mask_overlap(mask1, mask2, threshold), "focal_eiou", gamma=gamma
+    )
 
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
 
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
-        return 0.0
+@instrument
+def calculate_mask_siou(mask1, mask2, threshold=None):
+    reject_rle("calculate_mask_siou", mask1, mask2)
+    return _variant_from_overlap(*_mask_overlap(mask1, mask2, threshold), "siou")
 
-    iou = intersection / union
-    wiou = iou * weight
-    return wiou
 
+@instrument
+def calculate_mask_alpha_iou(mask1, mask2, alpha=0.5, threshold=None):
+    reject_rle("calculate_mask_alpha_iou", mask1, mask2)
+    return _variant_from_overlap(
+        *_mask_overlap(mask1, mask2, threshold), "alpha_iou", alpha=alpha
+    )
 
-def calculate_mask_mpdiou(mask1, mask2):
-    intersection = np.logical_and(mask1, mask2).sum()
-    union = np.logical_or(mask1, mask2).sum()
-    if union == 0:
-        return 0.0
 
-    # Check if either mask has no non-zero elements
-    mask1_nonzero = mask1.nonzero()
-    mask2_nonzero = mask2.nonzero()
+@instrument
+def calculate_mask_wiou(mask1, mask2, weight=1, threshold=None):
+    reject_rle("calculate_mask_wiou", mask1, mask2)
+    return _variant_from_overlap(
+        *_mask_overlap(mask1, mask2, threshold), "wiou", weight=weight
+    )
 
-    if mask1_nonzero[0].size == 0 or mask2_nonzero[0].size == 0:
-        return 0.0
 
-    mask1_center = np.mean(np.argwhere(mask1 == 1), axis=0)
-    mask2_center = np.mean(np.argwhere(mask2 == 1), axis=0)
-    distance = np.linalg.norm(mask1_center - mask2_center)
-    enclose_x_min = min(mask1.nonzero()[0].min(), mask2.nonzero()[0].min())
-    enclose_x_max = max(mask1.nonzero()[0].max(), mask2.nonzero()[0].max())
-    enclose_y_min = min(mask1.nonzero()[1].min(), mask2.nonzero()[1].min())
-    enclose_y_max = max(mask1.nonzero()[1].max(), mask2.nonzero()[1].max())
-    c_diag = np.linalg.norm(
-        np.array([enclose_x_max, enclose_y_max])
-        - np.array([enclose_x_min, enclose_y_min])
+@instrument
+def calculate_mask_mpdiou(mask1, mask2, threshold=None):
+    reject_rle("calculate_mask_mpdiou", mask1, mask2)
+    return _variant_from_overlap(*_mask_overlap(mask1, mask2, threshold), "mpdiou")
+
+
+# Popcount per byte, used when np.bitwise_count (NumPy >= 2.0) is unavailable
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(
+    axis=1, dtype=np.uint8
+)
+
+
+def _popcount(words, axis=-1):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=axis, dtype=np.int64)
+    as_bytes = words.view(np.uint8)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=axis, dtype=np.int64)
+
+
+class PackedMasks:
+    """
+    A stack of N (H, W) masks packed by pack_masks into (N, words) uint64
+    bit-planes, one bit per pixel. Packed input is always marked by this
+    type, so a plain uint64 mask stack is never mistaken for bits.
+    """
+
+    __slots__ = ("shape", "words")
+
+    def __init__(self, shape, words):
+        self.shape = tuple(int(s) for s in shape)
+        self.words = np.asarray(words)
+        if len(self.shape) != 3:
+            raise ValueError(f"Expected an (N, H, W) stack shape, got {self.shape}.")
+        n_masks, height, width = self.shape
+        expected = (n_masks, (height * width + 63) // 64)
+        if self.words.dtype != np.uint64 or self.words.shape != expected:
+            raise ValueError(
+                f"Expected uint64 bit-planes of shape {expected}, got "
+                f"{self.words.dtype} {self.words.shape}."
+            )
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"PackedMasks(shape={self.shape})"
+
+
+@instrument(name="pack", category="stage")
+def pack_masks(masks, threshold=None):
+    """
+    Pack a stack of masks (N, H, W) into PackedMasks: uint64 bit-planes of
+    shape (N, words), one bit per pixel (foreground as in as_binary_mask).
+    """
+    masks = np.asarray(masks)
+    if masks.ndim == 2:
+        masks = masks[None]
+    n_masks = masks.shape[0]
+    n_pixels = int(np.prod(masks.shape[1:]))
+    n_words = (n_pixels + 63) // 64
+
+    packed = np.zeros((n_masks, n_words * 8), dtype=np.uint8)
+    # Pack one mask at a time so only a single (H, W) boolean temporary exists
+    for i in range(n_masks):
+        bits = np.packbits(as_binary_mask(masks[i], threshold).reshape(-1))
+        packed[i, : bits.size] = bits
+    return PackedMasks(masks.shape, packed.view(np.uint64))
+
+
+def calculate_pairwise_mask_overlaps(
+    masks1, masks2, block_words=1 << 22, threshold=None
+):
+    """
+    Compute the (N, M) intersection and union pixel counts between every mask
+    in masks1 (N, H, W) and every mask in masks2 (M, H, W).
+
+    Inputs may be raw mask stacks or PackedMasks from pack_masks. Rows are
+    processed in blocks of about `block_words` uint64 words to bound memory.
+    """
+    if not isinstance(masks1, PackedMasks):
+        masks1 = pack_masks(masks1, threshold)
+    if not isinstance(masks2, PackedMasks):
+        masks2 = pack_masks(masks2, threshold)
+    if masks1.shape[1:] != masks2.shape[1:]:
+        raise ValueError("Shape mismatch between the two mask stacks.")
+    packed1, packed2 = masks1.words, masks2.words
+
+    n_words = packed1.shape[1]
+    area1 = _popcount(packed1)
+    area2 = _popcount(packed2)
+
+    intersection = np.empty((len(packed1), len(packed2)), dtype=np.int64)
+    rows_per_block = max(1, block_words // max(1, len(packed2) * n_words))
+    for start in range(0, len(packed1), rows_per_block):
+        block = packed1[start : start + rows_per_block]
+        intersection[start : start + len(block)] = _popcount(
+            block[:, None, :] & packed2[None, :, :]
+        )
+
+    union = area1[:, None] + area2[None, :] - intersection
+    return intersection, union
+
+
+@instrument
+def calculate_pairwise_mask_iou(masks1, masks2, threshold=None):
+    """
+    Compute the (N, M) mask IoU matrix between the stacks masks1 (N, H, W) and
+    masks2 (M, H, W). Entry [i, j] equals calculate_mask_iou(masks1[i], masks2[j]).
+    """
+    intersection, union = calculate_pairwise_mask_overlaps(
+        masks1, masks2, threshold=threshold
     )
-    mpdiou = (intersection / union) - (distance**2 / c_diag**2) - min(distance, c_diag)
-    return mpdiou
+    iou = np.zeros(intersection.shape, dtype=np.float64)
+    np.divide(intersection, union, out=iou, where=union != 0)
+    return iou
 
 
-# Test cases
-test_cases = [
-    (
-        "完全重疊 (Complete Overlap)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-    ),
-    (
-        "部分重疊 (Partial Overlap)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[0, 1, 1], [1, 0, 0], [0, 0, 1]]),
-    ),
-    (
-        "不重疊 (No Overlap)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[0, 0, 1], [0, 0, 1], [1, 1, 0]]),
-    ),
-    (
-        "邊界接觸 (Touching at Edges)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[0, 0, 0], [0, 1, 1], [0, 1, 1]]),
-    ),
-    (
-        "小遮罩在大遮罩內 (Small Mask Inside Large Mask)",
-        np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]]),
-        np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1]]),
-    ),
-    (
-        "交錯重疊 (Interleaved Overlap)",
-        np.array([[1, 0, 1], [0, 1, 0], [1, 0, 1]]),
-        np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]]),
-    ),
-    (
-        "不同形狀 (Different Shapes)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[1, 0, 0], [1, 0, 0], [1, 1, 1]]),
-    ),
-    (
-        "相似形狀但位置偏移 (Similar Shapes but Offset)",
-        np.array([[0, 1, 1], [0, 1, 1], [0, 0, 0]]),
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-    ),
-    (
-        "大面積交疊 (Large Area Overlap)",
-        np.array([[1, 1, 1], [1, 1, 1], [0, 0, 0]]),
-        np.array([[1, 1, 0], [1, 1, 1], [1, 0, 0]]),
-    ),
-    (
-        "一個遮罩全為零 (One Mask All Zero)",
-        np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]]),
-        np.array([[1, 1, 1], [1, 0, 0], [0, 0, 1]]),
-    ),
-]
-
-for description, m1, m2 in test_cases:
-    print(f"{description} - Mask IoU:", calculate_mask_iou(m1, m2))
-    print(f"{description} - Mask GIoU:", calculate_mask_giou(m1, m2))
-    print(f"{description} - Mask DIoU:", calculate_mask_diou(m1, m2))
-    print(f"{description} - Mask CIoU:", calculate_mask_ciou(m1, m2))
-    print(f"{description} - Mask EIoU:", calculate_mask_eiou(m1, m2))
-    print(f"{description} - Mask Focal EIoU:", calculate_focal_mask_eiou(m1, m2))
-    print(f"{description} - Mask SIoU:", calculate_mask_siou(m1, m2))
-    print(f"{description} - Mask Alpha-IoU:", calculate_mask_alpha_iou(m1, m2))
-    print(f"{description} - Mask WIoU:", calculate_mask_wiou(m1, m2))
-    print(f"{description} - Mask MPDIoU:", calculate_mask_mpdiou(m1, m2))
-    print()
+if __name__ == "__main__":
+    # Test cases
+    test_cases = [
+        (
+            "完全重疊 (Complete Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+        ),
+        (
+            "部分重疊 (Partial Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+        (
+            "不重疊 (No Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 0, 1], [0, 0, 1], [1, 1, 0]]),
+        ),
+        (
+            "邊界接觸 (Touching at Edges)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 0, 0], [0, 1, 1], [0, 1, 1]]),
+        ),
+        (
+            "小遮罩在大遮罩內 (Small Mask Inside Large Mask)",
+            np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]]),
+            np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1]]),
+        ),
+        (
+            "交錯重疊 (Interleaved Overlap)",
+            np.array([[1, 0, 1], [0, 1, 0], [1, 0, 1]]),
+            np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]]),
+        ),
+        (
+            "不同形狀 (Different Shapes)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[1, 0, 0], [1, 0, 0], [1, 1, 1]]),
+        ),
+        (
+            "相似形狀但位置偏移 (Similar Shapes but Offset)",
+            np.array([[0, 1, 1], [0, 1, 1], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+        ),
+        (
+            "大面積交疊 (Large Area Overlap)",
+            np.array([[1, 1, 1], [1, 1, 1], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 1], [1, 0, 0]]),
+        ),
+        (
+            "一個遮罩全為零 (One Mask All Zero)",
+            np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]]),
+            np.array([[1, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+    ]
+
+    for description, m1, m2 in test_cases:
+        print(f"{description} - Mask IoU:", calculate_mask_iou(m1, m2))
+        print(f"{description} - Mask GIoU:", calculate_mask_giou(m1, m2))
+        print(f"{description} - Mask DIoU:", calculate_mask_diou(m1, m2))
+        print(f"{description} - Mask CIoU:", calculate_mask_ciou(m1, m2))
+        print(f"{description} - Mask EIoU:", calculate_mask_eiou(m1, m2))
+        print(f"{description} - Mask Focal EIoU:", calculate_focal_mask_eiou(m1, m2))
+        print(f"{description} - Mask SIoU:", calculate_mask_siou(m1, m2))
+        print(f"{description} - Mask Alpha-IoU:", calculate_mask_alpha_iou(m1, m2))
+        print(f"{description} - Mask WIoU:", calculate_mask_wiou(m1, m2))
+        print(f"{description} - Mask MPDIoU:", calculate_mask_mpdiou(m1, m2))
+        print()
+
+    # Batched: every mask against every mask using packed bit-planes
+    masks_a = np.stack([m1 for _, m1, _ in test_cases])
+    masks_b = np.stack([m2 for _, _, m2 in test_cases])
+    print(f"Pairwise Mask IoU ({len(masks_a)}x{len(masks_b)}):")
+    print(np.round(calculate_pairwise_mask_iou(masks_a, masks_b), 4))
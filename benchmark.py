@@ -0,0 +1,605 @@
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+from all_iou_bbx import (
+    BOX_IOU_VARIANTS,
+    calculate_all_ious,
+    calculate_alpha_iou,
+    calculate_ciou,
+    calculate_diou,
+    calculate_eiou,
+    calculate_focal_eiou,
+    calculate_giou,
+    calculate_iou,
+    calculate_mpdiou,
+    calculate_paired_iou,
+    calculate_pairwise_iou,
+    calculate_siou,
+    calculate_wiou,
+)
+from all_iou_mask import (
+    calculate_mask_giou,
+    calculate_mask_iou,
+    calculate_pairwise_mask_iou,
+    pack_masks,
+)
+from confusion_matrix import ConfusionMatrix
+from cropped_mask import CroppedMask
+from jit_kernels import (
+    NUMBA_AVAILABLE,
+    jit_enabled,
+    set_jit,
+    use_box_kernels,
+    use_mask_kernel,
+)
+from mask_metrics import dice_coefficient
+from mask_stats import clear_mask_stats_cache
+from rle_mask import RLEMask
+from sparse_iou_bbx import calculate_sparse_iou
+from streaming_eval import MASK_METRICS
+
+BENCHMARK_SCHEMA_VERSION = 1
+
+BOX_COUNTS = (10, 100, 1_000, 10_000, 100_000)
+MASK_SIZES = (64, 256, 1024, 4096)
+# Fraction of the image covered by the ground truth object
+DENSITIES = (0.01, 0.1, 0.5)
+SUITES = ("box", "mask", "pixel")
+
+# Larger workloads are skipped for the per-pair Python loop and dense (N, N) matrices
+MAX_SCALAR_BOXES = 10_000
+MAX_PAIRWISE_BOXES = 1_000
+
+SCALAR_BOX_FUNCTIONS = (
+    calculate_iou,
+    calculate_giou,
+    calculate_diou,
+    calculate_ciou,
+    calculate_eiou,
+    calculate_focal_eiou,
+    calculate_siou,
+    calculate_alpha_iou,
+    calculate_wiou,
+    calculate_mpdiou,
+)
+# Metrics with a run-length-encoded implementation
+RLE_MASK_FUNCTIONS = (calculate_mask_iou, calculate_mask_giou, dice_coefficient)
+# Dense metrics that go through the compiled mask kernel when it is enabled
+JIT_MASK_FUNCTIONS = {
+    function for name, function in MASK_METRICS.items() if name.startswith("mask_")
+}
+
+
+def _case(suite, function, backend, params, items, run, prepare):
+    # items is what throughput counts: box pairs, (N, M) matrix entries for
+    # pairwise functions, boxes for sparse IoU, pixels for mask metrics.
+    # backend "numba" marks cases that run the compiled kernels of jit_kernels
+    return {
+        "suite": suite,
+        "function": function,
+        "backend": backend,
+        "params": params,
+        "items": items,
+        "run": run,
+        "prepare": prepare,
+    }
+
+
+def random_boxes(count, rng):
+    """
+    (count, 4) ground truth boxes and jittered predictions; the canvas grows
+    with the count so the number of overlaps per box stays constant.
+    """
+    side = 100.0 * np.sqrt(count)
+    corners = rng.uniform(0, side, (count, 2))
+    sizes = rng.uniform(10, 50, (count, 2))
+    boxes = np.concatenate([corners, corners + sizes], axis=1)
+    return boxes, boxes + rng.uniform(-5, 5, boxes.shape)
+
+
+def random_mask_pair(size, density, rng):
+    """
+    A square object covering `density` of a (size, size) image and a
+    prediction shifted by a tenth of its side.
+    """
+    side = max(int(round(np.sqrt(density) * size)), 1)
+    shift = max(side // 10, 1)
+    row, col = rng.integers(0, size - side - shift + 1, 2)
+    true_mask = np.zeros((size, size), dtype=np.uint8)
+    pred_mask = np.zeros((size, size), dtype=np.uint8)
+    true_mask[row : row + side, col : col + side] = 1
+    pred_mask[row + shift : row + shift + side, col + shift : col + shift + side] = 1
+    return true_mask, pred_mask
+
+
+def _box_backend(pairs):
+    return "numba" if use_box_kernels(pairs) else "numpy"
+
+
+def box_cases(box_counts, rng):
+    for count in box_counts:
+        boxes1, boxes2 = random_boxes(count, rng)
+        params = {"boxes": count}
+
+        if count <= MAX_SCALAR_BOXES:
+            pairs = list(zip(boxes1.tolist(), boxes2.tolist()))
+            for function in SCALAR_BOX_FUNCTIONS:
+                yield _case(
+                    "box",
+                    function.__name__,
+                    "scalar",
+                    params,
+                    count,
+                    lambda pairs, function=function: [function(*p) for p in pairs],
+                    lambda pairs=pairs: (pairs,),
+                )
+
+        for variant in BOX_IOU_VARIANTS:
+            variant_params = dict(params, variant=variant)
+            prepare = lambda b1=boxes1, b2=boxes2: (b1, b2)
+            yield _case(
+                "box",
+                "calculate_paired_iou",
+                _box_backend(count),
+                variant_params,
+                count,
+                lambda b1, b2, v=variant: calculate_paired_iou(b1, b2, v),
+                prepare,
+            )
+            if count <= MAX_PAIRWISE_BOXES:
+                yield _case(
+                    "box",
+                    "calculate_pairwise_iou",
+                    _box_backend(count * count),
+                    variant_params,
+                    count * count,
+                    lambda b1, b2, v=variant: calculate_pairwise_iou(b1, b2, v),
+                    prepare,
+                )
+            yield _case(
+                "box",
+                "calculate_sparse_iou",
+                "sparse",
+                variant_params,
+                count,
+                lambda b1, b2, v=variant: calculate_sparse_iou(b1, b2, v),
+                prepare,
+            )
+
+        if count <= MAX_PAIRWISE_BOXES:
+            yield _case(
+                "box",
+                "calculate_all_ious",
+                _box_backend(count * count),
+                params,
+                count * count,
+                calculate_all_ious,
+                lambda b1=boxes1, b2=boxes2: (b1, b2),
+            )
+
+
+def _dense_prepare(true_mask, pred_mask):
+    def prepare():
+        # Time the full computation, not a get_mask_stats cache hit
+        clear_mask_stats_cache()
+        return true_mask, pred_mask
+
+    return prepare
+
+
+def _cropped_prepare(true_mask, pred_mask):
+    crops = CroppedMask.from_mask(true_mask), CroppedMask.from_mask(pred_mask)
+
+    def prepare():
+        # Fresh objects, so their cached stats are recomputed
+        return tuple(CroppedMask(c.shape, c.offset, c.tile) for c in crops)
+
+    return prepare
+
+
+def mask_cases(mask_sizes, densities, rng):
+    for size in mask_sizes:
+        for density in densities:
+            true_mask, pred_mask = random_mask_pair(size, density, rng)
+            params = {"size": size, "density": density}
+            pixels = size * size
+            prepares = {
+                "dense": _dense_prepare(true_mask, pred_mask),
+                "cropped": _cropped_prepare(true_mask, pred_mask),
+            }
+            dense_jit = use_mask_kernel(true_mask, pred_mask)
+            for function in MASK_METRICS.values():
+                for backend, prepare in prepares.items():
+                    if (
+                        backend == "dense"
+                        and dense_jit
+                        and function in JIT_MASK_FUNCTIONS
+                    ):
+                        backend = "numba"
+                    yield _case(
+                        "mask",
+                        function.__name__,
+                        backend,
+                        params,
+                        pixels,
+                        function,
+                        prepare,
+                    )
+            rles = RLEMask.from_mask(true_mask), RLEMask.from_mask(pred_mask)
+            for function in RLE_MASK_FUNCTIONS:
+                yield _case(
+                    "mask",
+                    function.__name__,
+                    "rle",
+                    params,
+                    pixels,
+                    function,
+                    lambda rles=rles: rles,
+                )
+
+            stacks = true_mask[None], pred_mask[None]
+            packed = pack_masks(stacks[0]), pack_masks(stacks[1])
+            yield _case(
+                "mask",
+                "pack_masks",
+                "numpy",
+                params,
+                pixels,
+                pack_masks,
+                lambda stack=stacks[0]: (stack,),
+            )
+            for backend, inputs in (("dense", stacks), ("packed", packed)):
+                yield _case(
+                    "mask",
+                    "calculate_pairwise_mask_iou",
+                    backend,
+                    params,
+                    pixels,
+                    calculate_pairwise_mask_iou,
+                    lambda inputs=inputs: inputs,
+                )
+
+
+def _confusion_matrix_metric(name):
+    def run(true_mask, pred_mask):
+        matrix = ConfusionMatrix().update(true_mask, pred_mask)
+        return getattr(matrix, name)()
+
+    return run
+
+
+def pixel_cases(mask_sizes, densities, rng):
+    """
+    The sklearn calls of sklearn_metrics_mask.py against ConfusionMatrix.
+    """
+    sklearn_metrics = {
+        "accuracy": accuracy_score,
+        "precision": lambda t, p: precision_score(t, p, zero_division=0),
+        "recall": lambda t, p: recall_score(t, p, zero_division=0),
+        "f1_score": lambda t, p: f1_score(t, p, zero_division=0),
+    }
+    for size in mask_sizes:
+        for density in densities:
+            true_mask, pred_mask = random_mask_pair(size, density, rng)
+            params = {"size": size, "density": density}
+            flat = true_mask.flatten(), pred_mask.flatten()
+            for name, function in sklearn_metrics.items():
+                yield _case(
+                    "pixel",
+                    name,
+                    "sklearn",
+                    params,
+                    size * size,
+                    function,
+                    lambda flat=flat: flat,
+                )
+                yield _case(
+                    "pixel",
+                    name,
+                    "confusion_matrix",
+                    params,
+                    size * size,
+                    _confusion_matrix_metric(name),
+                    lambda masks=(true_mask, pred_mask): masks,
+                )
+
+
+def measure(
+    run,
+    prepare,
+    items,
+    min_time=0.1,
+    min_repeats=3,
+    max_repeats=1000,
+    trace_memory=True,
+):
+    """
+    Time run(*prepare()) until min_time has elapsed (at least min_repeats
+    calls), after one warm-up call; prepare() is not timed. Peak memory is
+    the largest traced allocation during one extra call, traced separately
+    so tracemalloc overhead does not distort the latencies. With
+    trace_memory=False (compiled kernels, whose arrays tracemalloc does not
+    see) it is None.
+    """
+    run(*prepare())
+    latencies = []
+    while len(latencies) < max_repeats and (
+        len(latencies) < min_repeats or sum(latencies) < min_time
+    ):
+        args = prepare()
+        start = time.perf_counter()
+        run(*args)
+        latencies.append(time.perf_counter() - start)
+
+    peak = None
+    if trace_memory:
+        args = prepare()
+        tracemalloc.start()
+        try:
+            run(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1e3
+    p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99])
+    return {
+        "repeats": len(latencies),
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "min": float(latencies_ms.min()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+        },
+        "throughput": items / (p50 / 1e3) if p50 > 0 else float("inf"),
+        "peak_memory_bytes": None if peak is None else int(peak),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": importlib.metadata.version("numba") if NUMBA_AVAILABLE else None,
+        "jit": jit_enabled(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "git_revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def run_benchmarks(
+    suites=SUITES,
+    box_counts=BOX_COUNTS,
+    mask_sizes=MASK_SIZES,
+    densities=DENSITIES,
+    pattern=None,
+    seed=0,
+    min_time=0.1,
+    min_repeats=3,
+    verbose=False,
+):
+    """
+    Run every selected case and return a JSON-serializable report. Workloads
+    are generated from `seed`, so two runs time the same inputs. `pattern`
+    keeps only functions whose name contains it.
+    """
+    unknown = [suite for suite in suites if suite not in SUITES]
+    if unknown:
+        raise ValueError(f"Unknown suites {unknown}, expected any of {SUITES}.")
+    rng = np.random.default_rng(seed)
+    generators = {
+        "box": lambda: box_cases(box_counts, rng),
+        "mask": lambda: mask_cases(mask_sizes, densities, rng),
+        "pixel": lambda: pixel_cases(mask_sizes, densities, rng),
+    }
+
+    results = []
+    for suite in suites:
+        for case in generators[suite]():
+            if pattern is not None and pattern not in case["function"]:
+                continue
+            result = {
+                key: case[key]
+                for key in ("suite", "function", "backend", "params", "items")
+            }
+            result.update(
+                measure(
+                    case["run"],
+                    case["prepare"],
+                    case["items"],
+                    min_time=min_time,
+                    min_repeats=min_repeats,
+                    trace_memory=case["backend"] != "numba",
+                )
+            )
+            results.append(result)
+            if verbose:
+                print(format_result(result), flush=True)
+
+    return {
+        "schema_version": BENCHMARK_SCHEMA_VERSION,
+        "environment": environment(),
+        "config": {
+            "suites": list(suites),
+            "box_counts": list(box_counts),
+            "mask_sizes": list(mask_sizes),
+            "densities": list(densities),
+            "seed": seed,
+            "min_time": min_time,
+            "min_repeats": min_repeats,
+        },
+        "results": results,
+    }
+
+
+def result_key(result):
+    params = json.dumps(result["params"], sort_keys=True)
+    return result["suite"], result["function"], result["backend"], params
+
+
+def format_result(result):
+    params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+    latency = result["latency_ms"]
+    peak = result["peak_memory_bytes"]
+    peak = "     n/a" if peak is None else f"{peak / 2**20:8.2f}"
+    return (
+        f"{result['suite']:<6}{result['function']:<30}{result['backend']:<17}"
+        f"{params:<32}p50 {latency['p50']:10.3f} ms  p99 {latency['p99']:10.3f} ms  "
+        f"{result['throughput']:10.3g} items/s  "
+        f"peak {peak} MiB"
+    )
+
+
+def check_comparable(baseline, jit):
+    """
+    Raise a ValueError unless `baseline` was timed with the compiled kernels
+    in the same state, `jit`. Reports without the flag predate the kernels.
+    """
+    baseline_jit = baseline["environment"].get("jit", False)
+    if baseline_jit != jit:
+        raise ValueError(
+            f"The baseline was run with jit={baseline_jit} and the current run "
+            f"with jit={jit}; rerun one of them with the same setting "
+            "(--no-jit) to compare."
+        )
+
+
+def compare_results(baseline, current, statistic="p50", tolerance=0.2):
+    """
+    Match the cases of two reports and return their latency ratios
+    (current / baseline), slowest first. A ratio above 1 + tolerance is
+    flagged as a regression; cases present in only one report are skipped.
+    Reports timed with and without the compiled kernels are not comparable
+    and raise a ValueError.
+    """
+    check_comparable(baseline, current["environment"].get("jit", False))
+    baseline_results = {result_key(r): r for r in baseline["results"]}
+    comparisons = []
+    for result in current["results"]:
+        previous = baseline_results.get(result_key(result))
+        if previous is None:
+            continue
+        before = previous["latency_ms"][statistic]
+        after = result["latency_ms"][statistic]
+        ratio = after / before if before > 0 else float("inf")
+        comparisons.append(
+            {
+                "suite": result["suite"],
+                "function": result["function"],
+                "backend": result["backend"],
+                "params": result["params"],
+                "baseline_ms": before,
+                "current_ms": after,
+                "ratio": ratio,
+                "regression": ratio > 1 + tolerance,
+            }
+        )
+    comparisons.sort(key=lambda c: c["ratio"], reverse=True)
+    return comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the IoU and mask metrics over parameterized workloads."
+    )
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--filter", help="Only functions whose name contains this.")
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Small workloads only (boxes <= 1000, masks <= 256^2, density 0.1).",
+    )
+    parser.add_argument("--box-counts", type=int, nargs="+")
+    parser.add_argument("--mask-sizes", type=int, nargs="+")
+    parser.add_argument("--densities", type=float, nargs="+")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.1)
+    parser.add_argument("--min-repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON report to this path.")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--no-jit",
+        action="store_true",
+        help="Time the NumPy code paths even when Numba is installed.",
+    )
+    args = parser.parse_args(argv)
+    if args.no_jit:
+        set_jit(False)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        # Fail before timing anything rather than after the whole run
+        try:
+            check_comparable(baseline, jit_enabled())
+        except ValueError as error:
+            parser.error(str(error))
+
+    box_counts = args.box_counts or ((10, 100, 1_000) if args.quick else BOX_COUNTS)
+    mask_sizes = args.mask_sizes or ((64, 256) if args.quick else MASK_SIZES)
+    densities = args.densities or ((0.1,) if args.quick else DENSITIES)
+
+    report = run_benchmarks(
+        suites=args.suite,
+        box_counts=box_counts,
+        mask_sizes=mask_sizes,
+        densities=densities,
+        pattern=args.filter,
+        seed=args.seed,
+        min_time=args.min_time,
+        min_repeats=args.min_repeats,
+        verbose=True,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}")
+
+    if baseline is not None:
+        comparisons = compare_results(baseline, report, tolerance=args.tolerance)
+        regressions = [c for c in comparisons if c["regression"]]
+        print(
+            f"Compared {len(comparisons)} cases, {len(regressions)} slower than "
+            f"{1 + args.tolerance:.2f}x the baseline:"
+        )
+        for c in regressions:
+            params = ", ".join(f"{k}={v}" for k, v in c["params"].items())
+            print(
+                f"  {c['function']} [{c['backend']}] ({params}): "
+                f"{c['baseline_ms']:.3f} -> {c['current_ms']:.3f} ms "
+                f"({c['ratio']:.2f}x)"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import numpy as np
+
+from mask_stats import as_binary_mask
+
+
+class BinnedCurves:
+    """
+    Precision-recall and ROC curves of pixel scores from fixed-bin histograms.
+
+    update() adds each pixel's score to one of num_bins equal-width bins over
+    score_range, in a positive or a negative histogram depending on the
+    ground truth. Memory stays at 2 * num_bins counts however many pixels
+    are seen, histograms from batches or workers merge by addition, and no
+    score is ever sorted or stored. Bin k's lower edge is threshold k; scores
+    equal to an edge count as reaching it, and scores outside the range fall
+    into the first / last bin.
+    """
+
+    def __init__(self, num_bins=1000, score_range=(0.0, 1.0)):
+        if num_bins < 1:
+            raise ValueError(f"num_bins must be at least 1, got {num_bins}.")
+        low, high = score_range
+        if not high > low:
+            raise ValueError(f"Empty score_range {score_range}.")
+        self.num_bins = num_bins
+        self.score_range = (float(low), float(high))
+        self.positive_hist = np.zeros(num_bins, dtype=np.int64)
+        self.negative_hist = np.zeros(num_bins, dtype=np.int64)
+
+    @property
+    def thresholds(self):
+        low, high = self.score_range
+        return low + (high - low) * np.arange(self.num_bins) / self.num_bins
+
+    def update(self, true_mask, scores):
+        """
+        Add one score map (or a batch of them, any matching shape). NaN
+        scores raise a ValueError.
+        """
+        true_mask = as_binary_mask(true_mask)
+        scores = np.asarray(scores)
+        assert (
+            true_mask.shape == scores.shape
+        ), "Shape mismatch between true mask and score map."
+        scores = scores.reshape(-1)
+        if scores.size and np.isnan(scores.min()):
+            raise ValueError("Scores contain NaN, which no bin can hold.")
+        low, high = self.score_range
+        bins = np.clip(
+            (scores - low) * (self.num_bins / (high - low)), 0, self.num_bins - 1
+        ).astype(np.intp)
+        # The scaled score can round to either side of an edge; move each
+        # score to the last bin whose lower edge it reaches, as
+        # np.searchsorted(thresholds, scores, side="right") - 1 would
+        lower = self.thresholds
+        # Nothing is below the first bin or above the last one (NaN compares
+        # false, even against inf)
+        upper = np.append(lower[1:], np.nan)
+        lower[0] = -np.inf
+        bins += (scores >= upper[bins]).view(np.int8)
+        bins -= (scores < lower[bins]).view(np.int8)
+        # Pack (bin, label) into one index so a single bincount fills both
+        counts = np.bincount(
+            bins * 2 + true_mask.reshape(-1), minlength=2 * self.num_bins
+        ).reshape(self.num_bins, 2)
+        self.positive_hist += counts[:, 1]
+        self.negative_hist += counts[:, 0]
+        return self
+
+    def merge(self, other):
+        if (self.num_bins, self.score_range) != (other.num_bins, other.score_range):
+            raise ValueError("Cannot merge curves with different bins.")
+        self.positive_hist += other.positive_hist
+        self.negative_hist += other.negative_hist
+        return self
+
+    def reset(self):
+        self.positive_hist[:] = 0
+        self.negative_hist[:] = 0
+
+    def _cumulative(self):
+        """
+        TP / FP counts and thresholds at every non-empty bin, in decreasing
+        threshold order (the distinct operating points).
+        """
+        tps = np.cumsum(self.positive_hist[::-1])
+        fps = np.cumsum(self.negative_hist[::-1])
+        thresholds = self.thresholds[::-1]
+        occupied = (self.positive_hist + self.negative_hist)[::-1] > 0
+        return tps[occupied], fps[occupied], thresholds[occupied]
+
+    def pr_curve(self):
+        """
+        (precision, recall, thresholds), ordered by decreasing threshold.
+        """
+        tps, fps, thresholds = self._cumulative()
+        precision = np.zeros(len(tps))
+        recall = np.zeros(len(tps))
+        np.divide(tps, tps + fps, out=precision, where=(tps + fps) != 0)
+        if tps.size and tps[-1]:
+            recall = tps / tps[-1]
+        return precision, recall, thresholds
+
+    def roc_curve(self):
+        """
+        (fpr, tpr, thresholds), starting from the (0, 0) point at threshold inf.
+        """
+        tps, fps, thresholds = self._cumulative()
+        tps = np.concatenate([[0], tps])
+        fps = np.concatenate([[0], fps])
+        thresholds = np.concatenate([[np.inf], thresholds])
+        tpr = tps / tps[-1] if tps[-1] else np.zeros(len(tps))
+        fpr = fps / fps[-1] if fps[-1] else np.zeros(len(fps))
+        return fpr, tpr, thresholds
+
+    def average_precision(self):
+        """
+        Step-wise AP, sum over thresholds of (R_k - R_k-1) * P_k, as sklearn's
+        average_precision_score.
+        """
+        precision, recall, _ = self.pr_curve()
+        return float(np.sum(np.diff(recall, prepend=0.0) * precision))
+
+    def roc_auc(self):
+        fpr, tpr, _ = self.roc_curve()
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    def best_f1(self):
+        """
+        (F1, threshold) of the bin edge with the highest F1 score.
+        """
+        tps, fps, thresholds = self._cumulative()
+        positives = self.positive_hist.sum()
+        if tps.size == 0 or positives == 0:
+            return 0.0, float(self.score_range[0])
+        f1 = 2 * tps / (tps + fps + positives)
+        best = int(np.argmax(f1))
+        return float(f1[best]), float(thresholds[best])
+
+    def compute(self):
+        best_f1, best_threshold = self.best_f1()
+        return {
+            "average_precision": self.average_precision(),
+            "roc_auc": self.roc_auc(),
+            "best_f1": best_f1,
+            "best_threshold": best_threshold,
+        }
+
+
+if __name__ == "__main__":
+    # Test cases: score maps streamed in batches and merged
+    def generate_batch(seed, size=256):
+        rng = np.random.default_rng(seed)
+        true_mask = np.zeros((size, size), dtype=np.uint8)
+        true_mask[size // 4 : size // 2, size // 4 : 3 * size // 4] = 1
+        noise = rng.normal(0, 0.25, true_mask.shape)
+        scores = np.clip(0.3 + 0.4 * true_mask + noise, 0, 1)
+        return true_mask, scores
+
+    test_cases = [
+        ("分批累積 (Batched)", [0, 1, 2, 3]),
+        ("單一影像 (Single Image)", [4]),
+    ]
+
+    for description, seeds in test_cases:
+        curves = BinnedCurves(num_bins=1000)
+        for seed in seeds:
+            worker = BinnedCurves(num_bins=1000).update(*generate_batch(seed))
+            curves.merge(worker)
+        result = curves.compute()
+        print(f"{description}:")
+        print(f"  Pixels: {curves.positive_hist.sum() + curves.negative_hist.sum()}")
+        print(f"  Average Precision: {result['average_precision']:.4f}")
+        print(f"  ROC AUC: {result['roc_auc']:.4f}")
+        print(
+            f"  Best F1: {result['best_f1']:.4f} at threshold "
+            f"{result['best_threshold']:.3f}"
+        )
+        print()
@@ -0,0 +1,209 @@
+import numpy as np
+
+from profiling import instrument
+
+AVERAGES = ("binary", "micro", "macro", None)
+
+
+def resolve_average(average, num_classes):
+    """
+    Validate `average` for a num_classes confusion matrix, so callers can
+    fail before counting anything. "auto" means "binary" for two classes
+    and "macro" otherwise.
+    """
+    if average == "auto":
+        return "binary" if num_classes == 2 else "macro"
+    if average not in AVERAGES:
+        raise ValueError(f"Unknown average {average!r}, expected one of {AVERAGES}.")
+    if average == "binary" and num_classes != 2:
+        raise ValueError(
+            "average='binary' needs num_classes == 2, use 'micro' or 'macro'."
+        )
+    return average
+
+
+class ConfusionMatrix:
+    """
+    Streaming pixel confusion matrix for binary or multi-class label maps.
+
+    Rows are true labels, columns predicted labels. Feed masks one image (or
+    batch) at a time with update(); every metric is derived from the counts,
+    so a whole dataset costs one np.bincount per image.
+    """
+
+    def __init__(self, num_classes=2, ignore_index=None):
+        if num_classes < 2:
+            raise ValueError(f"num_classes must be at least 2, got {num_classes}.")
+        self.num_classes = num_classes
+        self.ignore_index = ignore_index
+        self.matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+
+    @instrument(name="ConfusionMatrix.update")
+    def update(self, true_mask, pred_mask):
+        """
+        Accumulate one label map pair (or a batch of them, any matching shape).
+        """
+        true_mask = np.asarray(true_mask)
+        pred_mask = np.asarray(pred_mask)
+        assert (
+            true_mask.shape == pred_mask.shape
+        ), "Shape mismatch between true mask and predicted mask."
+        true_flat = true_mask.reshape(-1)
+        pred_flat = pred_mask.reshape(-1)
+
+        if self.ignore_index is not None:
+            keep = true_flat != self.ignore_index
+            true_flat = true_flat[keep]
+            pred_flat = pred_flat[keep]
+        if true_flat.size == 0:
+            return self
+
+        for name, labels in (("true", true_flat), ("predicted", pred_flat)):
+            if labels.min() < 0 or labels.max() >= self.num_classes:
+                raise ValueError(
+                    f"{name} labels must be in [0, {self.num_classes}), got "
+                    f"[{labels.min()}, {labels.max()}]."
+                )
+
+        # Pack (true, pred) into one index so a single bincount fills the matrix
+        packed = true_flat.astype(np.int64) * self.num_classes + pred_flat
+        self.matrix += np.bincount(packed, minlength=self.num_classes**2).reshape(
+            self.num_classes, self.num_classes
+        )
+        return self
+
+    def merge(self, other):
+        if other.num_classes != self.num_classes:
+            raise ValueError("Cannot merge confusion matrices with different classes.")
+        self.matrix += other.matrix
+        return self
+
+    def reset(self):
+        self.matrix[:] = 0
+
+    @property
+    def tp(self):
+        return np.diag(self.matrix)
+
+    @property
+    def fp(self):
+        return self.matrix.sum(axis=0) - self.tp
+
+    @property
+    def fn(self):
+        return self.matrix.sum(axis=1) - self.tp
+
+    @property
+    def tn(self):
+        return self.matrix.sum() - self.tp - self.fp - self.fn
+
+    def accuracy(self):
+        """
+        Fraction of correctly labelled pixels, equal to pixel_accuracy.
+        """
+        total = self.matrix.sum()
+        return self.tp.sum() / total if total != 0 else 0.0
+
+    def precision(self, average="binary"):
+        return self._average(self.tp, self.tp + self.fp, average)
+
+    def recall(self, average="binary"):
+        return self._average(self.tp, self.tp + self.fn, average)
+
+    def f1_score(self, average="binary"):
+        return self._average(2 * self.tp, 2 * self.tp + self.fp + self.fn, average)
+
+    def dice(self, average="binary"):
+        """
+        Dice coefficient, equal to dice_coefficient for binary masks (and to F1).
+        """
+        return self.f1_score(average)
+
+    def iou(self, average="binary"):
+        return self._average(self.tp, self.tp + self.fp + self.fn, average)
+
+    def compute(self, average="binary"):
+        return {
+            "accuracy": self.accuracy(),
+            "precision": self.precision(average),
+            "recall": self.recall(average),
+            "f1": self.f1_score(average),
+            "iou": self.iou(average),
+            "dice": self.dice(average),
+        }
+
+    def _average(self, numerator, denominator, average):
+        """
+        Ratio per class with 0 for an empty denominator (sklearn's
+        zero_division=0), reduced according to `average`:
+          "binary" - class 1 only (requires num_classes == 2)
+          "auto"   - "binary" for two classes, "macro" otherwise
+          "micro"  - ratio of the summed counts
+          "macro"  - unweighted mean over classes present in true or predicted labels
+          None     - per-class array
+        """
+        average = resolve_average(average, self.num_classes)
+        if average == "micro":
+            numerator = numerator.sum()
+            denominator = denominator.sum()
+            return numerator / denominator if denominator != 0 else 0.0
+
+        per_class = np.zeros(self.num_classes, dtype=np.float64)
+        np.divide(numerator, denominator, out=per_class, where=denominator != 0)
+        if average is None:
+            return per_class
+        if average == "binary":
+            return per_class[1]
+
+        present = (self.matrix.sum(axis=0) + self.matrix.sum(axis=1)) > 0
+        return per_class[present].mean() if present.any() else 0.0
+
+
+if __name__ == "__main__":
+    # Test cases
+    test_cases = [
+        (
+            "完全重疊 (Complete Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+        ),
+        (
+            "部分重疊 (Partial Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+        (
+            "不重疊 (No Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 0, 1], [0, 0, 1], [1, 1, 0]]),
+        ),
+        (
+            "一個遮罩全為零 (One Mask All Zero)",
+            np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]]),
+            np.array([[1, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+        (
+            "多類別 (Multi-class)",
+            np.array([[2, 2, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[2, 1, 0], [1, 1, 0], [0, 2, 0]]),
+        ),
+    ]
+
+    dataset = ConfusionMatrix(num_classes=3)
+    for description, true_mask, pred_mask in test_cases:
+        dataset.update(true_mask, pred_mask)
+        if true_mask.max() > 1 or pred_mask.max() > 1:
+            image = ConfusionMatrix(num_classes=3).update(true_mask, pred_mask)
+            metrics = image.compute(average="macro")
+        else:
+            image = ConfusionMatrix(num_classes=2).update(true_mask, pred_mask)
+            metrics = image.compute()
+
+        print(f"{description}:")
+        for name, value in metrics.items():
+            print(f"  {name}: {value:.2f}")
+        print()
+
+    print("Dataset (per-class IoU):", np.round(dataset.iou(average=None), 4))
+    print("Dataset (macro F1):", round(dataset.f1_score(average="macro"), 4))
+    print("Dataset (micro F1):", round(dataset.f1_score(average="micro"), 4))
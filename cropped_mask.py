@@ -0,0 +1,202 @@
+import numpy as np
+
+from mask_stats import MaskStats, as_binary_mask, get_mask_stats
+from profiling import instrument
+
+
+class CroppedMask:
+    """
+    Binary mask stored as its bounding-box tile plus the tile's (row, col)
+    offset in the full image of the given shape. Metrics on cropped masks
+    only touch the overlap of the two tiles, so their cost scales with the
+    object size instead of the image resolution.
+    """
+
+    __slots__ = ("shape", "offset", "tile", "_stats")
+
+    def __init__(self, shape, offset, tile):
+        self.shape = tuple(int(s) for s in shape)
+        self.offset = tuple(int(o) for o in offset)
+        self.tile = as_binary_mask(tile)
+        if self.tile.ndim != 2:
+            raise ValueError(f"Expected a 2D tile, got shape {self.tile.shape}.")
+        if (
+            min(self.offset) < 0
+            or self.offset[0] + self.tile.shape[0] > self.shape[0]
+            or self.offset[1] + self.tile.shape[1] > self.shape[1]
+        ):
+            raise ValueError(
+                f"Tile of shape {self.tile.shape} at {self.offset} does not fit "
+                f"in an image of shape {self.shape}."
+            )
+        self._stats = None
+
+    @classmethod
+    def from_mask(cls, mask, threshold=None):
+        """
+        Crop a dense (H, W) mask to the bounding box of its foreground.
+        """
+        mask = np.asarray(mask)
+        if mask.ndim != 2:
+            raise ValueError(f"Expected a 2D mask, got shape {mask.shape}.")
+        extent = get_mask_stats(mask, threshold).extent
+        if extent is None:
+            return cls(mask.shape, (0, 0), np.zeros((0, 0), dtype=bool))
+        row_min, row_max, col_min, col_max = extent
+        # Copy, so the crop does not keep the full image alive
+        tile = as_binary_mask(
+            mask[row_min : row_max + 1, col_min : col_max + 1], threshold
+        ).copy()
+        return cls(mask.shape, (row_min, col_min), tile)
+
+    def stats(self):
+        """
+        MaskStats in full-image coordinates, computed from the tile only.
+        """
+        if self._stats is None:
+            self._stats = MaskStats(self.tile, offset=self.offset, shape=self.shape)
+        return self._stats
+
+    def area(self):
+        return self.stats().area
+
+    def extent(self):
+        return self.stats().extent
+
+    def decode(self):
+        mask = np.zeros(self.shape, dtype=bool)
+        row, col = self.offset
+        mask[row : row + self.tile.shape[0], col : col + self.tile.shape[1]] = self.tile
+        return mask
+
+    def window(self, row_min, row_max, col_min, col_max):
+        """
+        The mask inside the inclusive full-image window, zero outside the tile.
+        """
+        window = np.zeros((row_max - row_min + 1, col_max - col_min + 1), dtype=bool)
+        row, col = self.offset
+        top, left = max(row, row_min), max(col, col_min)
+        bottom = min(row + self.tile.shape[0] - 1, row_max)
+        right = min(col + self.tile.shape[1] - 1, col_max)
+        if top <= bottom and left <= right:
+            window[
+                top - row_min : bottom - row_min + 1,
+                left - col_min : right - col_min + 1,
+            ] = self.tile[top - row : bottom - row + 1, left - col : right - col + 1]
+        return window
+
+    def __repr__(self):
+        return (
+            f"CroppedMask(shape={self.shape}, offset={self.offset}, "
+            f"tile={self.tile.shape})"
+        )
+
+
+def as_cropped(mask, threshold=None):
+    if isinstance(mask, CroppedMask):
+        return mask
+    return CroppedMask.from_mask(mask, threshold)
+
+
+@instrument(name="intersection", category="stage")
+def cropped_intersection(crop1, crop2):
+    """
+    Pixels in the foreground of both masks, counted on the overlap of their
+    bounding boxes only; zero without touching pixels when the boxes are disjoint.
+    """
+    if crop1.shape != crop2.shape:
+        raise ValueError(
+            f"Shape mismatch between cropped masks: {crop1.shape} vs {crop2.shape}."
+        )
+    extent1 = crop1.extent()
+    extent2 = crop2.extent()
+    if extent1 is None or extent2 is None:
+        return 0
+    row_min, col_min = max(extent1[0], extent2[0]), max(extent1[2], extent2[2])
+    row_max, col_max = min(extent1[1], extent2[1]), min(extent1[3], extent2[3])
+    if row_min > row_max or col_min > col_max:
+        return 0
+    return np.count_nonzero(
+        crop1.window(row_min, row_max, col_min, col_max)
+        & crop2.window(row_min, row_max, col_min, col_max)
+    )
+
+
+def cropped_union_window(crop1, crop2):
+    """
+    Both masks inside the bounding box of their union, or None when either
+    mask is empty. Distances between the masks' pixels are unchanged inside
+    this window, so surface metrics can run on it instead of the full image.
+    """
+    extent1 = crop1.extent()
+    extent2 = crop2.extent()
+    if extent1 is None or extent2 is None:
+        return None
+    window = (
+        min(extent1[0], extent2[0]),
+        max(extent1[1], extent2[1]),
+        min(extent1[2], extent2[2]),
+        max(extent1[3], extent2[3]),
+    )
+    return crop1.window(*window), crop2.window(*window)
+
+
+if __name__ == "__main__":
+    import time
+
+    from all_iou_mask import calculate_mask_giou, calculate_mask_iou
+    from mask_metrics import dice_coefficient
+
+    # The metrics dispatch on the importable class, not this script's copy
+    from cropped_mask import CroppedMask
+
+    # Test cases: small objects in a 4K frame
+    frame_shape = (2160, 3840)
+
+    def object_mask(row, col, height, width):
+        mask = np.zeros(frame_shape, dtype=np.uint8)
+        mask[row : row + height, col : col + width] = 1
+        return mask
+
+    test_cases = [
+        (
+            "部分重疊 (Partial Overlap)",
+            object_mask(1000, 2000, 40, 60),
+            object_mask(1010, 2010, 40, 60),
+        ),
+        (
+            "不重疊 (No Overlap)",
+            object_mask(100, 100, 40, 60),
+            object_mask(1500, 3000, 40, 60),
+        ),
+        (
+            "小遮罩在大遮罩內 (Small Mask Inside Large Mask)",
+            object_mask(500, 500, 10, 10),
+            object_mask(480, 480, 60, 60),
+        ),
+    ]
+
+    for description, true_mask, pred_mask in test_cases:
+        true_crop = CroppedMask.from_mask(true_mask)
+        pred_crop = CroppedMask.from_mask(pred_mask)
+
+        start = time.perf_counter()
+        dense = [
+            metric(true_mask, pred_mask)
+            for metric in (calculate_mask_iou, calculate_mask_giou, dice_coefficient)
+        ]
+        dense_time = time.perf_counter() - start
+        start = time.perf_counter()
+        cropped = [
+            metric(true_crop, pred_crop)
+            for metric in (calculate_mask_iou, calculate_mask_giou, dice_coefficient)
+        ]
+        cropped_time = time.perf_counter() - start
+
+        print(f"{description}:")
+        print(f"  Tiles: {true_crop.tile.shape} at {true_crop.offset}")
+        print("  Mask IoU / GIoU / Dice:", [round(float(v), 4) for v in cropped])
+        print("  Same as full frame:", dense == cropped)
+        print(f"  Full frame: {dense_time * 1e3:.2f} ms")
+        print(f"  Cropped: {cropped_time * 1e3:.3f} ms")
+        print()
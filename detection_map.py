@@ -0,0 +1,425 @@
+import numpy as np
+
+from all_iou_bbx import BOX_IOU_VARIANTS, calculate_pairwise_iou
+
+# COCO evaluation parameters
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+AREA_RANGES = {
+    "all": (0, 1e5**2),
+    "small": (0, 32**2),
+    "medium": (32**2, 96**2),
+    "large": (96**2, 1e5**2),
+}
+MAX_DETECTIONS = (1, 10, 100)
+
+
+def _box_areas(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def _flatten(per_image, width=None, dtype=None):
+    """
+    Concatenate per-image arrays into one, with the image index of every row.
+    """
+    shape = (-1,) if width is None else (-1, width)
+    arrays = [np.asarray(values, dtype=dtype).reshape(shape) for values in per_image]
+    image = np.repeat(np.arange(len(arrays)), [len(values) for values in arrays])
+    if not arrays:
+        return image, np.zeros((0,) + shape[1:], dtype=dtype or np.float64)
+    return image, np.concatenate(arrays)
+
+
+def _group_slices(sorted_keys, groups):
+    start = np.searchsorted(sorted_keys, groups, side="left")
+    return start, np.searchsorted(sorted_keys, groups, side="right") - start
+
+
+def _crowd_overlap(dt_box, gt_box):
+    """
+    COCO's iscrowd overlap of (..., D, 4) detections with (..., G, 4) crowd
+    regions: intersection over the detection's own area, so a detection lying
+    inside a large crowd region overlaps it fully. Zero-area detections
+    overlap nothing.
+    """
+    dt_box = dt_box[..., :, None, :]
+    gt_box = gt_box[..., None, :, :]
+    inter_w = np.minimum(dt_box[..., 2], gt_box[..., 2]) - np.maximum(
+        dt_box[..., 0], gt_box[..., 0]
+    )
+    inter_h = np.minimum(dt_box[..., 3], gt_box[..., 3]) - np.maximum(
+        dt_box[..., 1], gt_box[..., 1]
+    )
+    inter_area = np.maximum(inter_w, 0) * np.maximum(inter_h, 0)
+    dt_area = (dt_box[..., 2] - dt_box[..., 0]) * (dt_box[..., 3] - dt_box[..., 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(dt_area > 0, inter_area / dt_area, 0.0)
+
+
+def _greedy_match(
+    dt_box,
+    gt_box,
+    gt_ignore,
+    gt_crowd,
+    dt_slices,
+    gt_slices,
+    thresholds,
+    iou_type,
+    block_size=1 << 22,
+):
+    """
+    COCO greedy matching of score-sorted detections against ground truths for
+    every (image, category) group, area range and IoU threshold at once.
+
+    Groups are given as (start, count) slices into the group-sorted detection
+    and ground truth arrays; gt_ignore is (A, G). Groups are padded into blocks
+    and matched with one vectorized step per detection rank over (block,
+    area x threshold, ground truth). Returns (matched, matched_ignored), both
+    (A, T, D) booleans.
+    """
+    num_areas = len(gt_ignore)
+    num_thresholds = len(thresholds)
+    lanes = num_areas * num_thresholds
+    lane_thresholds = np.tile(np.minimum(thresholds, 1 - 1e-10), num_areas)
+    lane_thresholds = lane_thresholds[None, :, None]
+    matched = np.zeros((lanes, len(dt_box)), dtype=bool)
+    matched_ignored = np.zeros_like(matched)
+
+    dt_start, dt_count = dt_slices
+    gt_start, gt_count = gt_slices
+    # Similar-sized groups share a block to keep padding small
+    order = np.lexsort((gt_count, dt_count)).tolist()
+    dt_count_list = dt_count.tolist()
+    gt_count_list = gt_count.tolist()
+    start = 0
+    while start < len(order):
+        max_dets = dt_count_list[order[start]]
+        max_gts = gt_count_list[order[start]]
+        stop = start + 1
+        while stop < len(order):
+            dets = max(max_dets, dt_count_list[order[stop]])
+            gts = max(max_gts, gt_count_list[order[stop]])
+            if (stop - start + 1) * dets * gts * lanes > block_size:
+                break
+            max_dets, max_gts = dets, gts
+            stop += 1
+        block = np.array(order[start:stop])
+        start = stop
+
+        dt_valid = np.arange(max_dets) < dt_count[block, None]
+        gt_valid = np.arange(max_gts) < gt_count[block, None]
+        dt_index = np.where(dt_valid, dt_start[block, None] + np.arange(max_dets), 0)
+        gt_index = np.where(gt_valid, gt_start[block, None] + np.arange(max_gts), 0)
+
+        block_dt, block_gt = dt_box[dt_index], gt_box[gt_index]
+        ious = calculate_pairwise_iou(block_dt, block_gt, iou_type)
+        # Crowd ground truths can absorb any number of detections, and are
+        # matched on their iscrowd overlap rather than on the IoU variant
+        reusable = gt_crowd[gt_index] & gt_valid
+        if reusable.any():
+            ious = np.where(
+                reusable[:, None, :], _crowd_overlap(block_dt, block_gt), ious
+            )
+        # Padding detections / ground truths get -inf IoU and never match
+        ious[~(dt_valid[:, :, None] & gt_valid[:, None, :])] = -np.inf
+        block_ignore = np.repeat(
+            gt_ignore[:, gt_index].transpose(1, 0, 2), num_thresholds, axis=1
+        )
+
+        block_matched = np.zeros((len(block), lanes, max_dets), dtype=bool)
+        block_matched_ignored = np.zeros_like(block_matched)
+        available = np.ones((len(block), lanes, max_gts), dtype=bool)
+        for d in range(max_dets):
+            row = ious[:, None, d, :]
+            candidates = (row >= lane_thresholds) & available
+            hit = candidates.any(axis=2)
+            if not hit.any():
+                continue
+
+            # A non-ignored match always wins over an ignored one; among equal
+            # IoUs the last ground truth wins, as in the COCO reference loop
+            preferred = candidates & ~block_ignore
+            use_preferred = preferred.any(axis=2, keepdims=True)
+            candidates = np.where(use_preferred, preferred, candidates)
+            scores = np.where(candidates, row, -np.inf)
+            best = max_gts - 1 - np.argmax(scores[:, :, ::-1], axis=2)
+
+            b_index, l_index = np.nonzero(hit)
+            g_index = best[b_index, l_index]
+            available[b_index, l_index, g_index] = reusable[b_index, g_index]
+            block_matched[b_index, l_index, d] = True
+            block_matched_ignored[b_index, l_index, d] = block_ignore[
+                b_index, l_index, g_index
+            ]
+
+        targets = dt_index[dt_valid]
+        matched[:, targets] = block_matched.transpose(1, 0, 2)[:, dt_valid]
+        matched_ignored[:, targets] = block_matched_ignored.transpose(1, 0, 2)[
+            :, dt_valid
+        ]
+
+    shape = (num_areas, num_thresholds, len(dt_box))
+    return matched.reshape(shape), matched_ignored.reshape(shape)
+
+
+def _accumulate(scores, rank, matched, ignored, num_gts, max_detections):
+    """
+    Precision at RECALL_THRESHOLDS (..., R, M) and recall (..., M) for the
+    detections of one category, ordered by image and then by descending score.
+    matched / ignored are (..., D) over any leading (area, threshold) axes and
+    num_gts broadcasts against those axes; -1 where there is no ground truth.
+    """
+    lead_shape = matched.shape[:-1]
+    num_recalls = len(RECALL_THRESHOLDS)
+    precision = -np.ones(lead_shape + (num_recalls, len(max_detections)))
+    recall = -np.ones(lead_shape + (len(max_detections),))
+    num_gts = np.broadcast_to(num_gts, lead_shape).reshape(-1)
+    matched = matched.reshape(-1, matched.shape[-1])
+    ignored = ignored.reshape(-1, ignored.shape[-1])
+    has_gts = num_gts > 0
+    rows = np.flatnonzero(has_gts)
+
+    for m, max_det in enumerate(max_detections):
+        keep = np.flatnonzero(rank < max_det)
+        keep = keep[np.argsort(-scores[keep], kind="mergesort")]
+        det_matched = matched[rows][:, keep]
+        det_ignored = ignored[rows][:, keep]
+
+        tp = np.cumsum(det_matched & ~det_ignored, axis=1, dtype=np.float64)
+        fp = np.cumsum(~det_matched & ~det_ignored, axis=1, dtype=np.float64)
+        num_dets = len(keep)
+        rc = tp / num_gts[rows, None]
+        pr = tp / (fp + tp + np.spacing(1))
+
+        # Precision envelope, then sample it at the recall thresholds
+        pr = np.maximum.accumulate(pr[:, ::-1], axis=1)[:, ::-1]
+        inds = np.stack(
+            [np.searchsorted(row, RECALL_THRESHOLDS, side="left") for row in rc]
+        ).reshape(len(rows), num_recalls)
+        valid = inds < num_dets
+        q = np.zeros((len(rows), num_recalls))
+        q[valid] = pr[np.nonzero(valid)[0], inds[valid]]
+
+        row_recall = rc[:, -1] if num_dets else np.zeros(len(rows))
+        recall.reshape(-1, len(max_detections))[rows, m] = row_recall
+        precision.reshape(-1, num_recalls, len(max_detections))[rows, :, m] = q
+
+    return precision, recall
+
+
+def _mean_valid(values):
+    values = values[values > -1]
+    return float(values.mean()) if values.size else -1.0
+
+
+def evaluate_detections(
+    gt_boxes,
+    gt_labels,
+    dt_boxes,
+    dt_scores,
+    dt_labels,
+    gt_crowd=None,
+    iou_type="iou",
+    iou_thresholds=IOU_THRESHOLDS,
+    area_ranges=AREA_RANGES,
+    max_detections=MAX_DETECTIONS,
+):
+    """
+    COCO-style mean Average Precision for [x1, y1, x2, y2] boxes.
+
+    Every argument is a list with one entry per image: (G, 4) / (G,) ground
+    truth boxes and labels, (D, 4) / (D,) / (D,) detections, scores and labels,
+    and optionally (G,) crowd flags (ignored ground truths that may absorb any
+    number of detections). iou_type selects the matching criterion from
+    BOX_IOU_VARIANTS, e.g. "giou", "diou" or "ciou". As in pycocotools, crowd
+    regions are matched on intersection over the detection's area whatever
+    the criterion. Areas are box areas.
+
+    Returns the COCO summary metrics plus the full "precision"
+    (T, R, K, A, M) and "recall" (T, K, A, M) arrays and per-class AP.
+    """
+    if iou_type not in BOX_IOU_VARIANTS:
+        raise ValueError(
+            f"Unknown IoU variant {iou_type!r}, expected one of {BOX_IOU_VARIANTS}."
+        )
+    if (
+        not len(gt_boxes)
+        == len(gt_labels)
+        == len(dt_boxes)
+        == len(dt_scores)
+        == len(dt_labels)
+    ):
+        raise ValueError("All inputs must have one entry per image.")
+    iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+    max_detections = tuple(sorted(max_detections))
+    area_names = list(area_ranges)
+
+    # All images are flattened into one array per field
+    gt_image, gt_box = _flatten(gt_boxes, 4, np.float64)
+    _, gt_label = _flatten(gt_labels)
+    dt_image, dt_box = _flatten(dt_boxes, 4, np.float64)
+    _, dt_score = _flatten(dt_scores, dtype=np.float64)
+    _, dt_label = _flatten(dt_labels)
+    gt_crowd = (
+        np.zeros(len(gt_box), dtype=bool)
+        if gt_crowd is None
+        else _flatten(gt_crowd, dtype=bool)[1]
+    )
+    if not len(gt_box) == len(gt_label) == len(gt_crowd):
+        raise ValueError("Ground truth boxes, labels and crowd flags must align.")
+    if not len(dt_box) == len(dt_score) == len(dt_label):
+        raise ValueError("Detection boxes, scores and labels must align.")
+
+    # Detections of categories without any ground truth are not evaluated
+    categories = np.unique(gt_label)
+    num_categories = len(categories)
+    gt_category = np.searchsorted(categories, gt_label)
+    dt_category = np.minimum(np.searchsorted(categories, dt_label), num_categories - 1)
+    known = (
+        categories[dt_category] == dt_label
+        if num_categories
+        else np.zeros(len(dt_label), dtype=bool)
+    )
+
+    # Sort detections by (image, category) group, then by descending score
+    # (stable, as COCO's mergesort), and keep the largest max-detections cap
+    dt_group = dt_image * num_categories + dt_category
+    order = np.flatnonzero(known)
+    order = order[np.lexsort((-dt_score[order], dt_group[order]))]
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = dt_group[order[1:]] != dt_group[order[:-1]]
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(len(order)), 0))
+    rank = np.arange(len(order)) - group_start
+    order = order[rank < max_detections[-1]]
+    rank = rank[rank < max_detections[-1]]
+    dt_group, dt_category = dt_group[order], dt_category[order]
+    dt_box, dt_score = dt_box[order], dt_score[order]
+
+    gt_group = gt_image * num_categories + gt_category
+    order = np.argsort(gt_group, kind="stable")
+    gt_group, gt_category = gt_group[order], gt_category[order]
+    gt_box, gt_crowd = gt_box[order], gt_crowd[order]
+
+    bounds = np.array([area_ranges[name] for name in area_names], dtype=np.float64)
+    bounds = bounds.reshape(-1, 2, 1)
+    gt_areas = _box_areas(gt_box)
+    dt_areas = _box_areas(dt_box)
+    gt_ignore = gt_crowd | (gt_areas < bounds[:, 0]) | (gt_areas > bounds[:, 1])
+    outside = (dt_areas < bounds[:, 0]) | (dt_areas > bounds[:, 1])
+
+    # Only groups with both detections and ground truths need matching
+    groups = np.intersect1d(dt_group, gt_group)
+    matched, matched_ignored = _greedy_match(
+        dt_box,
+        gt_box,
+        gt_ignore,
+        gt_crowd,
+        _group_slices(dt_group, groups),
+        _group_slices(gt_group, groups),
+        iou_thresholds,
+        iou_type,
+    )
+    # Unmatched detections outside the area range are ignored
+    ignored = matched_ignored | (~matched & outside[:, None, :])
+    num_gts = np.stack(
+        [
+            np.bincount(gt_category[~ignore], minlength=num_categories)
+            for ignore in gt_ignore
+        ]
+    )
+
+    num_thresholds = len(iou_thresholds)
+    precision = -np.ones(
+        (
+            num_thresholds,
+            len(RECALL_THRESHOLDS),
+            num_categories,
+            len(area_names),
+            len(max_detections),
+        )
+    )
+    recall = -np.ones(
+        (num_thresholds, num_categories, len(area_names), len(max_detections))
+    )
+    # Each category's detections stay in image order, then score order
+    by_category = np.argsort(dt_category, kind="stable")
+    category_slices = _group_slices(dt_category[by_category], np.arange(num_categories))
+    for k, (start, count) in enumerate(zip(*category_slices)):
+        select = by_category[start : start + count]
+        category_precision, category_recall = _accumulate(
+            dt_score[select],
+            rank[select],
+            matched[:, :, select],
+            ignored[:, :, select],
+            num_gts[:, k, None],
+            max_detections,
+        )
+        # (A, T, ...) back to the COCO (T, R, K, A, M) / (T, K, A, M) layout
+        precision[:, :, k] = category_precision.transpose(1, 2, 0, 3)
+        recall[:, k] = category_recall.transpose(1, 0, 2)
+
+    return _summarize(
+        precision, recall, categories, iou_thresholds, area_names, max_detections
+    )
+
+
+def _summarize(precision, recall, categories, thresholds, area_names, max_detections):
+    all_area = area_names.index("all") if "all" in area_names else 0
+    top = len(max_detections) - 1
+
+    def threshold_index(value):
+        hits = np.flatnonzero(np.isclose(thresholds, value))
+        return hits[0] if hits.size else None
+
+    summary = {
+        "map": _mean_valid(precision[:, :, :, all_area, top]),
+        "precision": precision,
+        "recall": recall,
+        "categories": categories,
+    }
+    for value, name in ((0.5, "map_50"), (0.75, "map_75")):
+        t = threshold_index(value)
+        summary[name] = (
+            _mean_valid(precision[t, :, :, all_area, top]) if t is not None else -1.0
+        )
+    for a, area in enumerate(area_names):
+        if area != "all":
+            summary[f"map_{area}"] = _mean_valid(precision[:, :, :, a, top])
+    for m, max_det in enumerate(max_detections):
+        summary[f"mar_{max_det}"] = _mean_valid(recall[:, :, all_area, m])
+    for a, area in enumerate(area_names):
+        if area != "all":
+            summary[f"mar_{area}"] = _mean_valid(recall[:, :, a, top])
+    summary["per_class_ap"] = {
+        category: _mean_valid(precision[:, :, k, all_area, top])
+        for k, category in enumerate(categories)
+    }
+    return summary
+
+
+if __name__ == "__main__":
+    # Test cases: two images, two classes
+    gt_boxes = [
+        np.array([[0, 0, 50, 50], [60, 60, 200, 200]]),
+        np.array([[10, 10, 40, 40]]),
+    ]
+    gt_labels = [np.array([1, 2]), np.array([1])]
+    dt_boxes = [
+        np.array([[2, 2, 50, 52], [65, 60, 200, 190], [100, 0, 140, 30]]),
+        np.array([[12, 8, 41, 40], [0, 0, 10, 10]]),
+    ]
+    dt_scores = [np.array([0.9, 0.8, 0.3]), np.array([0.95, 0.2])]
+    dt_labels = [np.array([1, 2, 1]), np.array([1, 1])]
+
+    for iou_type in ("iou", "giou", "diou", "ciou"):
+        result = evaluate_detections(
+            gt_boxes, gt_labels, dt_boxes, dt_scores, dt_labels, iou_type=iou_type
+        )
+        print(f"Matching criterion: {iou_type}")
+        for name in ("map", "map_50", "map_75", "map_small", "mar_100"):
+            print(f"  {name}: {result[name]:.4f}")
+        print(
+            "  per-class AP:",
+            {int(k): round(v, 4) for k, v in result["per_class_ap"].items()},
+        )
+        print()
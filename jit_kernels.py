@@ -0,0 +1,497 @@
+import heapq
+import importlib.util
+import math
+
+import numpy as np
+
+from mask_stats import MaskStats
+from profiling import instrument
+
+# Numba is only imported when a kernel is first used (see _load_kernels), so
+# importing the metrics never pays Numba's import or compile cost. Without
+# Numba the kernels stay plain Python and are never called: all_iou_bbx and
+# all_iou_mask keep their NumPy code paths.
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+prange = range
+
+# Below these sizes the NumPy path is faster than entering a parallel kernel
+JIT_MIN_PAIRS = 1 << 12
+JIT_MIN_PIXELS = 1 << 16
+
+# Variant codes understood by the box kernels, in BOX_IOU_VARIANTS order
+_VARIANT_CODES = {
+    variant: code
+    for code, variant in enumerate(
+        (
+            "iou",
+            "giou",
+            "diou",
+            "ciou",
+            "eiou",
+            "focal_eiou",
+            "siou",
+            "alpha_iou",
+            "wiou",
+            "mpdiou",
+        )
+    )
+}
+_ASPECT_VARIANTS = {"ciou", "siou"}
+
+_enabled = NUMBA_AVAILABLE
+
+
+def set_jit(enabled):
+    """
+    Turn the compiled kernels on or off for the whole process and return the
+    previous setting. They are on by default whenever Numba is installed;
+    Numba itself is imported on the first kernel call.
+    """
+    global _enabled
+    if enabled and not NUMBA_AVAILABLE:
+        raise ValueError("The compiled kernels need Numba, which is not installed.")
+    previous, _enabled = _enabled, bool(enabled)
+    return previous
+
+
+def jit_enabled():
+    return _enabled
+
+
+# (name, parallel) of every function decorated with _jit
+_KERNELS = []
+_kernels_loaded = False
+
+
+def _jit(parallel=False):
+    """
+    Register a kernel to be compiled by njit once Numba is loaded; until
+    then it is the plain Python function.
+    """
+
+    def decorate(function):
+        _KERNELS.append((function.__name__, parallel))
+        return function
+
+    return decorate
+
+
+def _load_kernels():
+    """
+    Import Numba and replace every registered kernel of this module by its
+    njit dispatcher, so kernels calling each other resolve to compiled code.
+    Each dispatcher compiles on first call, with an on-disk cache (next to
+    this file, in __pycache__), so a kernel is compiled once per environment
+    rather than once per process. NumPy's error model gives inf / nan on
+    division by zero, as the NumPy path does.
+    """
+    global _kernels_loaded, prange
+    if _kernels_loaded:
+        return
+    import numba
+
+    prange = numba.prange
+    module = globals()
+    for name, parallel in _KERNELS:
+        module[name] = numba.njit(cache=True, parallel=parallel, error_model="numpy")(
+            module[name]
+        )
+    _kernels_loaded = True
+
+
+@_jit()
+def _power(base, exponent):
+    # Same fast paths as NumPy's array ** scalar, so both backends agree exactly
+    if exponent == 2.0:
+        return base * base
+    if exponent == 0.5:
+        return math.sqrt(base)
+    return base**exponent
+
+
+@_jit()
+def _box_row(boxes, i):
+    # Scalars rather than a row view, which would cost a reference count per pair
+    return boxes[i, 0], boxes[i, 1], boxes[i, 2], boxes[i, 3]
+
+
+@_jit()
+def _box_pair_value(code, b1, b2, atan1, atan2, gamma, alpha, weight):
+    """
+    One variant (a _VARIANT_CODES code) of one pair of (x1, y1, x2, y2)
+    boxes, with the formulas of all_iou_bbx._box_geometry and
+    _variant_from_geometry. atan1 / atan2 are the boxes' arctan(w / h).
+    """
+    x1_1, y1_1, x2_1, y2_1 = b1
+    x1_2, y1_2, x2_2, y2_2 = b2
+    inter_w = max(0.0, min(x2_1, x2_2) - max(x1_1, x1_2))
+    inter_h = max(0.0, min(y2_1, y2_2) - max(y1_1, y1_2))
+    inter_area = inter_w * inter_h
+
+    box1_area = (x2_1 - x1_1) * (y2_1 - y1_1)
+    box2_area = (x2_2 - x1_2) * (y2_2 - y1_2)
+    union = box1_area + box2_area - inter_area
+
+    # Zero-area pairs score 0.0, same as calculate_iou
+    zero_area = box1_area == 0 or box2_area == 0
+    iou = 0.0 if zero_area else inter_area / union
+
+    if code == 0:
+        return iou
+    if code == 7:
+        return _power(iou, alpha)
+    if code == 8:
+        return iou * weight
+    if code == 3 or code == 6:
+        zero_height = y2_1 == y1_1 or y2_2 == y1_2
+        v = (4 / math.pi**2) * (atan1 - atan2) ** 2
+        if code == 6:
+            return iou if zero_height else iou - v
+
+    enclose_w = max(x2_1, x2_2) - min(x1_1, x1_2)
+    enclose_h = max(y2_1, y2_2) - min(y1_1, y1_2)
+    if code == 1:
+        if zero_area:
+            return 0.0
+        enclose_area = enclose_w * enclose_h
+        return iou - (enclose_area - union) / enclose_area
+
+    center_dx = (x1_1 + x2_1) / 2 - (x1_2 + x2_2) / 2
+    center_dy = (y1_1 + y2_1) / 2 - (y1_2 + y2_2) / 2
+    c_diag = math.sqrt(enclose_w * enclose_w + enclose_h * enclose_h)
+    distance = math.sqrt(center_dx * center_dx + center_dy * center_dy)
+    zero_diag = c_diag == 0
+    penalty = 0.0 if zero_diag else distance**2 / c_diag**2
+
+    if code == 2 or code == 4:
+        return iou - penalty
+    if code == 3:
+        if zero_height or zero_diag:
+            return iou
+        denominator = 1 - iou + v
+        alpha_term = 0.0 if denominator == 0 else v / denominator
+        return iou - (penalty + alpha_term * v)
+    if code == 5:
+        eiou = iou - penalty
+        # Ensure Focal EIoU is 1 when completely overlapped
+        if eiou == 1:
+            return 1.0
+        return _power(1 - eiou, gamma) * eiou
+    if zero_diag:
+        return iou
+    return iou - penalty - min(distance, c_diag)
+
+
+@_jit(parallel=True)
+def _pairwise_box_kernel(boxes1, boxes2, atans1, atans2, codes, gamma, alpha, weight):
+    out = np.empty((len(boxes1), len(boxes2), len(codes)))
+    for i in prange(len(boxes1)):
+        box1 = _box_row(boxes1, i)
+        # One variant per sweep over boxes2, so the inner loop does not branch
+        # on the variant and skips the terms that variant does not need
+        for k in range(len(codes)):
+            code = codes[k]
+            for j in range(len(boxes2)):
+                out[i, j, k] = _box_pair_value(
+                    code,
+                    box1,
+                    _box_row(boxes2, j),
+                    atans1[i],
+                    atans2[j],
+                    gamma,
+                    alpha,
+                    weight,
+                )
+    return out
+
+
+@_jit(parallel=True)
+def _paired_box_kernel(boxes1, boxes2, atans1, atans2, codes, gamma, alpha, weight):
+    out = np.empty((len(boxes1), len(codes)))
+    for k in range(len(codes)):
+        code = codes[k]
+        for i in prange(len(boxes1)):
+            out[i, k] = _box_pair_value(
+                code,
+                _box_row(boxes1, i),
+                _box_row(boxes2, i),
+                atans1[i],
+                atans2[i],
+                gamma,
+                alpha,
+                weight,
+            )
+    return out
+
+
+def _aspect_arctans(boxes, aspect):
+    # arctan(w / h) per box, O(N) rather than per pair, and with NumPy's
+    # arctan so the aspect terms match the NumPy path exactly
+    if not aspect:
+        return np.zeros(len(boxes))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.arctan((boxes[:, 2] - boxes[:, 0]) / (boxes[:, 3] - boxes[:, 1]))
+
+
+def use_box_kernels(pairs, gamma=2.0, alpha=0.5, weight=1):
+    """
+    Whether the compiled box kernels should handle `pairs` box pairs: only
+    when enabled, for large enough inputs and scalar parameters (the NumPy
+    path also broadcasts array-valued ones).
+    """
+    return (
+        _enabled
+        and pairs >= JIT_MIN_PAIRS
+        and np.ndim(gamma) == 0
+        and np.ndim(alpha) == 0
+        and np.ndim(weight) == 0
+    )
+
+
+@instrument(name="box_kernel", category="stage")
+def box_ious(boxes1, boxes2, variants, gamma=2.0, alpha=0.5, weight=1, paired=False):
+    """
+    (N, M, V) values of the V requested variants between every box of the
+    (N, 4) float64 boxes1 and every box of boxes2 (M, 4), or (K, V) values of
+    row-aligned (K, 4) boxes with paired=True; the layout of a structured
+    array with one float64 field per variant. Intersection, union, enclosing
+    box and center distance are fused into one loop over the pairs, without
+    any (N, M) intermediates.
+    """
+    _load_kernels()
+    codes = np.array([_VARIANT_CODES[variant] for variant in variants])
+    aspect = not _ASPECT_VARIANTS.isdisjoint(variants)
+    kernel = _paired_box_kernel if paired else _pairwise_box_kernel
+    return kernel(
+        np.ascontiguousarray(boxes1),
+        np.ascontiguousarray(boxes2),
+        _aspect_arctans(boxes1, aspect),
+        _aspect_arctans(boxes2, aspect),
+        codes,
+        float(gamma),
+        float(alpha),
+        float(weight),
+    )
+
+
+@_jit()
+def _soft_nms_kernel(current, score_threshold, rows, cols, decay):
+    # Both directions of every pair grouped by source box (counting sort):
+    # after rescoring, either box of a pair may be selected first
+    indptr = np.zeros(len(current) + 1, dtype=np.intp)
+    for k in range(len(rows)):
+        indptr[rows[k] + 1] += 1
+        indptr[cols[k] + 1] += 1
+    indptr = np.cumsum(indptr)
+    fill = indptr[:-1].copy()
+    targets = np.empty(2 * len(rows), dtype=np.intp)
+    decays = np.empty(2 * len(rows))
+    for k in range(len(rows)):
+        i, j = rows[k], cols[k]
+        targets[fill[i]], decays[fill[i]] = j, decay[k]
+        targets[fill[j]], decays[fill[j]] = i, decay[k]
+        fill[i] += 1
+        fill[j] += 1
+
+    # Heap of (-score, rank) entries, re-keyed when popped with a stale score:
+    # scores only decrease, so a fresh top entry outscores every undecided box
+    state = np.zeros(len(current), dtype=np.int8)
+    heap = [(0.0, 0)]
+    heap.pop()
+    for i in range(len(current)):
+        if current[i] >= score_threshold:
+            heap.append((-current[i], i))
+        else:
+            state[i] = 2
+    heapq.heapify(heap)
+    selected = np.empty(len(heap), dtype=np.intp)
+    count = 0
+    while heap:
+        key, i = heapq.heappop(heap)
+        if state[i] != 0:
+            continue
+        if -key != current[i]:
+            heapq.heappush(heap, (-current[i], i))
+            continue
+        state[i] = 1
+        selected[count] = i
+        count += 1
+        for k in range(indptr[i], indptr[i + 1]):
+            j = targets[k]
+            if state[j] == 0:
+                current[j] *= decays[k]
+                if current[j] < score_threshold:
+                    state[j] = 2
+    return selected[:count]
+
+
+@instrument(name="soft_nms_kernel", category="stage")
+def soft_nms_order(current, score_threshold, rows, cols, decay):
+    """
+    Sequential Soft-NMS over score-ranked boxes linked by the pairs
+    (rows[k], cols[k]) with decay factor decay[k]: repeatedly select the
+    highest undecided score (ties: lowest rank), multiply the scores of its
+    undecided neighbours by their decay and drop those below
+    score_threshold. `current` is decayed in place; returns the selected
+    ranks in selection order.
+    """
+    _load_kernels()
+    return _soft_nms_kernel(
+        current,
+        float(score_threshold),
+        np.ascontiguousarray(rows, dtype=np.intp),
+        np.ascontiguousarray(cols, dtype=np.intp),
+        np.ascontiguousarray(decay, dtype=np.float64),
+    )
+
+
+@_jit()
+def _in_foreground(value, threshold, thresholded):
+    # 0 / 1 as an integer, so the counting loop has no branches to mispredict
+    if thresholded:
+        return np.int64(value >= threshold)
+    return np.int64(value != 0)
+
+
+@_jit()
+def _row_ends(mask, i, threshold, thresholded):
+    # First and last foreground column of a non-empty row
+    first = 0
+    while not _in_foreground(mask[i, first], threshold, thresholded):
+        first += 1
+    last = mask.shape[1] - 1
+    while not _in_foreground(mask[i, last], threshold, thresholded):
+        last -= 1
+    return first, last
+
+
+@_jit(parallel=True)
+def _mask_pair_rows(mask1, mask2, threshold, thresholded):
+    """
+    One pass over both (H, W) masks. Row i of the (H, 9) result holds, for
+    mask1 then mask2, the foreground count, first and last foreground column
+    and the sum of the foreground column indices, then the intersection count.
+    """
+    height, width = mask1.shape
+    rows = np.zeros((height, 9), dtype=np.int64)
+    for i in prange(height):
+        count1 = sum1 = count2 = sum2 = both = 0
+        for j in range(width):
+            in1 = _in_foreground(mask1[i, j], threshold, thresholded)
+            in2 = _in_foreground(mask2[i, j], threshold, thresholded)
+            count1 += in1
+            sum1 += in1 * j
+            count2 += in2
+            sum2 += in2 * j
+            both += in1 & in2
+        rows[i, 0] = count1
+        rows[i, 3] = sum1
+        rows[i, 4] = count2
+        rows[i, 7] = sum2
+        rows[i, 8] = both
+        # Row ends scan in from both edges, only as far as the first hit
+        if count1:
+            rows[i, 1], rows[i, 2] = _row_ends(mask1, i, threshold, thresholded)
+        if count2:
+            rows[i, 5], rows[i, 6] = _row_ends(mask2, i, threshold, thresholded)
+    return rows
+
+
+def _stats_from_rows(mask, threshold, row_counts, first_cols, last_cols, col_sums):
+    area = int(row_counts.sum())
+    if area == 0:
+        return MaskStats.from_summary(mask, 0, None, np.full(2, np.nan), threshold)
+    rows = np.flatnonzero(row_counts)
+    extent = (
+        int(rows[0]),
+        int(rows[-1]),
+        int(first_cols[rows].min()),
+        int(last_cols[rows].max()),
+    )
+    # Integer sums first, exactly as MaskStats computes the centroid
+    rows_index = np.arange(len(row_counts))
+    centroid = np.array([(row_counts @ rows_index) / area, int(col_sums.sum()) / area])
+    return MaskStats.from_summary(mask, area, extent, centroid, threshold)
+
+
+def use_mask_kernel(mask1, mask2):
+    """
+    Whether the compiled mask kernel should handle this pair: enabled, two
+    equally shaped 2D bool / numeric arrays and enough pixels to pay off.
+    """
+    return (
+        _enabled
+        and isinstance(mask1, np.ndarray)
+        and isinstance(mask2, np.ndarray)
+        and mask1.ndim == 2
+        and mask1.shape == mask2.shape
+        and mask1.size >= JIT_MIN_PIXELS
+        and mask1.dtype.kind in "biuf"
+        and mask2.dtype.kind in "biuf"
+    )
+
+
+@instrument(name="mask_kernel", category="stage")
+def mask_overlap(mask1, mask2, threshold=None):
+    """
+    The (stats1, stats2, intersection, union) of all_iou_mask._mask_overlap
+    from a single fused pass over both masks: areas, extents, centroid sums
+    and the intersection are accumulated together, without boolean copies.
+    """
+    _load_kernels()
+    rows = _mask_pair_rows(
+        mask1, mask2, 0.0 if threshold is None else threshold, threshold is not None
+    )
+    stats1 = _stats_from_rows(mask1, threshold, *rows[:, 0:4].T)
+    stats2 = _stats_from_rows(mask2, threshold, *rows[:, 4:8].T)
+    intersection = rows[:, 8].sum()
+    union = stats1.area + stats2.area - intersection
+    return stats1, stats2, intersection, union
+
+
+if __name__ == "__main__":
+    import time
+
+    from all_iou_bbx import calculate_all_ious
+    from all_iou_mask import calculate_mask_ciou, calculate_mask_giou
+    from mask_stats import clear_mask_stats_cache
+
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 500, (2000, 2))
+    boxes = np.hstack([xy, xy + rng.uniform(5, 80, (2000, 2))])
+    masks = [rng.random((2048, 2048)) < 0.3 for _ in range(2)]
+    masks[1][:200] = False
+
+    print("Numba 可用 (Numba Available):", NUMBA_AVAILABLE)
+    results = []
+    for description, enabled in (
+        ("NumPy 後端 (NumPy Backend)", False),
+        ("編譯後端 (Compiled Backend)", True),
+    ):
+        if enabled and not NUMBA_AVAILABLE:
+            continue
+        set_jit(enabled)
+        # The first call compiles, or loads the kernels from the on-disk cache
+        calculate_all_ious(boxes[:100], boxes[:100])
+        calculate_mask_giou(*masks)
+        clear_mask_stats_cache()
+
+        start = time.perf_counter()
+        report = calculate_all_ious(boxes, boxes)
+        box_time = time.perf_counter() - start
+        start = time.perf_counter()
+        mask_values = (calculate_mask_giou(*masks), calculate_mask_ciou(*masks))
+        mask_time = time.perf_counter() - start
+        results.append((report, mask_values))
+        print(f"{description}:")
+        print(f"  All box IoU variants, 2000x2000: {box_time * 1000:.1f} ms")
+        print(f"  Mask GIoU + CIoU, 2048x2048: {mask_time * 1000:.1f} ms")
+        print("  Mask GIoU, CIoU:", mask_values)
+
+    if len(results) == 2:
+        (numpy_report, numpy_masks), (jit_report, jit_masks) = results
+        same_boxes = all(
+            np.array_equal(numpy_report[name], jit_report[name], equal_nan=True)
+            for name in numpy_report.dtype.names
+        )
+        print("Identical results:", same_boxes and numpy_masks == jit_masks)
@@ -1,112 +1,251 @@
 import numpy as np
-from scipy.spatial.distance import directed_hausdorff
+from scipy.ndimage import binary_erosion, distance_transform_edt
 
+from cropped_mask import (
+    CroppedMask,
+    as_cropped,
+    cropped_intersection,
+    cropped_union_window,
+)
+from mask_stats import as_binary_mask, get_mask_stats, intersection_count
+from profiling import instrument
+from rle_mask import RLEMask, reject_rle, rle_dice_coefficient
+from volume_iou import union_window
 
-def pixel_accuracy(true_mask, pred_mask):
+
+@instrument
+def pixel_accuracy(true_mask, pred_mask, threshold=None):
     """
-    Compute the pixel accuracy between the true mask and the predicted mask.
+    Compute the pixel accuracy between the true mask and the predicted mask:
+    the fraction of pixels whose labels are equal, so multi-class label maps
+    are compared label by label. With a threshold, both masks are binarized
+    first (see as_binary_mask).
     """
+    reject_rle("pixel_accuracy", true_mask, pred_mask)
     assert (
         true_mask.shape == pred_mask.shape
     ), "Shape mismatch between true mask and predicted mask."
-    correct_pixels = np.sum(true_mask == pred_mask)
+    if isinstance(true_mask, CroppedMask) or isinstance(pred_mask, CroppedMask):
+        # Wrong pixels are the symmetric difference of the two foregrounds
+        true_crop = as_cropped(true_mask, threshold)
+        pred_crop = as_cropped(pred_mask, threshold)
+        intersection = cropped_intersection(true_crop, pred_crop)
+        total_pixels = true_crop.shape[0] * true_crop.shape[1]
+        wrong_pixels = true_crop.area() + pred_crop.area() - 2 * intersection
+        return (total_pixels - wrong_pixels) / total_pixels
+    if threshold is None:
+        correct_pixels = np.count_nonzero(
+            np.asarray(true_mask) == np.asarray(pred_mask)
+        )
+    else:
+        correct_pixels = np.count_nonzero(
+            as_binary_mask(true_mask, threshold) == as_binary_mask(pred_mask, threshold)
+        )
     total_pixels = true_mask.size
     return correct_pixels / total_pixels
 
 
 # equal to f1 score
-def dice_coefficient(true_mask, pred_mask):
+@instrument
+def dice_coefficient(true_mask, pred_mask, threshold=None):
     """
     Compute the Dice Coefficient between the true mask and the predicted mask.
+    Either mask may be an RLEMask, in which case no dense mask is decoded.
+    Mask areas come from get_mask_stats, which detects in-place writes by
+    sampling; see there for when clear_mask_stats_cache() is still needed.
     """
+    if isinstance(true_mask, RLEMask) or isinstance(pred_mask, RLEMask):
+        return rle_dice_coefficient(true_mask, pred_mask, threshold)
     assert (
         true_mask.shape == pred_mask.shape
     ), "Shape mismatch between true mask and predicted mask."
-    true_mask_bin = (true_mask > 0).astype(np.uint8)
-    pred_mask_bin = (pred_mask > 0).astype(np.uint8)
-    intersection = np.sum(true_mask_bin & pred_mask_bin)
-    union = np.sum(true_mask_bin) + np.sum(pred_mask_bin)
+    if isinstance(true_mask, CroppedMask) or isinstance(pred_mask, CroppedMask):
+        true_crop = as_cropped(true_mask, threshold)
+        pred_crop = as_cropped(pred_mask, threshold)
+        intersection = cropped_intersection(true_crop, pred_crop)
+        union = true_crop.area() + pred_crop.area()
+    else:
+        intersection = intersection_count(true_mask, pred_mask, threshold)
+        union = (
+            get_mask_stats(true_mask, threshold).area
+            + get_mask_stats(pred_mask, threshold).area
+        )
     dice = (2.0 * intersection) / union if union != 0 else 0.0
     return dice
 
 
-def hausdorff_distance(true_mask, pred_mask):
+@instrument(name="distance_transform", category="stage")
+def _distance_to(mask, spacing=None):
+    """
+    Euclidean distance from every pixel to the nearest foreground pixel of
+    mask, in units of `spacing` (the pixel / voxel size per axis) if given.
+    """
+    if mask.all():
+        return np.zeros(mask.shape)
+    return distance_transform_edt(~mask, sampling=spacing)
+
+
+def _binary_pair(true_mask, pred_mask, threshold=None):
+    """
+    Boolean foregrounds of both masks (of any dimension), cut to the bounding
+    box of their union, which leaves every point-to-point distance unchanged
+    and keeps distance transforms of sparse volumes small. The window itself
+    is dense: the distance metrics need memory proportional to its size, not
+    to a few slices.
+    """
+    if isinstance(true_mask, CroppedMask) or isinstance(pred_mask, CroppedMask):
+        window = cropped_union_window(
+            as_cropped(true_mask, threshold), as_cropped(pred_mask, threshold)
+        )
+    else:
+        window = union_window(true_mask, pred_mask, threshold)
+    if window is None:
+        empty = np.zeros((0,) * len(true_mask.shape), dtype=bool)
+        return empty, empty
+    return window
+
+
+@instrument(name="surface", category="stage")
+def _surface(mask):
+    # Foreground pixels with a background face neighbour (or on the image edge)
+    return mask & ~binary_erosion(mask)
+
+
+@instrument
+def hausdorff_distance(true_mask, pred_mask, threshold=None, spacing=None):
     """
     Compute the Hausdorff distance between the true mask and the predicted mask.
+    Masks may be volumes; `spacing` gives the voxel size per axis.
+
+    Runs a distance transform over the bounding box of both foregrounds, so
+    peak memory is about 40 bytes per voxel of that box (float64 distances
+    plus SciPy's feature transform; measured): about 5 GB for an organ spanning a
+    512^3 volume. Only the stats pass that finds the box is chunked.
+    """
+    reject_rle("hausdorff_distance", true_mask, pred_mask)
+    true_points, pred_points = _binary_pair(true_mask, pred_mask, threshold)
+
+    if not true_points.any() or not pred_points.any():
+        return float("inf")
+
+    # Directed distances read off each mask's distance transform in O(H*W)
+    forward_hausdorff = _distance_to(pred_points, spacing)[true_points].max()
+    backward_hausdorff = _distance_to(true_points, spacing)[pred_points].max()
+
+    return float(max(forward_hausdorff, backward_hausdorff))
+
+
+def _surface_distances(true_mask, pred_mask, threshold=None, spacing=None):
+    true_points, pred_points = _binary_pair(true_mask, pred_mask, threshold)
+    true_surface = _surface(true_points)
+    pred_surface = _surface(pred_points)
+
+    if not true_surface.any() or not pred_surface.any():
+        return None
+
+    return np.concatenate(
+        [
+            _distance_to(pred_surface, spacing)[true_surface],
+            _distance_to(true_surface, spacing)[pred_surface],
+        ]
+    )
+
+
+@instrument
+def hausdorff_distance_95(true_mask, pred_mask, threshold=None, spacing=None):
     """
-    true_points = np.argwhere(true_mask == 1)
-    pred_points = np.argwhere(pred_mask == 1)
+    Compute the 95th percentile of the symmetric surface distances (HD95)
+    between the true mask and the predicted mask, in units of `spacing`.
+    Memory scales with the bounding box of both foregrounds, as for
+    hausdorff_distance.
+    """
+    reject_rle("hausdorff_distance_95", true_mask, pred_mask)
+    distances = _surface_distances(true_mask, pred_mask, threshold, spacing)
+    if distances is None:
+        return float("inf")
+    return float(np.percentile(distances, 95))
 
-    if len(true_points) == 0 or len(pred_points) == 0:
+
+@instrument
+def average_surface_distance(true_mask, pred_mask, threshold=None, spacing=None):
+    """
+    Compute the average symmetric surface distance (ASSD) between the true
+    mask and the predicted mask, in units of `spacing`. Memory scales with
+    the bounding box of both foregrounds, as for hausdorff_distance.
+    """
+    reject_rle("average_surface_distance", true_mask, pred_mask)
+    distances = _surface_distances(true_mask, pred_mask, threshold, spacing)
+    if distances is None:
         return float("inf")
+    return float(distances.mean())
+
+
+if __name__ == "__main__":
+    # Test cases
+    test_cases = [
+        (
+            "完全重疊 (Complete Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+        ),
+        (
+            "部分重疊 (Partial Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+        (
+            "不重疊 (No Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 0, 1], [0, 0, 1], [1, 1, 0]]),
+        ),
+        (
+            "邊界接觸 (Touching at Edges)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 0, 0], [0, 1, 1], [0, 1, 1]]),
+        ),
+        (
+            "小遮罩在大遮罩內 (Small Mask Inside Large Mask)",
+            np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]]),
+            np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1]]),
+        ),
+        (
+            "交錯重疊 (Interleaved Overlap)",
+            np.array([[1, 0, 1], [0, 1, 0], [1, 0, 1]]),
+            np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]]),
+        ),
+        (
+            "不同形狀 (Different Shapes)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[1, 0, 0], [1, 0, 0], [1, 1, 1]]),
+        ),
+        (
+            "相似形狀但位置偏移 (Similar Shapes but Offset)",
+            np.array([[0, 1, 1], [0, 1, 1], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+        ),
+        (
+            "大面積交疊 (Large Area Overlap)",
+            np.array([[1, 1, 1], [1, 1, 1], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 1], [1, 0, 0]]),
+        ),
+        (
+            "一個遮罩全為零 (One Mask All Zero)",
+            np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]]),
+            np.array([[1, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+    ]
 
-    # Compute the directed Hausdorff distance
-    forward_hausdorff = directed_hausdorff(true_points, pred_points)[0]
-    backward_hausdorff = directed_hausdorff(pred_points, true_points)[0]
-
-    return max(forward_hausdorff, backward_hausdorff)
-
-
-# Test cases
-test_cases = [
-    (
-        "完全重疊 (Complete Overlap)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-    ),
-    (
-        "部分重疊 (Partial Overlap)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[0, 1, 1], [1, 0, 0], [0, 0, 1]]),
-    ),
-    (
-        "不重疊 (No Overlap)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[0, 0, 1], [0, 0, 1], [1, 1, 0]]),
-    ),
-    (
-        "邊界接觸 (Touching at Edges)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[0, 0, 0], [0, 1, 1], [0, 1, 1]]),
-    ),
-    (
-        "小遮罩在大遮罩內 (Small Mask Inside Large Mask)",
-        np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]]),
-        np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1]]),
-    ),
-    (
-        "交錯重疊 (Interleaved Overlap)",
-        np.array([[1, 0, 1], [0, 1, 0], [1, 0, 1]]),
-        np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]]),
-    ),
-    (
-        "不同形狀 (Different Shapes)",
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-        np.array([[1, 0, 0], [1, 0, 0], [1, 1, 1]]),
-    ),
-    (
-        "相似形狀但位置偏移 (Similar Shapes but Offset)",
-        np.array([[0, 1, 1], [0, 1, 1], [0, 0, 0]]),
-        np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
-    ),
-    (
-        "大面積交疊 (Large Area Overlap)",
-        np.array([[1, 1, 1], [1, 1, 1], [0, 0, 0]]),
-        np.array([[1, 1, 0], [1, 1, 1], [1, 0, 0]]),
-    ),
-    (
-        "一個遮罩全為零 (One Mask All Zero)",
-        np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]]),
-        np.array([[1, 1, 1], [1, 0, 0], [0, 0, 1]]),
-    ),
-]
-
-# Run test cases
-for description, true_mask, pred_mask in test_cases:
-    print(f"Test Case: {description}")
-    print(
-        "  Dice Coefficient:", dice_coefficient(true_mask, pred_mask)
-    )  # equal to f1 score
-    print("  Pixel Accuracy:", pixel_accuracy(true_mask, pred_mask))
-    print("  Hausdorff Distance:", hausdorff_distance(true_mask, pred_mask))
-    print()
+    # Run test cases
+    for description, true_mask, pred_mask in test_cases:
+        print(f"Test Case: {description}")
+        print(
+            "  Dice Coefficient:", dice_coefficient(true_mask, pred_mask)
+        )  # equal to f1 score
+        print("  Pixel Accuracy:", pixel_accuracy(true_mask, pred_mask))
+        print("  Hausdorff Distance:", hausdorff_distance(true_mask, pred_mask))
+        print("  Hausdorff Distance 95:", hausdorff_distance_95(true_mask, pred_mask))
+        print(
+            "  Average Surface Distance:",
+            average_surface_distance(true_mask, pred_mask),
+        )
+        print()
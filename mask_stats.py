@@ -0,0 +1,254 @@
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from profiling import instrument, stage
+
+# Maximum number of masks whose statistics are kept by get_mask_stats
+MASK_STATS_CACHE_SIZE = 256
+# Pixels compared on every get_mask_stats hit to detect in-place writes
+MASK_STATS_CHECK_PIXELS = 4096
+
+_cache = OrderedDict()
+
+
+def as_binary_mask(mask, threshold=None):
+    """
+    Boolean foreground of a bool / integer / float mask: the non-zero pixels,
+    or the pixels >= threshold (e.g. 0.5 for probability masks). Bool masks
+    are returned as they are, without a copy.
+    """
+    mask = np.asarray(mask)
+    if threshold is not None:
+        return mask >= threshold
+    return mask if mask.dtype == bool else mask != 0
+
+
+def foreground(mask, threshold=None):
+    """
+    Like as_binary_mask, but without threshold the mask is returned unchanged:
+    logical ops and np.count_nonzero already read any dtype as non-zero = 1,
+    so no boolean copy is made.
+    """
+    if threshold is not None:
+        return np.asarray(mask) >= threshold
+    return np.asarray(mask)
+
+
+@instrument(name="intersection", category="stage")
+def intersection_count(mask1, mask2, threshold=None):
+    """
+    Number of pixels in the foreground of both masks.
+    """
+    return np.count_nonzero(
+        np.logical_and(foreground(mask1, threshold), foreground(mask2, threshold))
+    )
+
+
+class MaskStats:
+    """
+    Per-mask summary of the foreground (see as_binary_mask) gathered from one
+    pass of per-row and per-column counts: area, inclusive extent and centroid.
+    A mask that is a tile of a larger image takes the tile's (row, col) offset
+    and the full image shape, so coordinates refer to the full image.
+    """
+
+    __slots__ = (
+        "shape",
+        "threshold",
+        "offset",
+        "area",
+        "extent",
+        "centroid",
+        "_mask_ref",
+        "_coordinates",
+    )
+
+    @instrument(name="mask_stats", category="stage")
+    def __init__(self, mask, threshold=None, offset=(0, 0), shape=None):
+        mask = np.asarray(mask)
+        binary = foreground(mask, threshold)
+        self.shape = mask.shape if shape is None else tuple(shape)
+        self.threshold = threshold
+        self.offset = tuple(offset)
+        # Row / column counts give area, extent and centroid without the
+        # (K, 2) coordinate arrays np.nonzero would allocate
+        row_counts = np.count_nonzero(binary, axis=1)
+        self._summarize(row_counts, lambda: np.count_nonzero(binary, axis=0))
+
+        # Weak reference only, so cached stats never keep a large mask alive
+        self._mask_ref = weakref.ref(mask)
+        self._coordinates = None
+
+    @classmethod
+    def from_counts(cls, row_counts, col_counts, threshold=None):
+        """
+        Stats of a full (H, W) mask known only through its per-row (H,) and
+        per-column (W,) foreground counts, e.g. summed tile by tile over an
+        image too large to load. coordinates() is not available.
+        """
+        stats = cls.__new__(cls)
+        row_counts = np.asarray(row_counts, dtype=np.int64)
+        col_counts = np.asarray(col_counts, dtype=np.int64)
+        stats.shape = (len(row_counts), len(col_counts))
+        stats.threshold = threshold
+        stats.offset = (0, 0)
+        stats._summarize(row_counts, lambda: col_counts)
+        stats._mask_ref = lambda: None
+        stats._coordinates = None
+        return stats
+
+    @classmethod
+    def from_summary(cls, mask, area, extent, centroid, threshold=None):
+        """
+        Stats of `mask` whose area, extent and centroid were already gathered
+        elsewhere, e.g. by the fused kernels in jit_kernels.py.
+        """
+        stats = cls.__new__(cls)
+        stats.shape = mask.shape
+        stats.threshold = threshold
+        stats.offset = (0, 0)
+        stats.area = area
+        stats.extent = extent
+        stats.centroid = centroid
+        stats._mask_ref = weakref.ref(mask)
+        stats._coordinates = None
+        return stats
+
+    def _summarize(self, row_counts, col_counts):
+        """
+        Area, extent and centroid from the row counts and a callable giving
+        the column counts, only evaluated for a non-empty mask.
+        """
+        rows = np.flatnonzero(row_counts)
+        self.area = int(row_counts.sum())
+        if self.area:
+            col_counts = col_counts()
+            cols = np.flatnonzero(col_counts)
+            row_offset, col_offset = self.offset
+            self.extent = (
+                int(rows[0]) + row_offset,
+                int(rows[-1]) + row_offset,
+                int(cols[0]) + col_offset,
+                int(cols[-1]) + col_offset,
+            )
+            # Integer sums first, so a tile's centroid equals the full mask's
+            with stage("centroid"):
+                rows_index = np.arange(row_offset, row_offset + len(row_counts))
+                cols_index = np.arange(col_offset, col_offset + len(col_counts))
+                self.centroid = np.array(
+                    [
+                        (row_counts @ rows_index) / self.area,
+                        (col_counts @ cols_index) / self.area,
+                    ]
+                )
+        else:
+            self.extent = None
+            self.centroid = np.full(2, np.nan)
+
+    def coordinates(self):
+        """
+        (K, 2) array of foreground pixel coordinates, computed on first use.
+        """
+        if self._coordinates is None:
+            mask = self._mask_ref()
+            if mask is None:
+                raise ValueError("The mask these stats describe is not available.")
+            self._coordinates = np.argwhere(
+                foreground(mask, self.threshold)
+            ) + np.array(self.offset)
+        return self._coordinates
+
+    def __repr__(self):
+        return f"MaskStats(shape={self.shape}, area={self.area}, extent={self.extent})"
+
+
+def _check_sample(mask):
+    """
+    Copy of the whole mask, or of MASK_STATS_CHECK_PIXELS evenly spaced
+    pixels of a larger one, compared on each cache hit.
+    """
+    if mask.size <= MASK_STATS_CHECK_PIXELS:
+        return mask.copy()
+    return mask.flat[
+        np.linspace(0, mask.size - 1, MASK_STATS_CHECK_PIXELS).astype(np.intp)
+    ]
+
+
+def get_mask_stats(mask, threshold=None):
+    """
+    Return the MaskStats of `mask`, memoized by array identity (and threshold)
+    with LRU eviction.
+
+    Entries are only reused while the original array is alive, so a recycled
+    id() never returns stale stats. A hit also compares a sample of the pixels
+    (the whole mask up to MASK_STATS_CHECK_PIXELS) with the one taken when the
+    stats were computed, so in-place writes such as `mask[...] = 0` are
+    detected; an edit of a large mask that misses every sampled pixel still
+    needs clear_mask_stats_cache().
+    """
+    if not isinstance(mask, np.ndarray):
+        return MaskStats(mask, threshold)
+
+    key = (
+        id(mask),
+        mask.__array_interface__["data"][0],
+        mask.shape,
+        mask.strides,
+        mask.dtype.str,
+        threshold,
+    )
+    entry = _cache.get(key)
+    if entry is not None:
+        stats, sample = entry
+        if stats._mask_ref() is mask and np.array_equal(
+            sample, _check_sample(mask), equal_nan=mask.dtype.kind in "fc"
+        ):
+            _cache.move_to_end(key)
+            return stats
+
+    stats = MaskStats(mask, threshold)
+    _cache[key] = (stats, _check_sample(mask))
+    while len(_cache) > MASK_STATS_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return stats
+
+
+def clear_mask_stats_cache():
+    """
+    Drop all stats memoized by get_mask_stats.
+    """
+    _cache.clear()
+
+
+if __name__ == "__main__":
+    # Test cases
+    test_cases = [
+        (
+            "方形遮罩 (Square Mask)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+        ),
+        (
+            "交錯遮罩 (Interleaved Mask)",
+            np.array([[1, 0, 1], [0, 1, 0], [1, 0, 1]]),
+        ),
+        (
+            "全為零 (All Zero)",
+            np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]]),
+        ),
+        (
+            "機率遮罩 (Probability Mask, threshold 0.5)",
+            np.array([[0.9, 0.6, 0.1], [0.7, 0.8, 0.2], [0.0, 0.3, 0.4]]),
+            0.5,
+        ),
+    ]
+
+    for description, mask, *threshold in test_cases:
+        stats = get_mask_stats(mask, *threshold)
+        print(f"{description}:")
+        print("  Area:", stats.area)
+        print("  Extent:", stats.extent)
+        print("  Centroid:", stats.centroid)
+        print("  Cached:", get_mask_stats(mask, *threshold) is stats)
+        print()
@@ -0,0 +1,199 @@
+import os
+
+import numpy as np
+
+from all_iou_mask import PackedMasks, pack_masks
+
+MASK_STORE_DATA = "masks.bin"
+MASK_STORE_INDEX = "index.npz"
+
+# Every image block starts on a 64-byte boundary, so packed views are aligned
+_ALIGNMENT = 64
+
+
+def write_mask_store(path, images, packed=False):
+    """
+    Write one (H, W) mask or (N, H, W) instance stack per image into a mask
+    store directory: a flat data file plus an offset index. Images are
+    streamed, so `images` may be a generator.
+
+    packed=False keeps uint8 pixel values; packed=True stores the pack_masks
+    bit-planes (1 bit per pixel, foreground = non-zero).
+    """
+    os.makedirs(path, exist_ok=True)
+    offsets, counts, heights, widths = [], [], [], []
+    position = 0
+    with open(os.path.join(path, MASK_STORE_DATA), "wb") as data:
+        for masks in images:
+            masks = np.asarray(masks)
+            if masks.ndim == 2:
+                masks = masks[None]
+            if masks.ndim != 3:
+                raise ValueError(
+                    f"Expected an (H, W) mask or (N, H, W) stack, got {masks.shape}."
+                )
+            if packed:
+                block = pack_masks(masks).words
+            else:
+                if masks.size and (masks.min() < 0 or masks.max() > 255):
+                    raise ValueError(
+                        "Mask values must fit in uint8 for an unpacked store."
+                    )
+                block = masks.astype(np.uint8)
+
+            padding = -position % _ALIGNMENT
+            data.write(bytes(padding))
+            position += padding
+            offsets.append(position)
+            counts.append(masks.shape[0])
+            heights.append(masks.shape[1])
+            widths.append(masks.shape[2])
+            data.write(block.tobytes())
+            position += block.nbytes
+
+    np.savez(
+        os.path.join(path, MASK_STORE_INDEX),
+        offsets=np.array(offsets, dtype=np.int64),
+        counts=np.array(counts, dtype=np.int64),
+        heights=np.array(heights, dtype=np.int64),
+        widths=np.array(widths, dtype=np.int64),
+        packed=np.array(packed),
+    )
+    return MaskStore(path)
+
+
+class MaskStore:
+    """
+    Read-only, memory-mapped view of a directory written by write_mask_store.
+
+    store[i] returns image i's masks as a zero-copy np.memmap view: (N, H, W)
+    uint8, or PackedMasks over (N, words) uint64 bit-planes for a packed
+    store, which calculate_pairwise_mask_iou accepts directly. Pages are read on first
+    access and stay in the OS page cache, so repeated runs over the same
+    ground truth barely touch the disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(os.path.join(path, MASK_STORE_INDEX)) as index:
+            self.offsets = index["offsets"]
+            self.counts = index["counts"]
+            self.heights = index["heights"]
+            self.widths = index["widths"]
+            self.packed = bool(index["packed"])
+        data_path = os.path.join(path, MASK_STORE_DATA)
+        self._data = (
+            np.memmap(data_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(data_path)
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        for image in range(len(self)):
+            yield self[image]
+
+    def __getitem__(self, image):
+        if image < 0:
+            image += len(self)
+        if not 0 <= image < len(self):
+            raise IndexError(f"Image {image} out of range for {len(self)} images.")
+        count = int(self.counts[image])
+        height, width = self.shape(image)
+        start = int(self.offsets[image])
+        if self.packed:
+            words = (height * width + 63) // 64
+            stop = start + count * words * 8
+            words = self._data[start:stop].view(np.uint64).reshape(count, words)
+            return PackedMasks((count, height, width), words)
+        stop = start + count * height * width
+        return self._data[start:stop].reshape(count, height, width)
+
+    def shape(self, image):
+        return int(self.heights[image]), int(self.widths[image])
+
+    def mask(self, image, instance=0):
+        """
+        One (H, W) mask: a zero-copy view, or unpacked (a copy) for a packed store.
+        """
+        masks = self[image]
+        if not self.packed:
+            return masks[instance]
+        height, width = self.shape(image)
+        bits = np.unpackbits(masks.words[instance].view(np.uint8), count=height * width)
+        return bits.reshape(height, width)
+
+    def masks(self):
+        """
+        Every (H, W) mask in image, then instance, order.
+        """
+        for image in range(len(self)):
+            for instance in range(int(self.counts[image])):
+                yield self.mask(image, instance)
+
+
+def iter_mask_pairs(gt_store, pred_store):
+    """
+    (ground truth, prediction) mask pairs from two stores with the same layout,
+    ready for evaluate_stream / evaluate_parallel.
+    """
+    if len(gt_store) != len(pred_store) or not np.array_equal(
+        gt_store.counts, pred_store.counts
+    ):
+        raise ValueError("Mask stores must hold the same images and instances.")
+    return zip(gt_store.masks(), pred_store.masks())
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from all_iou_mask import calculate_mask_iou, calculate_pairwise_mask_iou
+    from mask_metrics import dice_coefficient
+
+    # Test cases
+    test_cases = [
+        (
+            "完全重疊 (Complete Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+        ),
+        (
+            "部分重疊 (Partial Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+        (
+            "不重疊 (No Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 0, 1], [0, 0, 1], [1, 1, 0]]),
+        ),
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        gt_path = os.path.join(directory, "gt")
+        pred_path = os.path.join(directory, "pred")
+        gt_store = write_mask_store(gt_path, (case[1] for case in test_cases))
+        pred_store = write_mask_store(pred_path, (case[2] for case in test_cases))
+        packed_store = write_mask_store(
+            os.path.join(directory, "gt_packed"),
+            (case[1] for case in test_cases),
+            packed=True,
+        )
+
+        for image, (description, _, _) in enumerate(test_cases):
+            true_mask = gt_store.mask(image)
+            pred_mask = pred_store.mask(image)
+            print(f"{description}:")
+            print("  Zero-copy view:", isinstance(true_mask, np.memmap))
+            print("  Mask IoU:", calculate_mask_iou(true_mask, pred_mask))
+            print("  Dice Coefficient:", dice_coefficient(true_mask, pred_mask))
+            print(
+                "  Packed Mask IoU:",
+                calculate_pairwise_mask_iou(packed_store[image], pred_store[image])[
+                    0, 0
+                ],
+            )
+            print()
+        del true_mask, pred_mask, gt_store, pred_store, packed_store
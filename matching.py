@@ -0,0 +1,192 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix, issparse
+from scipy.sparse.csgraph import connected_components
+
+from all_iou_bbx import calculate_pairwise_iou
+from all_iou_mask import calculate_pairwise_mask_iou
+from sparse_iou_bbx import calculate_sparse_iou
+
+
+def _match_result(num_preds, num_gts, pred_index, gt_index, values):
+    order = np.argsort(pred_index, kind="stable")
+    pred_index = pred_index[order]
+    gt_index = gt_index[order]
+    tp = len(pred_index)
+    return {
+        "matches": np.stack([pred_index, gt_index], axis=1),
+        "similarity": values[order],
+        "tp": tp,
+        "fp": num_preds - tp,
+        "fn": num_gts - tp,
+        "unmatched_predictions": np.setdiff1d(np.arange(num_preds), pred_index),
+        "unmatched_ground_truths": np.setdiff1d(np.arange(num_gts), gt_index),
+    }
+
+
+def _solve_component(rows, cols, values):
+    """
+    Maximum-cardinality, then maximum-similarity assignment among the gated
+    (row, col, value) edges of one connected component.
+    """
+    preds, local_rows = np.unique(rows, return_inverse=True)
+    gts, local_cols = np.unique(cols, return_inverse=True)
+    # Every gated pair is worth more than any total similarity gain from
+    # fewer pairs, so the solver first maximizes the number of matches
+    low = values.min()
+    bonus = min(len(preds), len(gts)) * (values.max() - low) + 1
+    weights = np.zeros((len(preds), len(gts)))
+    weights[local_rows, local_cols] = bonus + values - low
+    gated = np.zeros(weights.shape, dtype=bool)
+    gated[local_rows, local_cols] = True
+
+    match_rows, match_cols = linear_sum_assignment(weights, maximize=True)
+    keep = gated[match_rows, match_cols]
+    match_rows, match_cols = match_rows[keep], match_cols[keep]
+    sub = np.zeros(weights.shape)
+    sub[local_rows, local_cols] = values
+    return preds[match_rows], gts[match_cols], sub[match_rows, match_cols]
+
+
+def optimal_assignment(similarity, threshold=0.5):
+    """
+    One-to-one matching of predictions (rows) to ground truths (columns) of a
+    similarity matrix, e.g. an IoU matrix, given dense or as a scipy sparse
+    matrix (missing entries never match). Only pairs with similarity >=
+    threshold may match; among those the assignment maximizes the number of
+    matches, then their total similarity.
+
+    Gating splits the bipartite graph into independent connected components:
+    single-pair components are matched directly and only the others are
+    solved with scipy's linear_sum_assignment.
+
+    Returns a dict with "matches" ((K, 2) prediction / ground truth indices),
+    their "similarity", TP / FP / FN counts and the unmatched indices.
+    """
+    if issparse(similarity):
+        similarity = similarity.tocoo()
+        gated = similarity.data >= threshold
+        rows = similarity.row[gated].astype(np.int64)
+        cols = similarity.col[gated].astype(np.int64)
+        values = similarity.data[gated].astype(np.float64)
+    else:
+        similarity = np.asarray(similarity, dtype=np.float64)
+        if similarity.ndim != 2:
+            raise ValueError(
+                f"Expected a 2D similarity matrix, got shape {similarity.shape}."
+            )
+        rows, cols = np.nonzero(similarity >= threshold)
+        values = similarity[rows, cols]
+    num_preds, num_gts = similarity.shape
+    if rows.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return _match_result(num_preds, num_gts, empty, empty, np.zeros(0))
+
+    # Nodes 0..P-1 are predictions, P..P+G-1 ground truths
+    graph = coo_matrix(
+        (np.ones(len(rows)), (rows, cols + num_preds)),
+        shape=(num_preds + num_gts, num_preds + num_gts),
+    )
+    _, labels = connected_components(graph, directed=False)
+    edge_component = labels[rows]
+    single = np.bincount(edge_component)[edge_component] == 1
+    pred_index = [rows[single]]
+    gt_index = [cols[single]]
+    matched_values = [values[single]]
+
+    order = np.flatnonzero(~single)
+    order = order[np.argsort(edge_component[order], kind="stable")]
+    bounds = np.flatnonzero(np.diff(edge_component[order])) + 1
+    for edges in np.split(order, bounds) if order.size else []:
+        preds, gts, component_values = _solve_component(
+            rows[edges], cols[edges], values[edges]
+        )
+        pred_index.append(preds)
+        gt_index.append(gts)
+        matched_values.append(component_values)
+
+    return _match_result(
+        num_preds,
+        num_gts,
+        np.concatenate(pred_index),
+        np.concatenate(gt_index),
+        np.concatenate(matched_values),
+    )
+
+
+def match_boxes(pred_boxes, gt_boxes, variant="iou", threshold=0.5):
+    """
+    Optimal one-to-one matching of [x1, y1, x2, y2] boxes, scored with any
+    variant of calculate_pairwise_iou (e.g. "iou", "giou", "diou").
+
+    Every variant is <= 0 for boxes that do not overlap, so with a positive
+    threshold only overlapping pairs are scored (calculate_sparse_iou).
+    """
+    pred_boxes = np.asarray(pred_boxes, dtype=np.float64).reshape(-1, 4)
+    gt_boxes = np.asarray(gt_boxes, dtype=np.float64).reshape(-1, 4)
+    if not (len(pred_boxes) and len(gt_boxes)):
+        similarity = np.zeros((len(pred_boxes), len(gt_boxes)))
+    elif threshold > 0:
+        similarity = calculate_sparse_iou(pred_boxes, gt_boxes, variant)
+    else:
+        similarity = calculate_pairwise_iou(pred_boxes, gt_boxes, variant)
+    return optimal_assignment(similarity, threshold)
+
+
+def match_masks(pred_masks, gt_masks, threshold=0.5):
+    """
+    Optimal one-to-one matching of (N, H, W) / (M, H, W) mask stacks (or
+    PackedMasks from pack_masks) by mask IoU.
+    """
+    if len(pred_masks) and len(gt_masks):
+        similarity = calculate_pairwise_mask_iou(pred_masks, gt_masks)
+    else:
+        similarity = np.zeros((len(pred_masks), len(gt_masks)))
+    return optimal_assignment(similarity, threshold)
+
+
+if __name__ == "__main__":
+    # Test cases
+    test_cases = [
+        (
+            "一對一 (One-to-One)",
+            np.array([[0, 0, 10, 10], [20, 20, 30, 30]]),
+            np.array([[1, 1, 10, 10], [21, 20, 31, 30]]),
+        ),
+        (
+            "貪婪匹配次優 (Greedy Suboptimal)",
+            np.array([[0, 0, 10, 10], [0, 0, 14, 10]]),
+            np.array([[0, 0, 12, 10], [0, 0, 8, 10]]),
+        ),
+        (
+            "多餘預測 (Extra Prediction)",
+            np.array([[0, 0, 10, 10], [50, 50, 60, 60]]),
+            np.array([[0, 0, 10, 10]]),
+        ),
+        (
+            "無預測 (No Predictions)",
+            np.zeros((0, 4)),
+            np.array([[0, 0, 10, 10]]),
+        ),
+    ]
+
+    for description, pred_boxes, gt_boxes in test_cases:
+        for variant in ("iou", "giou"):
+            result = match_boxes(pred_boxes, gt_boxes, variant, threshold=0.5)
+            print(f"{description} [{variant}]:")
+            print(f"  matches: {result['matches'].tolist()}")
+            print(f"  similarity: {np.round(result['similarity'], 4).tolist()}")
+            print(f"  TP: {result['tp']}, FP: {result['fp']}, FN: {result['fn']}")
+        print()
+
+    pred_masks = np.zeros((2, 8, 8), dtype=np.uint8)
+    gt_masks = np.zeros((2, 8, 8), dtype=np.uint8)
+    pred_masks[0, :4, :4] = 1
+    pred_masks[1, 4:, 4:] = 1
+    gt_masks[0, 4:, 3:] = 1
+    gt_masks[1, :4, :5] = 1
+    result = match_masks(pred_masks, gt_masks)
+    print("遮罩匹配 (Mask Matching):")
+    print(f"  matches: {result['matches'].tolist()}")
+    print(f"  similarity: {np.round(result['similarity'], 4).tolist()}")
+    print(f"  TP: {result['tp']}, FP: {result['fp']}, FN: {result['fn']}")
@@ -0,0 +1,326 @@
+import heapq
+
+import numpy as np
+
+from all_iou_bbx import BOX_IOU_VARIANTS, _as_boxes, calculate_paired_iou
+from jit_kernels import jit_enabled, soft_nms_order
+from profiling import instrument, stage
+
+SOFT_NMS_METHODS = ("linear", "gaussian")
+
+
+def _check_inputs(boxes, scores, classes, variant):
+    if variant not in BOX_IOU_VARIANTS:
+        raise ValueError(
+            f"Unknown IoU variant {variant!r}, expected one of {BOX_IOU_VARIANTS}."
+        )
+    boxes = _as_boxes(boxes)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if len(scores) != len(boxes):
+        raise ValueError(f"Got {len(boxes)} boxes but {len(scores)} scores.")
+    if classes is not None:
+        classes = np.asarray(classes).reshape(-1)
+        if len(classes) != len(boxes):
+            raise ValueError(f"Got {len(boxes)} boxes but {len(classes)} classes.")
+    return boxes, scores, classes
+
+
+def _offset_by_class(boxes, classes):
+    """
+    Shift each class to its own region of the plane, so boxes of different
+    classes never overlap and one pass handles every class.
+    """
+    if classes is None or len(boxes) == 0:
+        return boxes
+    _, class_index = np.unique(classes, return_inverse=True)
+    span = boxes.max() - boxes.min() + 1
+    return boxes + (class_index * span)[:, None]
+
+
+# x-overlapping candidate pairs examined per block of the overlap sweep
+_BLOCK_PAIRS = 1 << 20
+
+# Variants that never exceed the plain IoU, so IoU <= threshold rules a pair out
+_BOUNDED_BY_IOU = {
+    "iou",
+    "giou",
+    "diou",
+    "ciou",
+    "eiou",
+    "focal_eiou",
+    "siou",
+    "mpdiou",
+}
+
+
+@instrument(name="candidate_pairs", category="stage")
+def _overlapping_pairs(boxes, block_pairs=_BLOCK_PAIRS):
+    """
+    (i, j, iou) with i < j for every pair of boxes whose overlap has positive
+    area, each pair once. Sweep over x: after sorting by x1, the boxes that
+    start inside box i's x-range are one contiguous slice. The sweep runs in
+    blocks of about `block_pairs` x-overlapping candidates, each filtered by
+    y before the next, so memory scales with the overlapping pairs rather
+    than with every pair of x-ranges. The IoU is computed as in
+    calculate_pairwise_iou, so thresholds agree exactly.
+    """
+    x_order = np.argsort(boxes[:, 0], kind="stable")
+    x1, y1, x2, y2 = np.ascontiguousarray(boxes[x_order].T)
+    area = (x2 - x1) * (y2 - y1)
+    start = np.arange(1, len(boxes) + 1)
+    counts = np.maximum(np.searchsorted(x1, x2, side="left") - start, 0)
+
+    # Block boundaries: consecutive boxes whose candidates sum to ~block_pairs
+    ends = np.cumsum(counts)
+    bounds = np.searchsorted(
+        ends, np.arange(block_pairs, ends[-1] if len(ends) else 0, block_pairs)
+    )
+    rows, cols, ious = [], [], []
+    for lo, hi in zip(
+        np.concatenate([[0], bounds]), np.concatenate([bounds, [len(boxes)]])
+    ):
+        block_counts = counts[lo:hi]
+        first = np.repeat(np.arange(lo, hi), block_counts)
+        offset = np.arange(len(first)) - np.repeat(
+            np.cumsum(block_counts) - block_counts, block_counts
+        )
+        second = np.repeat(start[lo:hi], block_counts) + offset
+
+        # x1[second] >= x1[first], so it is the left edge of the intersection
+        inter_w = np.minimum(x2[first], x2[second]) - x1[second]
+        inter_h = np.minimum(y2[first], y2[second]) - np.maximum(y1[first], y1[second])
+        overlap = (inter_w > 0) & (inter_h > 0)
+        first, second = first[overlap], second[overlap]
+        inter_area = inter_w[overlap] * inter_h[overlap]
+        ious.append(inter_area / (area[first] + area[second] - inter_area))
+        i, j = x_order[first], x_order[second]
+        rows.append(np.minimum(i, j))
+        cols.append(np.maximum(i, j))
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(ious)
+
+
+def _overlap_graph(boxes, variant, iou_threshold=0.0, **variant_kwargs):
+    """
+    (i, j, value) for the overlapping pairs i < j of boxes, in the order the
+    boxes are given. Non-overlapping pairs score <= 0 in every variant, so
+    with a non-negative threshold they can never suppress each other; for
+    variants bounded by the IoU, pairs with IoU <= iou_threshold are dropped
+    before the variant is computed.
+    """
+    rows, cols, iou = _overlapping_pairs(boxes)
+    if variant in _BOUNDED_BY_IOU and iou_threshold > 0:
+        candidate = iou > iou_threshold
+        rows, cols, iou = rows[candidate], cols[candidate], iou[candidate]
+    if variant == "iou":
+        return rows, cols, iou
+    values = calculate_paired_iou(boxes[rows], boxes[cols], variant, **variant_kwargs)
+    return rows, cols, values
+
+
+def _by_source(count, sources, targets, *values):
+    """
+    The pairs grouped by source box, CSR style: the targets of box i are
+    targets[indptr[i]:indptr[i + 1]], and `values` are reordered alike.
+    """
+    order = np.argsort(sources)
+    indptr = np.zeros(count + 1, dtype=np.intp)
+    np.cumsum(np.bincount(sources, minlength=count), out=indptr[1:])
+    return (indptr, targets[order], *(value[order] for value in values))
+
+
+def _soft_nms_order(current, score_threshold, rows, cols, decay):
+    """
+    soft_nms_order without the compiled kernel: the same lazily re-keyed heap,
+    with each selected box decaying its neighbours in one vectorized step.
+    """
+    # Both directions: after rescoring, either box of a pair may be selected first
+    indptr, targets, decay = _by_source(
+        len(current),
+        np.concatenate([rows, cols]),
+        np.concatenate([cols, rows]),
+        np.concatenate([decay, decay]),
+    )
+    state = np.where(current >= score_threshold, 0, 2).astype(np.int8)
+    heap = [(-score, i) for i, score in enumerate(current.tolist()) if not state[i]]
+    heapq.heapify(heap)
+    selected = []
+    while heap:
+        key, i = heapq.heappop(heap)
+        if state[i]:
+            continue
+        if -key != current[i]:
+            heapq.heappush(heap, (-current[i], i))
+            continue
+        state[i] = 1
+        selected.append(i)
+        lo, hi = indptr[i], indptr[i + 1]
+        if lo == hi:
+            continue
+        neighbours = targets[lo:hi]
+        live = state[neighbours] == 0
+        neighbours = neighbours[live]
+        current[neighbours] *= decay[lo:hi][live]
+        state[neighbours[current[neighbours] < score_threshold]] = 2
+    return np.array(selected, dtype=np.intp)
+
+
+@instrument
+def nms(
+    boxes,
+    scores,
+    iou_threshold=0.5,
+    variant="iou",
+    classes=None,
+    max_detections=None,
+    **variant_kwargs,
+):
+    """
+    Greedy non-maximum suppression: going down the scores, keep a box unless
+    an already kept box scores more than iou_threshold against it in the
+    given IoU variant ("diou" gives DIoU-NMS). With classes, boxes only
+    suppress boxes of the same class.
+
+    Returns the indices of the kept boxes, highest score first. Only
+    overlapping pairs are scored (found by a sweep over x), and the greedy
+    pass visits only the boxes that suppress another one, so its cost does
+    not depend on how long a chain of overlapping boxes gets.
+    """
+    boxes, scores, classes = _check_inputs(boxes, scores, classes, variant)
+    if iou_threshold < 0:
+        raise ValueError(f"iou_threshold must be non-negative, got {iou_threshold}.")
+    order = np.argsort(-scores, kind="stable")
+    ranked = _offset_by_class(boxes, classes)[order]
+
+    rows, cols, values = _overlap_graph(
+        ranked, variant, iou_threshold, **variant_kwargs
+    )
+    suppress = values > iou_threshold
+    rows, cols = rows[suppress], cols[suppress]
+
+    # One greedy pass in score order. Only boxes that suppress something need a
+    # visit: a box is kept unless a kept box above it suppressed it.
+    indptr, cols = _by_source(len(ranked), rows, cols)
+    suppressed = np.zeros(len(ranked), dtype=bool)
+    with stage("suppression"):
+        for i in np.flatnonzero(np.diff(indptr)).tolist():
+            if not suppressed[i]:
+                suppressed[cols[indptr[i] : indptr[i + 1]]] = True
+
+    keep = order[~suppressed]
+    return keep if max_detections is None else keep[:max_detections]
+
+
+@instrument
+def soft_nms(
+    boxes,
+    scores,
+    method="gaussian",
+    sigma=0.5,
+    iou_threshold=0.3,
+    score_threshold=0.001,
+    variant="iou",
+    classes=None,
+    **variant_kwargs,
+):
+    """
+    Soft-NMS (Bodla et al., 2017): instead of removing the neighbours of a
+    selected box, decay their scores by (1 - iou) when iou > iou_threshold
+    ("linear") or by exp(-iou^2 / sigma) ("gaussian"), and drop boxes whose
+    score falls below score_threshold. Negative variant values (e.g. DIoU)
+    do not decay.
+
+    Returns (indices, scores): the surviving boxes in selection order and
+    their decayed scores. The selection runs as one pass over a heap of
+    scores, re-keyed lazily as they decay, with the compiled kernel of
+    jit_kernels when it is enabled.
+    """
+    boxes, scores, classes = _check_inputs(boxes, scores, classes, variant)
+    if method not in SOFT_NMS_METHODS:
+        raise ValueError(
+            f"Unknown Soft-NMS method {method!r}, expected one of {SOFT_NMS_METHODS}."
+        )
+    order = np.argsort(-scores, kind="stable")
+    ranked = _offset_by_class(boxes, classes)[order]
+    current = scores[order].copy()
+
+    rows, cols, values = _overlap_graph(ranked, variant, **variant_kwargs)
+    values = np.maximum(values, 0.0)
+    if method == "linear":
+        decay = np.where(values > iou_threshold, 1.0 - values, 1.0)
+    else:
+        decay = np.exp(-(values * values) / sigma)
+    decays = decay < 1.0
+    rows, cols, decay = rows[decays], cols[decays], decay[decays]
+    # Selection scores never increase, so selection order is the greedy order
+    if jit_enabled():
+        selected = soft_nms_order(current, score_threshold, rows, cols, decay)
+    else:
+        with stage("soft_nms_pass"):
+            selected = _soft_nms_order(current, score_threshold, rows, cols, decay)
+    return order[selected], current[selected]
+
+
+if __name__ == "__main__":
+    import time
+
+    # Test cases
+    test_cases = [
+        (
+            "重疊框 (Overlapping Boxes)",
+            [[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30], [21, 20, 31, 30]],
+            [0.9, 0.8, 0.7, 0.95],
+            None,
+        ),
+        (
+            "中心偏移 (Offset Centers)",
+            [[0, 0, 10, 10], [0, 0, 10, 14], [5, 0, 15, 10]],
+            [0.9, 0.85, 0.8],
+            None,
+        ),
+        (
+            "不同類別 (Different Classes)",
+            [[0, 0, 10, 10], [1, 1, 11, 11], [1, 1, 11, 11]],
+            [0.9, 0.8, 0.7],
+            [0, 0, 1],
+        ),
+    ]
+
+    for description, boxes, scores, classes in test_cases:
+        print(f"{description}:")
+        print("  NMS:", nms(boxes, scores, 0.5, classes=classes).tolist())
+        print(
+            "  DIoU-NMS:",
+            nms(boxes, scores, 0.5, variant="diou", classes=classes).tolist(),
+        )
+        for method in SOFT_NMS_METHODS:
+            keep, new_scores = soft_nms(boxes, scores, method, classes=classes)
+            print(
+                f"  Soft-NMS ({method}):",
+                [(int(i), round(float(s), 4)) for i, s in zip(keep, new_scores)],
+            )
+        print()
+
+    # Detector-like load: 50k jittered candidates around 1000 objects, 80 classes
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(0, 2000, (1000, 2))
+    sizes = rng.uniform(20, 200, (1000, 2))
+    objects = rng.integers(0, 1000, 50_000)
+    jitter = rng.normal(0, 0.1, (50_000, 4)) * np.tile(sizes[objects], 2)
+    boxes = np.concatenate(
+        [centers[objects] - sizes[objects] / 2, centers[objects] + sizes[objects] / 2],
+        axis=1,
+    )
+    boxes += jitter
+    scores = rng.random(50_000)
+    classes = objects % 80
+    for name, run in (
+        ("NMS", lambda: nms(boxes, scores, 0.5, classes=classes)),
+        ("DIoU-NMS", lambda: nms(boxes, scores, 0.5, "diou", classes=classes)),
+        ("Soft-NMS", lambda: soft_nms(boxes, scores, classes=classes)[0]),
+    ):
+        start = time.perf_counter()
+        kept = run()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name} on {len(boxes)} boxes: {len(kept)} kept in {elapsed * 1e3:.1f} ms"
+        )
@@ -0,0 +1,246 @@
+import numpy as np
+
+
+def _compact(ids):
+    """
+    Unique values of a flat id array with each pixel's index into them and the
+    pixel count per value. Small non-negative ids use a bincount lookup table
+    instead of sorting.
+    """
+    if ids.size and ids.min() >= 0 and ids.max() < 4 * ids.size:
+        counts = np.bincount(ids)
+        unique = np.flatnonzero(counts)
+        lookup = np.zeros(len(counts), dtype=np.int64)
+        lookup[unique] = np.arange(len(unique))
+        return unique, lookup[ids], counts[unique]
+    return np.unique(ids, return_inverse=True, return_counts=True)
+
+
+def _segment_categories(unique, categories, void_id, name):
+    """
+    Category of each segment id; -1 marks the void id.
+    """
+    result = np.full(len(unique), -1, dtype=np.int64)
+    for i, segment in enumerate(unique.tolist()):
+        if segment == void_id:
+            continue
+        if segment not in categories:
+            raise ValueError(f"{name} segment {segment} has no category.")
+        result[i] = categories[segment]
+    return result
+
+
+class PanopticQuality:
+    """
+    Streaming Panoptic Quality (PQ = SQ x RQ) over integer segment-id maps.
+
+    Each update() takes a ground truth and a predicted (H, W) segment-id map,
+    a {segment_id: category} dict for each, and optionally the ids of crowd
+    ground truth segments. Pixels with void_id are unlabelled. Per-category
+    TP / FP / FN counts and matched IoU sums accumulate across images, so a
+    dataset costs one bincount of combined (gt, pred) ids per image.
+    """
+
+    def __init__(self, num_categories, void_id=0, thing_categories=None):
+        if num_categories < 1:
+            raise ValueError(
+                f"num_categories must be at least 1, got {num_categories}."
+            )
+        self.num_categories = num_categories
+        self.void_id = void_id
+        self.thing_categories = (
+            None if thing_categories is None else sorted(set(thing_categories))
+        )
+        self.tp = np.zeros(num_categories, dtype=np.int64)
+        self.fp = np.zeros(num_categories, dtype=np.int64)
+        self.fn = np.zeros(num_categories, dtype=np.int64)
+        self.iou_sum = np.zeros(num_categories, dtype=np.float64)
+
+    def update(self, gt_ids, pred_ids, gt_categories, pred_categories, gt_crowd=()):
+        gt_ids = np.asarray(gt_ids)
+        pred_ids = np.asarray(pred_ids)
+        assert (
+            gt_ids.shape == pred_ids.shape
+        ), "Shape mismatch between ground truth and predicted segment maps."
+
+        gt_unique, gt_index, gt_area = _compact(gt_ids.reshape(-1).astype(np.int64))
+        pred_unique, pred_index, pred_area = _compact(
+            pred_ids.reshape(-1).astype(np.int64)
+        )
+        gt_category = _segment_categories(
+            gt_unique, gt_categories, self.void_id, "Ground truth"
+        )
+        pred_category = _segment_categories(
+            pred_unique, pred_categories, self.void_id, "Predicted"
+        )
+        for categories in (gt_category, pred_category):
+            if categories.max(initial=-1) >= self.num_categories:
+                raise ValueError(
+                    f"Categories must be in [0, {self.num_categories}), got "
+                    f"{categories.max()}."
+                )
+        gt_is_crowd = np.isin(gt_unique, list(gt_crowd))
+        gt_void = gt_category < 0
+        pred_void = pred_category < 0
+
+        # All (gt, pred) overlaps at once from one combined id per pixel
+        combined = gt_index * len(pred_unique) + pred_index
+        if len(gt_unique) * len(pred_unique) <= 4 * combined.size:
+            counts = np.bincount(combined, minlength=len(gt_unique) * len(pred_unique))
+            pairs = np.flatnonzero(counts)
+            intersection = counts[pairs]
+        else:
+            pairs, intersection = np.unique(combined, return_counts=True)
+        g, p = np.divmod(pairs, len(pred_unique))
+
+        # Prediction pixels on unlabelled ground truth do not count against IoU
+        void_overlap = np.bincount(
+            p[gt_void[g]], weights=intersection[gt_void[g]], minlength=len(pred_unique)
+        )
+        candidate = (
+            ~gt_void[g]
+            & ~gt_is_crowd[g]
+            & ~pred_void[p]
+            & (gt_category[g] == pred_category[p])
+        )
+        g, p, intersection_c = g[candidate], p[candidate], intersection[candidate]
+        union = pred_area[p] + gt_area[g] - intersection_c - void_overlap[p]
+        iou = intersection_c / union
+        # IoU > 0.5 makes every match unique, no assignment step needed
+        match = iou > 0.5
+        gt_matched = np.zeros(len(gt_unique), dtype=bool)
+        pred_matched = np.zeros(len(pred_unique), dtype=bool)
+        gt_matched[g[match]] = True
+        pred_matched[p[match]] = True
+        matched_category = gt_category[g[match]]
+        self.tp += np.bincount(matched_category, minlength=self.num_categories)
+        self.iou_sum += np.bincount(
+            matched_category, weights=iou[match], minlength=self.num_categories
+        )
+
+        missed = ~gt_matched & ~gt_void & ~gt_is_crowd
+        self.fn += np.bincount(gt_category[missed], minlength=self.num_categories)
+
+        # Unmatched predictions mostly on void or same-category crowd are ignored
+        g, p = np.divmod(pairs, len(pred_unique))
+        crowd_pair = gt_is_crowd[g] & (gt_category[g] == pred_category[p])
+        crowd_overlap = np.bincount(
+            p[crowd_pair], weights=intersection[crowd_pair], minlength=len(pred_unique)
+        )
+        ignored = (void_overlap + crowd_overlap) / pred_area > 0.5
+        false_positive = ~pred_matched & ~pred_void & ~ignored
+        self.fp += np.bincount(
+            pred_category[false_positive], minlength=self.num_categories
+        )
+        return self
+
+    def merge(self, other):
+        if other.num_categories != self.num_categories:
+            raise ValueError("Cannot merge panoptic stats with different categories.")
+        self.tp += other.tp
+        self.fp += other.fp
+        self.fn += other.fn
+        self.iou_sum += other.iou_sum
+        return self
+
+    def reset(self):
+        self.tp[:] = 0
+        self.fp[:] = 0
+        self.fn[:] = 0
+        self.iou_sum[:] = 0
+
+    def per_class(self):
+        """
+        Per-category PQ / SQ / RQ arrays; categories that never appear are 0.
+        """
+        denominator = self.tp + 0.5 * self.fp + 0.5 * self.fn
+        pq = np.zeros(self.num_categories)
+        sq = np.zeros(self.num_categories)
+        rq = np.zeros(self.num_categories)
+        np.divide(self.iou_sum, denominator, out=pq, where=denominator != 0)
+        np.divide(self.iou_sum, self.tp, out=sq, where=self.tp != 0)
+        np.divide(self.tp, denominator, out=rq, where=denominator != 0)
+        return {"pq": pq, "sq": sq, "rq": rq}
+
+    def compute(self):
+        """
+        PQ / SQ / RQ averaged over the categories seen in ground truth or
+        predictions, plus "things" / "stuff" splits when thing_categories is set.
+        """
+        per_class = self.per_class()
+        seen = (self.tp + self.fp + self.fn) > 0
+
+        def average(select):
+            select = select & seen
+            n = int(select.sum())
+            result = {
+                name: float(values[select].mean()) if n else 0.0
+                for name, values in per_class.items()
+            }
+            result["num_categories"] = n
+            return result
+
+        report = {"all": average(np.ones(self.num_categories, dtype=bool))}
+        if self.thing_categories is not None:
+            things = np.zeros(self.num_categories, dtype=bool)
+            things[self.thing_categories] = True
+            report["things"] = average(things)
+            report["stuff"] = average(~things)
+        report["per_class"] = per_class
+        return report
+
+
+if __name__ == "__main__":
+    # Test cases: segment ids 1..n, 0 is unlabelled
+    test_cases = [
+        (
+            "完全重疊 (Complete Overlap)",
+            np.array([[1, 1, 2], [1, 1, 2], [3, 3, 3]]),
+            np.array([[1, 1, 2], [1, 1, 2], [3, 3, 3]]),
+            {1: 0, 2: 1, 3: 2},
+            {1: 0, 2: 1, 3: 2},
+        ),
+        (
+            "部分重疊 (Partial Overlap)",
+            np.array([[1, 1, 2], [1, 1, 2], [3, 3, 3]]),
+            np.array([[1, 1, 1], [1, 2, 2], [3, 3, 0]]),
+            {1: 0, 2: 1, 3: 2},
+            {1: 0, 2: 1, 3: 2},
+        ),
+        (
+            "類別錯誤 (Wrong Category)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[5, 5, 0], [5, 5, 0], [0, 0, 0]]),
+            {1: 0},
+            {5: 1},
+        ),
+        (
+            "無預測 (No Prediction)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.zeros((3, 3), dtype=int),
+            {1: 0},
+            {},
+        ),
+    ]
+
+    dataset = PanopticQuality(num_categories=3, thing_categories=[0, 1])
+    for description, gt_ids, pred_ids, gt_categories, pred_categories in test_cases:
+        dataset.update(gt_ids, pred_ids, gt_categories, pred_categories)
+        image = PanopticQuality(num_categories=3).update(
+            gt_ids, pred_ids, gt_categories, pred_categories
+        )
+        result = image.compute()["all"]
+        print(f"{description}:")
+        print(
+            f"  PQ: {result['pq']:.4f}, SQ: {result['sq']:.4f}, RQ: {result['rq']:.4f}"
+        )
+        print(f"  TP: {image.tp.sum()}, FP: {image.fp.sum()}, FN: {image.fn.sum()}")
+        print()
+
+    report = dataset.compute()
+    for split in ("all", "things", "stuff"):
+        result = report[split]
+        print(
+            f"Dataset {split}: PQ {result['pq']:.4f}, SQ {result['sq']:.4f}, "
+            f"RQ {result['rq']:.4f} ({result['num_categories']} categories)"
+        )
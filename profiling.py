@@ -0,0 +1,288 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# The running Profiler, or None; instrumented code checks only this when disabled
+_active = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "category", "start", "base", "peak")
+
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._exit(self)
+        return False
+
+
+def stage(name):
+    """
+    Context manager timing one stage of a metric (e.g. "intersection"); a
+    shared no-op object while no Profiler is running.
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL_SPAN
+    return _Span(profiler, name, "stage")
+
+
+def instrument(function=None, name=None, category="metric"):
+    """
+    Decorator recording every call of a function while a Profiler is running.
+    Works bare (@instrument), with arguments (@instrument(name="stats",
+    category="stage")) or as a wrapper for third-party functions, e.g.
+    instrument(f1_score, name="sklearn.f1_score").
+    """
+
+    def decorate(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return function(*args, **kwargs)
+            with _Span(profiler, label, category):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    if function is not None:
+        return decorate(function)
+    return decorate
+
+
+class Profiler:
+    """
+    Opt-in recorder for instrumented metrics and stages.
+
+    While running (`with Profiler() as profiler:` or start() / stop()) every
+    call of an @instrument function and every stage() block is recorded with
+    its start time, duration and thread. With track_memory=True the peak
+    bytes allocated inside each span are measured through tracemalloc, which
+    slows the code down noticeably; the peak is process-wide, so it is only
+    exact for single-threaded runs. Only one Profiler can run at a time.
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.events = []
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("Another Profiler is already running.")
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def reset(self):
+        self.events = []
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, span):
+        stack = self._stack()
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Hand the peak so far to the open spans before starting a new one
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            span.base = current
+            span.peak = current
+        stack.append(span)
+        span.start = time.perf_counter_ns()
+
+    def _exit(self, span):
+        end = time.perf_counter_ns()
+        stack = self._stack()
+        stack.pop()
+        allocated = None
+        if self.track_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            span.peak = max(span.peak, peak)
+            allocated = span.peak - span.base
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, span.peak)
+            tracemalloc.reset_peak()
+        self.events.append(
+            (
+                span.name,
+                span.category,
+                span.start,
+                end - span.start,
+                threading.get_ident(),
+                len(stack),
+                allocated,
+            )
+        )
+
+    def summary(self):
+        """
+        {name: statistics} over the recorded calls: category, call count,
+        total / mean / p50 / p90 / p99 / max milliseconds and, when memory is
+        tracked, mean and max peak bytes allocated per call.
+        """
+        grouped = {}
+        for name, category, _, duration, _, _, allocated in self.events:
+            entry = grouped.setdefault(name, (category, [], []))
+            entry[1].append(duration)
+            if allocated is not None:
+                entry[2].append(allocated)
+
+        report = {}
+        for name, (category, durations, allocations) in grouped.items():
+            durations_ms = np.array(durations) / 1e6
+            p50, p90, p99 = np.percentile(durations_ms, [50, 90, 99])
+            report[name] = {
+                "category": category,
+                "calls": len(durations),
+                "total_ms": float(durations_ms.sum()),
+                "mean_ms": float(durations_ms.mean()),
+                "p50_ms": float(p50),
+                "p90_ms": float(p90),
+                "p99_ms": float(p99),
+                "max_ms": float(durations_ms.max()),
+            }
+            if allocations:
+                report[name]["mean_bytes"] = float(np.mean(allocations))
+                report[name]["max_bytes"] = int(max(allocations))
+        return report
+
+    def format_summary(self):
+        """
+        The summary as a text table, slowest total first.
+        """
+        report = self.summary()
+        header = (
+            f"{'name':<30}{'category':<10}{'calls':>8}{'total ms':>12}"
+            f"{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        )
+        if self.track_memory:
+            header += f"{'max MiB':>10}"
+        lines = [header, "-" * len(header)]
+        for name, entry in sorted(
+            report.items(), key=lambda item: item[1]["total_ms"], reverse=True
+        ):
+            line = (
+                f"{name:<30}{entry['category']:<10}{entry['calls']:>8}"
+                f"{entry['total_ms']:>12.3f}{entry['mean_ms']:>10.4f}"
+                f"{entry['p50_ms']:>10.4f}{entry['p99_ms']:>10.4f}"
+            )
+            if self.track_memory:
+                line += f"{entry.get('max_bytes', 0) / 2**20:>10.2f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """
+        The events in Chrome trace format ("X" complete events, microseconds),
+        for chrome://tracing or Perfetto.
+        """
+        pid = os.getpid()
+        events = []
+        for name, category, start, duration, thread, depth, allocated in self.events:
+            args = {"depth": depth}
+            if allocated is not None:
+                args["bytes"] = allocated
+            events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": start / 1e3,
+                    "dur": duration / 1e3,
+                    "pid": pid,
+                    "tid": thread,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+if __name__ == "__main__":
+    from sklearn.metrics import f1_score
+
+    from all_iou_mask import calculate_mask_ciou, calculate_mask_giou
+    from mask_metrics import dice_coefficient, hausdorff_distance
+
+    # The metrics report to the importable module, not this script's copy
+    from profiling import Profiler, instrument
+
+    # Test cases: masks of growing size, profiled with sklearn for comparison
+    test_cases = [
+        ("小遮罩 (Small Masks)", 64),
+        ("中遮罩 (Medium Masks)", 512),
+        ("大遮罩 (Large Masks)", 2048),
+    ]
+    profiled_f1 = instrument(f1_score, name="sklearn.f1_score")
+
+    with Profiler(track_memory=True) as profiler:
+        for description, size in test_cases:
+            true_mask = np.zeros((size, size), dtype=np.uint8)
+            pred_mask = np.zeros((size, size), dtype=np.uint8)
+            true_mask[size // 4 : size // 2, size // 4 : size // 2] = 1
+            pred_mask[size // 3 : size // 2, size // 4 : 2 * size // 3] = 1
+            print(f"{description}:")
+            print("  Mask GIoU:", calculate_mask_giou(true_mask, pred_mask))
+            print("  Mask CIoU:", calculate_mask_ciou(true_mask, pred_mask))
+            print("  Dice Coefficient:", dice_coefficient(true_mask, pred_mask))
+            print("  Hausdorff Distance:", hausdorff_distance(true_mask, pred_mask))
+            print("  sklearn F1:", profiled_f1(true_mask.ravel(), pred_mask.ravel()))
+            print()
+
+    print(profiler.format_summary())
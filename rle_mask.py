@@ -0,0 +1,273 @@
+import numpy as np
+
+from mask_stats import as_binary_mask
+from profiling import instrument
+
+
+class RLEMask:
+    """
+    Run-length-encoded binary mask in COCO layout: the mask is flattened in
+    column-major (Fortran) order and `counts` alternates background and
+    foreground run lengths, always starting with a (possibly empty) background run.
+    """
+
+    __slots__ = ("size", "counts")
+
+    def __init__(self, size, counts):
+        self.size = (int(size[0]), int(size[1]))
+        self.counts = np.asarray(counts, dtype=np.int64)
+        if self.counts.sum() != self.size[0] * self.size[1]:
+            raise ValueError(
+                f"RLE counts sum to {self.counts.sum()}, expected "
+                f"{self.size[0] * self.size[1]} for size {self.size}."
+            )
+
+    @classmethod
+    def from_mask(cls, mask, threshold=None):
+        """
+        Encode a dense (H, W) mask; foreground as in as_binary_mask.
+        """
+        mask = np.asarray(mask)
+        if mask.ndim != 2:
+            raise ValueError(f"Expected a 2D mask, got shape {mask.shape}.")
+        flat = as_binary_mask(mask, threshold).ravel(order="F")
+        if flat.size == 0:
+            return cls(mask.shape, [])
+        changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+        counts = np.diff(np.concatenate([[0], changes, [flat.size]]))
+        if flat[0]:
+            counts = np.concatenate([[0], counts])
+        return cls(mask.shape, counts)
+
+    @classmethod
+    def from_coco(cls, rle):
+        """
+        Build from a COCO RLE dict {"size": [h, w], "counts": list or str}.
+        """
+        counts = rle["counts"]
+        if isinstance(counts, bytes):
+            counts = counts.decode("ascii")
+        if isinstance(counts, str):
+            counts = _decompress_counts(counts)
+        return cls(rle["size"], counts)
+
+    def to_coco(self, compress=True):
+        counts = self.counts.tolist()
+        if compress:
+            counts = _compress_counts(counts)
+        return {"size": list(self.size), "counts": counts}
+
+    def decode(self):
+        """
+        Decode to a dense (H, W) uint8 mask.
+        """
+        values = np.zeros(len(self.counts), dtype=np.uint8)
+        values[1::2] = 1
+        flat = np.repeat(values, self.counts)
+        return flat.reshape(self.size, order="F")
+
+    def area(self):
+        return int(self.counts[1::2].sum())
+
+    def extent(self):
+        """
+        Return the inclusive foreground extent (row_min, row_max, col_min, col_max),
+        matching mask.nonzero() min/max on the decoded mask, or None if empty.
+        """
+        height = self.size[0]
+        ends = np.cumsum(self.counts)
+        starts = ends - self.counts
+        foreground = np.arange(len(self.counts)) % 2 == 1
+        foreground &= self.counts > 0
+        if not foreground.any():
+            return None
+        starts = starts[foreground]
+        lasts = ends[foreground] - 1
+
+        first_col = starts // height
+        last_col = lasts // height
+        # A run crossing a column boundary covers the bottom and top rows
+        spans_columns = first_col != last_col
+        row_min = np.where(spans_columns, 0, starts % height).min()
+        row_max = np.where(spans_columns, height - 1, lasts % height).max()
+        return int(row_min), int(row_max), int(first_col.min()), int(last_col.max())
+
+    def bbox(self):
+        """
+        COCO bounding box [x, y, w, h] of the foreground, computed from the runs.
+        """
+        extent = self.extent()
+        if extent is None:
+            return [0, 0, 0, 0]
+        row_min, row_max, col_min, col_max = extent
+        return [col_min, row_min, col_max - col_min + 1, row_max - row_min + 1]
+
+    def __repr__(self):
+        return f"RLEMask(size={self.size}, runs={len(self.counts)}, area={self.area()})"
+
+
+def _compress_counts(counts):
+    # COCO's LEB128-like string encoding, counts after the second are delta-coded
+    chars = []
+    for i, count in enumerate(counts):
+        x = count - counts[i - 2] if i > 2 else count
+        more = True
+        while more:
+            c = x & 0x1F
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def _decompress_counts(string):
+    counts = []
+    p = 0
+    while p < len(string):
+        x = 0
+        k = 0
+        more = True
+        while more:
+            c = ord(string[p]) - 48
+            x |= (c & 0x1F) << (5 * k)
+            more = c & 0x20
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+def as_rle(mask, threshold=None):
+    return mask if isinstance(mask, RLEMask) else RLEMask.from_mask(mask, threshold)
+
+
+def reject_rle(name, *masks):
+    """
+    Raise a TypeError if any of `masks` is an RLEMask, for the metrics that
+    only work on dense masks.
+    """
+    if any(isinstance(mask, RLEMask) for mask in masks):
+        raise TypeError(
+            f"{name} does not accept RLEMask inputs; call .decode() on them first."
+        )
+
+
+@instrument(name="intersection", category="stage")
+def rle_intersection(rle1, rle2):
+    """
+    Count the pixels that are foreground in both masks, working on run
+    boundaries only (no decoding).
+    """
+    if rle1.size != rle2.size:
+        raise ValueError(
+            f"Shape mismatch between RLE masks: {rle1.size} vs {rle2.size}."
+        )
+    total = rle1.size[0] * rle1.size[1]
+    if total == 0:
+        return 0
+    toggles1 = np.cumsum(rle1.counts)
+    toggles2 = np.cumsum(rle2.counts)
+
+    # Elementary segments between consecutive run boundaries of either mask
+    points = np.unique(np.concatenate([[0, total], toggles1, toggles2]))
+    points = points[points <= total]
+    starts = points[:-1]
+    lengths = np.diff(points)
+    inside1 = np.searchsorted(toggles1, starts, side="right") % 2 == 1
+    inside2 = np.searchsorted(toggles2, starts, side="right") % 2 == 1
+    return int(lengths[inside1 & inside2].sum())
+
+
+def rle_mask_iou(mask1, mask2, threshold=None):
+    """
+    Mask IoU for RLE (or mixed RLE / dense) inputs, same semantics as
+    calculate_mask_iou.
+    """
+    rle1 = as_rle(mask1, threshold)
+    rle2 = as_rle(mask2, threshold)
+    intersection = rle_intersection(rle1, rle2)
+    union = rle1.area() + rle2.area() - intersection
+    if union == 0:
+        return 0.0
+    return intersection / union
+
+
+def rle_mask_giou(mask1, mask2, threshold=None):
+    """
+    Mask GIoU for RLE (or mixed RLE / dense) inputs, same semantics as
+    calculate_mask_giou.
+    """
+    rle1 = as_rle(mask1, threshold)
+    rle2 = as_rle(mask2, threshold)
+    intersection = rle_intersection(rle1, rle2)
+    union = rle1.area() + rle2.area() - intersection
+    if union == 0:
+        return 0.0
+
+    extent1 = rle1.extent()
+    extent2 = rle2.extent()
+    if extent1 is None or extent2 is None:
+        return 0.0
+
+    enclose_x_min = min(extent1[0], extent2[0])
+    enclose_x_max = max(extent1[1], extent2[1])
+    enclose_y_min = min(extent1[2], extent2[2])
+    enclose_y_max = max(extent1[3], extent2[3])
+    enclose_area = (enclose_x_max - enclose_x_min + 1) * (
+        enclose_y_max - enclose_y_min + 1
+    )
+    return (intersection / union) - ((enclose_area - union) / enclose_area)
+
+
+def rle_dice_coefficient(true_mask, pred_mask, threshold=None):
+    """
+    Dice coefficient for RLE (or mixed RLE / dense) inputs, same semantics as
+    dice_coefficient.
+    """
+    true_rle = as_rle(true_mask, threshold)
+    pred_rle = as_rle(pred_mask, threshold)
+    assert (
+        true_rle.size == pred_rle.size
+    ), "Shape mismatch between true mask and predicted mask."
+    intersection = rle_intersection(true_rle, pred_rle)
+    union = true_rle.area() + pred_rle.area()
+    return (2.0 * intersection) / union if union != 0 else 0.0
+
+
+if __name__ == "__main__":
+    # Test cases
+    test_cases = [
+        (
+            "部分重疊 (Partial Overlap)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+        (
+            "小遮罩在大遮罩內 (Small Mask Inside Large Mask)",
+            np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]]),
+            np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1]]),
+        ),
+        (
+            "一個遮罩全為零 (One Mask All Zero)",
+            np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]]),
+            np.array([[1, 1, 1], [1, 0, 0], [0, 0, 1]]),
+        ),
+    ]
+
+    for description, m1, m2 in test_cases:
+        r1 = RLEMask.from_mask(m1)
+        r2 = RLEMask.from_mask(m2)
+        print(f"{description}:")
+        print("  RLE 1:", r1.to_coco(compress=False), "bbox:", r1.bbox())
+        print("  RLE 2:", r2.to_coco(), "bbox:", r2.bbox())
+        print("  Round trip:", np.array_equal(r2.decode(), m2 != 0))
+        print("  RLE Mask IoU:", rle_mask_iou(r1, r2))
+        print("  RLE Mask GIoU:", rle_mask_giou(r1, r2))
+        print("  RLE Dice Coefficient:", rle_dice_coefficient(r1, r2))
+        print()
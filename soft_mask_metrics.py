@@ -0,0 +1,188 @@
+import numpy as np
+
+from mask_stats import as_binary_mask
+
+
+def _soft_terms(true_mask, prob_mask):
+    """
+    Per-mask sums of t * p, t and p over the last two axes, for a single
+    (H, W) pair or a batch (N, H, W). The ground truth is binarized as in
+    as_binary_mask, so a 0 / 255 label map counts its foreground as 1.
+    """
+    true_mask = as_binary_mask(true_mask).astype(np.float64)
+    prob_mask = np.asarray(prob_mask, dtype=np.float64)
+    assert (
+        true_mask.shape == prob_mask.shape
+    ), "Shape mismatch between true mask and predicted mask."
+    axes = (-2, -1)
+    intersection = np.einsum("...ij,...ij->...", true_mask, prob_mask)
+    return intersection, true_mask.sum(axis=axes), prob_mask.sum(axis=axes)
+
+
+def _ratio(numerator, denominator):
+    # 0 where the denominator is 0, as calculate_mask_iou / dice_coefficient
+    result = np.zeros(np.shape(denominator))
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result[()] if result.ndim == 0 else result
+
+
+def soft_iou(true_mask, prob_mask):
+    """
+    Soft (probabilistic) IoU: sum(t * p) / sum(t + p - t * p), with the
+    ground truth t binarized. Equal to calculate_mask_iou for 0/1
+    predictions. Batches (N, H, W) give (N,) scores.
+    """
+    intersection, true_sum, prob_sum = _soft_terms(true_mask, prob_mask)
+    return _ratio(intersection, true_sum + prob_sum - intersection)
+
+
+def soft_dice(true_mask, prob_mask):
+    """
+    Soft Dice: 2 * sum(t * p) / (sum(t) + sum(p)), with the ground truth t
+    binarized. Equal to dice_coefficient for 0/1 predictions. Batches
+    (N, H, W) give (N,) scores.
+    """
+    intersection, true_sum, prob_sum = _soft_terms(true_mask, prob_mask)
+    return _ratio(2.0 * intersection, true_sum + prob_sum)
+
+
+class ThresholdSweep:
+    """
+    Hard IoU / Dice of probability maps at K thresholds from one pass.
+
+    Each pixel's probability is binned by how many thresholds it reaches,
+    separately for ground truth foreground and background. Reverse
+    cumulative sums of the two histograms then give TP and FP at every
+    threshold (foreground is p >= threshold, as in as_binary_mask, so NaN
+    probabilities are background), instead of K full-image passes. Counts
+    accumulate across update() calls.
+    """
+
+    def __init__(self, thresholds):
+        thresholds = np.asarray(thresholds, dtype=np.float64).reshape(-1)
+        if thresholds.size == 0 or np.any(np.diff(thresholds) <= 0):
+            raise ValueError("thresholds must be non-empty and strictly increasing.")
+        self.thresholds = thresholds
+        num_bins = len(thresholds) + 1
+        self.positive_hist = np.zeros(num_bins, dtype=np.int64)
+        self.negative_hist = np.zeros(num_bins, dtype=np.int64)
+
+    def _histograms(self, true_mask, prob_mask, num_images=1):
+        true_mask = as_binary_mask(true_mask)
+        prob_mask = np.asarray(prob_mask)
+        assert (
+            true_mask.shape == prob_mask.shape
+        ), "Shape mismatch between true mask and predicted mask."
+        num_bins = len(self.thresholds) + 1
+        # Bin k holds the pixels that reach exactly the first k thresholds
+        prob_mask = prob_mask.reshape(-1)
+        bins = np.searchsorted(self.thresholds, prob_mask, side="right")
+        if prob_mask.dtype.kind == "f" and prob_mask.size and np.isnan(prob_mask.min()):
+            # searchsorted puts NaN above every threshold; as_binary_mask
+            # (NaN >= threshold is False) treats it as background
+            bins[np.isnan(prob_mask)] = 0
+        if num_images > 1:
+            pixels_per_image = max(bins.size // num_images, 1)
+            bins += num_bins * (np.arange(bins.size) // pixels_per_image)
+        bins = bins * 2 + true_mask.reshape(-1)
+        counts = np.bincount(bins, minlength=2 * num_bins * num_images)
+        counts = counts.reshape(num_images, num_bins, 2)
+        return counts[..., 1], counts[..., 0]
+
+    def update(self, true_mask, prob_mask):
+        positive, negative = self._histograms(true_mask, prob_mask)
+        self.positive_hist += positive[0]
+        self.negative_hist += negative[0]
+        return self
+
+    def merge(self, other):
+        if not np.array_equal(self.thresholds, other.thresholds):
+            raise ValueError("Cannot merge sweeps with different thresholds.")
+        self.positive_hist += other.positive_hist
+        self.negative_hist += other.negative_hist
+        return self
+
+    def reset(self):
+        self.positive_hist[:] = 0
+        self.negative_hist[:] = 0
+
+    @staticmethod
+    def _metrics(thresholds, positive_hist, negative_hist):
+        # Pixels reaching threshold k are the ones in bins k + 1 and above
+        tp = np.cumsum(positive_hist[..., ::-1], axis=-1)[..., ::-1][..., 1:]
+        fp = np.cumsum(negative_hist[..., ::-1], axis=-1)[..., ::-1][..., 1:]
+        fn = positive_hist.sum(axis=-1, keepdims=True) - tp
+        return {
+            "thresholds": thresholds,
+            "iou": _ratio(tp, tp + fp + fn),
+            "dice": _ratio(2 * tp, 2 * tp + fp + fn),
+            "tp": tp,
+            "fp": fp,
+            "fn": fn,
+        }
+
+    def compute(self):
+        return self._metrics(self.thresholds, self.positive_hist, self.negative_hist)
+
+
+def threshold_sweep(true_masks, prob_masks, thresholds, per_image=False):
+    """
+    IoU / Dice (and TP / FP / FN) of probability maps at every threshold in one
+    pass. With per_image=True a batch (N, H, W) gives (N, K) arrays, computed
+    from a single bincount over the whole batch; otherwise counts are pooled.
+    """
+    sweep = ThresholdSweep(thresholds)
+    if not per_image:
+        return sweep.update(true_masks, prob_masks).compute()
+    prob_masks = np.asarray(prob_masks)
+    positive, negative = sweep._histograms(true_masks, prob_masks, len(prob_masks))
+    return sweep._metrics(sweep.thresholds, positive, negative)
+
+
+if __name__ == "__main__":
+    from all_iou_mask import calculate_mask_iou
+    from mask_metrics import dice_coefficient
+
+    # Test cases
+    test_cases = [
+        (
+            "自信且正確 (Confident and Correct)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0.9, 0.95, 0.1], [0.85, 0.9, 0.05], [0.0, 0.1, 0.0]]),
+        ),
+        (
+            "不確定 (Uncertain)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0.6, 0.5, 0.4], [0.55, 0.45, 0.4], [0.3, 0.35, 0.3]]),
+        ),
+        (
+            "二值預測 (Binary Prediction)",
+            np.array([[1, 1, 0], [1, 1, 0], [0, 0, 0]]),
+            np.array([[0.0, 1.0, 1.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]),
+        ),
+    ]
+
+    thresholds = [0.25, 0.5, 0.75]
+    for description, true_mask, prob_mask in test_cases:
+        sweep = threshold_sweep(true_mask, prob_mask, thresholds)
+        print(f"{description}:")
+        print("  Soft IoU:", round(float(soft_iou(true_mask, prob_mask)), 4))
+        print("  Soft Dice:", round(float(soft_dice(true_mask, prob_mask)), 4))
+        for k, threshold in enumerate(thresholds):
+            print(
+                f"  @{threshold}: IoU {sweep['iou'][k]:.4f}"
+                f" (hard: {calculate_mask_iou(true_mask, prob_mask, threshold):.4f}),"
+                f" Dice {sweep['dice'][k]:.4f}"
+                f" (hard: {dice_coefficient(true_mask, prob_mask, threshold):.4f})"
+            )
+        print()
+
+    true_masks = np.stack([case[1] for case in test_cases])
+    prob_masks = np.stack([case[2] for case in test_cases])
+    print("Batched Soft IoU:", np.round(soft_iou(true_masks, prob_masks), 4))
+    print(
+        "Per-image IoU @0.5:",
+        np.round(
+            threshold_sweep(true_masks, prob_masks, thresholds, True)["iou"][:, 1], 4
+        ),
+    )
@@ -0,0 +1,215 @@
+from itertools import islice
+
+import numpy as np
+
+from all_iou_mask import (
+    calculate_focal_mask_eiou,
+    calculate_mask_alpha_iou,
+    calculate_mask_ciou,
+    calculate_mask_diou,
+    calculate_mask_eiou,
+    calculate_mask_giou,
+    calculate_mask_iou,
+    calculate_mask_mpdiou,
+    calculate_mask_siou,
+    calculate_mask_wiou,
+)
+from confusion_matrix import ConfusionMatrix, resolve_average
+from mask_metrics import (
+    average_surface_distance,
+    dice_coefficient,
+    hausdorff_distance,
+    hausdorff_distance_95,
+    pixel_accuracy,
+)
+
+# Per-image metrics, called as metric(ground_truth, prediction)
+MASK_METRICS = {
+    "mask_iou": calculate_mask_iou,
+    "mask_giou": calculate_mask_giou,
+    "mask_diou": calculate_mask_diou,
+    "mask_ciou": calculate_mask_ciou,
+    "mask_eiou": calculate_mask_eiou,
+    "mask_focal_eiou": calculate_focal_mask_eiou,
+    "mask_siou": calculate_mask_siou,
+    "mask_alpha_iou": calculate_mask_alpha_iou,
+    "mask_wiou": calculate_mask_wiou,
+    "mask_mpdiou": calculate_mask_mpdiou,
+    "dice": dice_coefficient,
+    "pixel_accuracy": pixel_accuracy,
+    "hausdorff": hausdorff_distance,
+    "hausdorff_95": hausdorff_distance_95,
+    "average_surface_distance": average_surface_distance,
+}
+
+
+class RunningStats:
+    """
+    Constant-memory mean / std / min / max of a stream of scalar values.
+    Non-finite values (e.g. inf Hausdorff distances for empty masks) are
+    counted separately and left out of the other aggregates.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.nonfinite = 0
+        self.mean = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self._m2 = 0.0
+
+    def update(self, value):
+        value = float(value)
+        if not np.isfinite(value):
+            self.nonfinite += 1
+            return
+        # Welford's update keeps the variance numerically stable over long streams
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if other.count:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self._m2 += other._m2 + delta**2 * self.count * other.count / count
+            self.mean += delta * other.count / count
+            self.count = count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.nonfinite += other.nonfinite
+        return self
+
+    @property
+    def std(self):
+        return (self._m2 / self.count) ** 0.5 if self.count else 0.0
+
+    def summary(self):
+        return {
+            "mean": self.mean if self.count else float("nan"),
+            "std": self.std,
+            "min": self.min if self.count else float("nan"),
+            "max": self.max if self.count else float("nan"),
+            "count": self.count,
+            "nonfinite": self.nonfinite,
+        }
+
+
+class StreamingEvaluator:
+    """
+    Dataset-level mask evaluation with running aggregates: per-image metrics
+    from all_iou_mask.py / mask_metrics.py are reduced to RunningStats, and
+    pixel-level accuracy / precision / recall / F1 (sklearn_metrics_mask.py)
+    come from one accumulated ConfusionMatrix. No mask is kept after update().
+    """
+
+    def __init__(self, metrics=None, num_classes=2, ignore_index=None):
+        names = list(MASK_METRICS) if metrics is None else list(metrics)
+        unknown = [name for name in names if name not in MASK_METRICS]
+        if unknown:
+            raise ValueError(
+                f"Unknown metrics {unknown}, expected any of {list(MASK_METRICS)}."
+            )
+        self.metrics = {name: MASK_METRICS[name] for name in names}
+        self.stats = {name: RunningStats() for name in names}
+        self.confusion = ConfusionMatrix(num_classes, ignore_index=ignore_index)
+        self.num_images = 0
+
+    def update(self, true_mask, pred_mask):
+        for name, metric in self.metrics.items():
+            self.stats[name].update(metric(true_mask, pred_mask))
+        self.confusion.update(true_mask, pred_mask)
+        self.num_images += 1
+        return self
+
+    def update_values(self, values):
+        """
+        Record one image's precomputed metric values, in self.metrics order.
+        The confusion matrix is not touched; merge its counts separately.
+        """
+        for stats, value in zip(self.stats.values(), values):
+            stats.update(value)
+        self.num_images += 1
+        return self
+
+    def update_batch(self, pairs):
+        for true_mask, pred_mask in pairs:
+            self.update(true_mask, pred_mask)
+        return self
+
+    def merge(self, other):
+        for name, stats in self.stats.items():
+            stats.merge(other.stats[name])
+        self.confusion.merge(other.confusion)
+        self.num_images += other.num_images
+        return self
+
+    def result(self, average="auto"):
+        report = {name: stats.summary() for name, stats in self.stats.items()}
+        report["pixel"] = self.confusion.compute(average)
+        report["num_images"] = self.num_images
+        return report
+
+
+def iter_batches(pairs, batch_size):
+    """
+    Lazily group an iterable of (ground truth, prediction) pairs into lists of
+    at most batch_size pairs; only one batch is materialized at a time.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}.")
+    iterator = iter(pairs)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def evaluate_stream(
+    pairs,
+    metrics=None,
+    batch_size=32,
+    num_classes=2,
+    ignore_index=None,
+    average="auto",
+):
+    """
+    Evaluate an iterable (e.g. a generator reading masks from disk) of
+    (ground truth, prediction) pairs. Peak memory is bounded by batch_size
+    pairs, independent of the dataset size. `average` reduces the pixel
+    metrics (see ConfusionMatrix); "auto" is "binary" for two classes and
+    "macro" otherwise. It is checked before the first pair is read.
+    """
+    average = resolve_average(average, num_classes)
+    evaluator = StreamingEvaluator(metrics, num_classes, ignore_index)
+    for batch in iter_batches(pairs, batch_size):
+        evaluator.update_batch(batch)
+    return evaluator.result(average)
+
+
+if __name__ == "__main__":
+    # Test cases: masks are generated on the fly and never held together
+    def generate_pairs(num_images, size=64, seed=0):
+        rng = np.random.default_rng(seed)
+        for _ in range(num_images):
+            true_mask = np.zeros((size, size), dtype=np.uint8)
+            pred_mask = np.zeros((size, size), dtype=np.uint8)
+            y, x = rng.integers(0, size // 2, 2)
+            h, w = rng.integers(size // 8, size // 2, 2)
+            true_mask[y : y + h, x : x + w] = 1
+            dy, dx = rng.integers(-4, 5, 2)
+            pred_mask[max(y + dy, 0) : y + dy + h, max(x + dx, 0) : x + dx + w] = 1
+            yield true_mask, pred_mask
+
+    report = evaluate_stream(generate_pairs(200), batch_size=16)
+    print(f"Images evaluated: {report.pop('num_images')}")
+    print("Pixel metrics:")
+    for name, value in report.pop("pixel").items():
+        print(f"  {name}: {value:.4f}")
+    print("Per-image metrics (mean ± std):")
+    for name, summary in report.items():
+        print(f"  {name}: {summary['mean']:.4f} ± {summary['std']:.4f}")
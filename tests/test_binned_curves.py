@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from binned_curves import BinnedCurves
+
+
+def searchsorted_bins(curves, scores):
+    bins = np.searchsorted(curves.thresholds, scores, side="right") - 1
+    return np.clip(bins, 0, curves.num_bins - 1)
+
+
+@pytest.mark.parametrize(
+    "num_bins, score_range", [(1000, (0.0, 1.0)), (7, (-1.0, 2.5)), (256, (0, 255))]
+)
+def test_scores_on_edges_reach_their_bin(num_bins, score_range):
+    curves = BinnedCurves(num_bins, score_range)
+    low, high = score_range
+    rng = np.random.default_rng(0)
+    scores = np.concatenate(
+        [
+            curves.thresholds,
+            np.nextafter(curves.thresholds, -np.inf),
+            rng.uniform(low - 1, high + 1, 10_000),
+            [-np.inf, np.inf, high],
+        ]
+    )
+    curves.update(np.zeros(len(scores), dtype=bool), scores)
+    expected = np.bincount(searchsorted_bins(curves, scores), minlength=num_bins)
+    np.testing.assert_array_equal(curves.negative_hist, expected)
+
+
+def test_threshold_value_is_not_truncated_a_bin_low():
+    curves = BinnedCurves(1000).update([True], [0.57])
+    assert curves.positive_hist[570] == 1
+
+
+def test_nan_scores_are_rejected():
+    with pytest.raises(ValueError, match="NaN"):
+        BinnedCurves().update([True, False], [0.5, np.nan])
@@ -0,0 +1,110 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from detection_map import evaluate_detections
+
+pycocotools = pytest.importorskip("pycocotools")
+from pycocotools.coco import COCO  # noqa: E402
+from pycocotools.cocoeval import COCOeval  # noqa: E402
+
+
+def random_boxes(rng, count, size=(4, 120)):
+    corner = rng.integers(0, 300, (count, 2))
+    extent = rng.integers(*size, (count, 2))
+    return np.concatenate([corner, corner + extent], axis=1).astype(np.float64)
+
+
+def crowd_fixture(seed, num_images=6, num_categories=3):
+    """
+    Images with regular and crowd ground truths, and detections jittered
+    around both, including small ones lying inside the crowd regions.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(num_images):
+        gt_box = random_boxes(rng, rng.integers(1, 6))
+        crowd_box = random_boxes(rng, rng.integers(1, 3), size=(150, 300))
+        gt_boxes = np.concatenate([gt_box, crowd_box])
+        gt_labels = rng.integers(1, num_categories + 1, len(gt_boxes))
+        gt_crowd = np.arange(len(gt_boxes)) >= len(gt_box)
+
+        jittered = gt_boxes + rng.integers(-8, 9, gt_boxes.shape)
+        jittered[:, 2:] = np.maximum(jittered[:, 2:], jittered[:, :2] + 1)
+        # Small detections inside the crowd regions
+        inner = crowd_box[rng.integers(0, len(crowd_box), 4)]
+        inner_corner = inner[:, :2] + rng.integers(0, 100, (4, 2))
+        inside = np.concatenate([inner_corner, inner_corner + 30], axis=1)
+        dt_boxes = np.concatenate([jittered, inside, random_boxes(rng, 3)])
+        dt_labels = np.concatenate(
+            [
+                gt_labels,
+                rng.integers(1, num_categories + 1, len(dt_boxes) - len(gt_labels)),
+            ]
+        )
+        # Distinct scores, so the order of equal scores cannot differ
+        dt_scores = rng.permutation(len(dt_boxes)) / len(dt_boxes) + rng.random()
+        images.append((gt_boxes, gt_labels, gt_crowd, dt_boxes, dt_scores, dt_labels))
+    return images
+
+
+def coco_eval(images):
+    def xywh(box):
+        return [box[0], box[1], box[2] - box[0], box[3] - box[1]]
+
+    annotations, detections = [], []
+    for image_id, (
+        gt_boxes,
+        gt_labels,
+        gt_crowd,
+        dt_boxes,
+        dt_scores,
+        dt_labels,
+    ) in enumerate(images):
+        for box, label, crowd in zip(gt_boxes, gt_labels, gt_crowd):
+            annotations.append(
+                {
+                    "id": len(annotations) + 1,
+                    "image_id": image_id,
+                    "category_id": int(label),
+                    "bbox": xywh(box),
+                    "area": float((box[2] - box[0]) * (box[3] - box[1])),
+                    "iscrowd": int(crowd),
+                }
+            )
+        for box, score, label in zip(dt_boxes, dt_scores, dt_labels):
+            detections.append(
+                {
+                    "image_id": image_id,
+                    "category_id": int(label),
+                    "bbox": xywh(box),
+                    "score": float(score),
+                }
+            )
+    categories = sorted({a["category_id"] for a in annotations})
+    with contextlib.redirect_stdout(io.StringIO()):
+        ground_truth = COCO()
+        ground_truth.dataset = {
+            "images": [{"id": i} for i in range(len(images))],
+            "annotations": annotations,
+            "categories": [{"id": c} for c in categories],
+        }
+        ground_truth.createIndex()
+        evaluator = COCOeval(ground_truth, ground_truth.loadRes(detections), "bbox")
+        evaluator.evaluate()
+        evaluator.accumulate()
+    return evaluator.eval
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_pycocotools_with_crowd_regions(seed):
+    images = crowd_fixture(seed)
+    gt_boxes, gt_labels, gt_crowd, dt_boxes, dt_scores, dt_labels = zip(*images)
+    result = evaluate_detections(
+        gt_boxes, gt_labels, dt_boxes, dt_scores, dt_labels, gt_crowd=gt_crowd
+    )
+    expected = coco_eval(images)
+    np.testing.assert_allclose(result["precision"], expected["precision"])
+    np.testing.assert_allclose(result["recall"], expected["recall"])
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import compare_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_metrics_does_not_import_numba():
+    code = "import sys, all_iou_bbx, all_iou_mask, nms; print('numba' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.strip() == "False"
+
+
+def report(jit, p50):
+    result = {
+        "suite": "box",
+        "function": "calculate_pairwise_iou",
+        "backend": "numba" if jit else "numpy",
+        "params": {"boxes": 100},
+        "latency_ms": {"p50": p50},
+    }
+    return {"environment": {"jit": jit}, "results": [result]}
+
+
+def test_compare_refuses_mixed_jit_reports():
+    with pytest.raises(ValueError, match="jit"):
+        compare_results(report(True, 1.0), report(False, 1.0))
+    assert compare_results(report(False, 1.0), report(False, 2.0))[0]["regression"]
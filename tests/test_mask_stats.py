@@ -0,0 +1,41 @@
+import numpy as np
+
+from all_iou_mask import calculate_mask_iou
+from mask_metrics import dice_coefficient
+from mask_stats import MASK_STATS_CHECK_PIXELS, clear_mask_stats_cache, get_mask_stats
+
+
+def test_in_place_write_recomputes_stats():
+    clear_mask_stats_cache()
+    mask1 = np.zeros((100, 100), dtype=bool)
+    mask2 = np.zeros((100, 100), dtype=bool)
+    mask1[10:50, 10:50] = True
+    mask2[30:70, 30:70] = True
+    assert dice_coefficient(mask1, mask2) > 0
+    assert calculate_mask_iou(mask1, mask2) > 0
+
+    mask1[...] = False
+    assert get_mask_stats(mask1).area == 0
+    assert dice_coefficient(mask1, mask2) == 0.0
+    assert calculate_mask_iou(mask1, mask2) == 0.0
+
+
+def test_small_mask_single_pixel_write():
+    clear_mask_stats_cache()
+    mask = np.zeros((64, 64), dtype=np.uint8)
+    assert mask.size <= MASK_STATS_CHECK_PIXELS
+    assert get_mask_stats(mask).area == 0
+    mask[63, 1] = 1
+    stats = get_mask_stats(mask)
+    assert stats.area == 1
+    assert stats.extent == (63, 63, 1, 1)
+    assert get_mask_stats(mask) is stats
+
+
+def test_large_mask_reuses_unchanged_stats():
+    clear_mask_stats_cache()
+    mask = np.random.default_rng(0).random((512, 512)) > 0.5
+    stats = get_mask_stats(mask)
+    assert get_mask_stats(mask) is stats
+    mask[:, :256] = False
+    assert get_mask_stats(mask).area == np.count_nonzero(mask)
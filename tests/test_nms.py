@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import jit_kernels
+from all_iou_bbx import calculate_pairwise_iou
+from nms import nms, soft_nms
+
+
+def sequential_nms(boxes, scores, iou_threshold, variant="iou"):
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        keep.append(order[0])
+        values = calculate_pairwise_iou(boxes[order[:1]], boxes[order[1:]], variant)[0]
+        order = order[1:][values <= iou_threshold]
+    return np.array(keep)
+
+
+def sequential_soft_nms(boxes, scores, sigma=0.5, score_threshold=0.001):
+    scores = scores.astype(float)
+    alive = scores >= score_threshold
+    keep, kept_scores = [], []
+    while alive.any():
+        candidates = np.flatnonzero(alive)
+        best = candidates[np.argmax(scores[candidates])]
+        keep.append(best)
+        kept_scores.append(scores[best])
+        alive[best] = False
+        others = np.flatnonzero(alive)
+        values = np.maximum(calculate_pairwise_iou(boxes[[best]], boxes[others])[0], 0)
+        scores[others] *= np.exp(-(values * values) / sigma)
+        alive[others[scores[others] < score_threshold]] = False
+    return np.array(keep), np.array(kept_scores)
+
+
+def chain(count):
+    """
+    Boxes sliding one unit at a time with decreasing scores: every box
+    overlaps the next three with IoU > 0.5, one long chain of suppressions.
+    """
+    x = np.arange(count, dtype=float)
+    boxes = np.stack([x, np.zeros(count), x + 10, np.full(count, 10.0)], axis=1)
+    return boxes, np.linspace(1.0, 0.5, count)
+
+
+@pytest.fixture(params=[True, False], ids=["jit", "numpy"])
+def backend(request):
+    if request.param and not jit_kernels.NUMBA_AVAILABLE:
+        pytest.skip("Numba is not installed")
+    previous = jit_kernels.set_jit(request.param)
+    yield
+    jit_kernels.set_jit(previous)
+
+
+@pytest.mark.parametrize("variant", ["iou", "diou"])
+def test_nms_matches_sequential_on_chain(backend, variant):
+    boxes, scores = chain(300)
+    np.testing.assert_array_equal(
+        nms(boxes, scores, 0.5, variant), sequential_nms(boxes, scores, 0.5, variant)
+    )
+
+
+def test_soft_nms_matches_sequential_on_chain(backend):
+    boxes, scores = chain(300)
+    keep, kept_scores = soft_nms(boxes, scores)
+    expected_keep, expected_scores = sequential_soft_nms(boxes, scores)
+    np.testing.assert_array_equal(keep, expected_keep)
+    np.testing.assert_allclose(kept_scores, expected_scores, rtol=1e-12)
+
+
+def test_long_chain(backend):
+    # One suppression per box down the whole chain: every fourth box survives
+    boxes, scores = chain(50_000)
+    np.testing.assert_array_equal(nms(boxes, scores, 0.5), np.arange(0, 50_000, 4))
+    keep, kept_scores = soft_nms(boxes, scores, score_threshold=0.1)
+    assert np.all(np.diff(kept_scores) <= 0)
+    assert np.all(kept_scores >= 0.1)
@@ -0,0 +1,22 @@
+import numpy as np
+
+from all_iou_mask import calculate_mask_iou
+from mask_metrics import dice_coefficient
+from soft_mask_metrics import soft_dice, soft_iou, threshold_sweep
+
+
+def test_label_map_ground_truth_is_binarized():
+    true_mask = np.array([[255, 255, 0], [255, 0, 0]], dtype=np.uint8)
+    prob_mask = np.array([[1.0, 0.0, 1.0], [1.0, 0.0, 0.0]])
+    assert soft_iou(true_mask, prob_mask) == calculate_mask_iou(true_mask, prob_mask)
+    assert soft_dice(true_mask, prob_mask) == dice_coefficient(true_mask, prob_mask)
+
+
+def test_sweep_treats_nan_as_background_like_the_hard_metrics():
+    true_mask = np.array([[1, 1, 0], [1, 0, 0]])
+    prob_mask = np.array([[0.9, np.nan, np.nan], [0.6, 0.2, 0.7]])
+    thresholds = [0.25, 0.5, 0.75]
+    sweep = threshold_sweep(true_mask, prob_mask, thresholds)
+    for k, threshold in enumerate(thresholds):
+        assert sweep["iou"][k] == calculate_mask_iou(true_mask, prob_mask, threshold)
+        assert sweep["dice"][k] == dice_coefficient(true_mask, prob_mask, threshold)
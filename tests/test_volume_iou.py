@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import all_iou_mask
+from volume_iou import calculate_volume_mask_ious
+
+MASK_FUNCTIONS = {
+    "iou": all_iou_mask.calculate_mask_iou,
+    "giou": all_iou_mask.calculate_mask_giou,
+    "diou": all_iou_mask.calculate_mask_diou,
+    "ciou": all_iou_mask.calculate_mask_ciou,
+    "eiou": all_iou_mask.calculate_mask_eiou,
+    "focal_eiou": all_iou_mask.calculate_focal_mask_eiou,
+    "siou": all_iou_mask.calculate_mask_siou,
+    "alpha_iou": all_iou_mask.calculate_mask_alpha_iou,
+    "wiou": all_iou_mask.calculate_mask_wiou,
+    "mpdiou": all_iou_mask.calculate_mask_mpdiou,
+}
+
+
+def blob_pair(shape, seed):
+    rng = np.random.default_rng(seed)
+    rows, cols = np.ogrid[: shape[0], : shape[1]]
+    masks = []
+    for _ in range(2):
+        center = rng.uniform(0.2, 0.8, 2) * shape
+        radius = rng.uniform(0.1, 0.3, 2) * shape
+        masks.append(
+            ((rows - center[0]) / radius[0]) ** 2
+            + ((cols - center[1]) / radius[1]) ** 2
+            <= 1
+        )
+    return masks
+
+
+@pytest.mark.parametrize("shape", [(40, 64), (300, 260)])
+@pytest.mark.parametrize("seed", range(4))
+def test_2d_volume_matches_mask_functions(shape, seed):
+    mask1, mask2 = blob_pair(shape, seed)
+    report = calculate_volume_mask_ious(mask1, mask2, chunk_slices=7)
+    for variant, function in MASK_FUNCTIONS.items():
+        assert report[variant] == pytest.approx(function(mask1, mask2), rel=1e-12)
+
+
+def test_empty_mask_gives_zero():
+    mask = np.zeros((8, 8), dtype=bool)
+    mask[2:5, 3:6] = True
+    report = calculate_volume_mask_ious(mask, np.zeros_like(mask))
+    for variant, function in MASK_FUNCTIONS.items():
+        assert report[variant] == function(mask, np.zeros_like(mask)) == 0.0
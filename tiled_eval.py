@@ -0,0 +1,301 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from all_iou_mask import MASK_IOU_VARIANTS, _variant_from_overlap
+from confusion_matrix import ConfusionMatrix
+from mask_stats import MaskStats, foreground
+from profiling import instrument
+
+# Tile edge in pixels: a 4096 x 4096 uint8 tile pair is 32 MiB
+DEFAULT_TILE_SIZE = 4096
+
+
+def iter_tiles(shape, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Yield the (row slice, col slice) windows of an (H, W) image cut into
+    aligned tiles of at most tile_size x tile_size, in row-major order.
+    """
+    if tile_size < 1:
+        raise ValueError(f"tile_size must be at least 1, got {tile_size}.")
+    height, width = shape
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            yield (
+                slice(row, min(row + tile_size, height)),
+                slice(col, min(col + tile_size, width)),
+            )
+
+
+@instrument(name="tile_counts", category="stage")
+def _tile_counts(true_tile, pred_tile, threshold=None):
+    """
+    Per-row and per-column foreground counts of both tiles and the number of
+    pixels in both foregrounds: everything the whole-image metrics need.
+    """
+    true_tile = foreground(true_tile, threshold)
+    pred_tile = foreground(pred_tile, threshold)
+    if true_tile.shape != pred_tile.shape:
+        raise ValueError(
+            f"Tile shape mismatch: {true_tile.shape} and {pred_tile.shape}."
+        )
+    return (
+        np.count_nonzero(true_tile, axis=1),
+        np.count_nonzero(true_tile, axis=0),
+        np.count_nonzero(pred_tile, axis=1),
+        np.count_nonzero(pred_tile, axis=0),
+        int(np.count_nonzero(np.logical_and(true_tile, pred_tile))),
+    )
+
+
+class TiledMaskEvaluator:
+    """
+    Exact whole-image metrics of one (H, W) ground truth / prediction pair
+    that is only ever seen tile by tile, e.g. a 100k x 100k whole-slide mask.
+
+    Each tile is reduced to per-row and per-column foreground counts plus its
+    intersection count. Summed over the tiles these give the areas, extents
+    and centroids of both masks (MaskStats.from_counts) and the TP / FP / FN
+    counts, so every mask IoU variant, Dice and pixel accuracy equal the
+    dense functions on the full image. State is O(H + W).
+    """
+
+    def __init__(self, shape, threshold=None):
+        self.shape = tuple(int(s) for s in shape)
+        if len(self.shape) != 2:
+            raise ValueError(f"Expected an (H, W) image shape, got {self.shape}.")
+        self.threshold = threshold
+        height, width = self.shape
+        self.true_rows = np.zeros(height, dtype=np.int64)
+        self.true_cols = np.zeros(width, dtype=np.int64)
+        self.pred_rows = np.zeros(height, dtype=np.int64)
+        self.pred_cols = np.zeros(width, dtype=np.int64)
+        self.intersection = 0
+
+    def update(self, true_tile, pred_tile, offset=(0, 0)):
+        """
+        Accumulate one aligned tile pair whose top-left pixel is at `offset`
+        (row, col) in the full image. Every pixel must be covered once.
+        """
+        true_tile = np.asarray(true_tile)
+        row, col = offset
+        if (
+            min(offset) < 0
+            or row + true_tile.shape[0] > self.shape[0]
+            or col + true_tile.shape[1] > self.shape[1]
+        ):
+            raise ValueError(
+                f"Tile of shape {true_tile.shape} at {tuple(offset)} does not fit "
+                f"in an image of shape {self.shape}."
+            )
+        counts = _tile_counts(true_tile, pred_tile, self.threshold)
+        return self._add(offset, counts)
+
+    def _add(self, offset, counts):
+        true_rows, true_cols, pred_rows, pred_cols, intersection = counts
+        row, col = offset
+        self.true_rows[row : row + len(true_rows)] += true_rows
+        self.true_cols[col : col + len(true_cols)] += true_cols
+        self.pred_rows[row : row + len(pred_rows)] += pred_rows
+        self.pred_cols[col : col + len(pred_cols)] += pred_cols
+        self.intersection += intersection
+        return self
+
+    def merge(self, other):
+        """
+        Add the tiles another evaluator of the same image has seen.
+        """
+        if other.shape != self.shape:
+            raise ValueError(
+                f"Cannot merge evaluators of shapes {self.shape} and {other.shape}."
+            )
+        self.true_rows += other.true_rows
+        self.true_cols += other.true_cols
+        self.pred_rows += other.pred_rows
+        self.pred_cols += other.pred_cols
+        self.intersection += other.intersection
+        return self
+
+    def reset(self):
+        for counts in (self.true_rows, self.true_cols, self.pred_rows, self.pred_cols):
+            counts[:] = 0
+        self.intersection = 0
+
+    def stats(self):
+        """
+        (true, pred) MaskStats of the full image.
+        """
+        return (
+            MaskStats.from_counts(self.true_rows, self.true_cols, self.threshold),
+            MaskStats.from_counts(self.pred_rows, self.pred_cols, self.threshold),
+        )
+
+    def confusion_matrix(self):
+        """
+        The binary ConfusionMatrix of the full image, as if every tile had
+        been passed to ConfusionMatrix.update.
+        """
+        true_area = int(self.true_rows.sum())
+        pred_area = int(self.pred_rows.sum())
+        tp = self.intersection
+        fp = pred_area - tp
+        fn = true_area - tp
+        tn = self.shape[0] * self.shape[1] - tp - fp - fn
+        confusion = ConfusionMatrix(2)
+        confusion.matrix[:] = [[tn, fp], [fn, tp]]
+        return confusion
+
+    def result(self, variants=MASK_IOU_VARIANTS, gamma=2.0, alpha=0.5, weight=1):
+        """
+        {"mask_<variant>": value} for the requested mask IoU variants, plus
+        "dice" and "pixel_accuracy" (named as in streaming_eval.MASK_METRICS)
+        and the "pixel" confusion-matrix metrics (sklearn_metrics_mask.py).
+        """
+        true_stats, pred_stats = self.stats()
+        intersection = self.intersection
+        union = true_stats.area + pred_stats.area - intersection
+        report = {
+            f"mask_{variant}": _variant_from_overlap(
+                true_stats,
+                pred_stats,
+                intersection,
+                union,
+                variant,
+                gamma=gamma,
+                alpha=alpha,
+                weight=weight,
+            )
+            for variant in variants
+        }
+        total = true_stats.area + pred_stats.area
+        report["dice"] = (2.0 * intersection) / total if total != 0 else 0.0
+        total_pixels = self.shape[0] * self.shape[1]
+        wrong_pixels = total - 2 * intersection
+        report["pixel_accuracy"] = (total_pixels - wrong_pixels) / total_pixels
+        report["pixel"] = self.confusion_matrix().compute()
+        return report
+
+
+def _read_tile_counts(true_source, pred_source, window, threshold):
+    true_tile = np.asarray(true_source[window])
+    pred_tile = np.asarray(pred_source[window])
+    return _tile_counts(true_tile, pred_tile, threshold)
+
+
+@instrument
+def evaluate_tiled(
+    true_source,
+    pred_source,
+    tile_size=DEFAULT_TILE_SIZE,
+    threshold=None,
+    num_workers=1,
+    variants=MASK_IOU_VARIANTS,
+):
+    """
+    Evaluate a ground truth / prediction pair too large to load, reading one
+    aligned tile pair at a time. Sources are anything with a .shape and 2D
+    slicing that returns array-likes: np.memmap, MaskStore views, zarr or
+    h5py datasets, or a custom lazy reader.
+
+    With num_workers > 1 tiles are read and reduced in a thread pool (file
+    reads and the NumPy counting release the GIL); at most 2 * num_workers
+    tiles are in flight, so memory stays bounded by a few tiles. Counts are
+    integers, so the result does not depend on the number of workers.
+    Returns TiledMaskEvaluator.result().
+    """
+    shape = tuple(true_source.shape)
+    if shape != tuple(pred_source.shape):
+        raise ValueError(
+            f"Shape mismatch between ground truth {shape} and prediction "
+            f"{tuple(pred_source.shape)}."
+        )
+    evaluator = TiledMaskEvaluator(shape, threshold)
+    windows = iter_tiles(shape, tile_size)
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if num_workers <= 1:
+        for window in windows:
+            counts = _read_tile_counts(true_source, pred_source, window, threshold)
+            evaluator._add((window[0].start, window[1].start), counts)
+        return evaluator.result(variants)
+
+    in_flight = deque()
+
+    def collect_oldest():
+        window, future = in_flight.popleft()
+        evaluator._add((window[0].start, window[1].start), future.result())
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        try:
+            for window in windows:
+                future = executor.submit(
+                    _read_tile_counts, true_source, pred_source, window, threshold
+                )
+                in_flight.append((window, future))
+                if len(in_flight) >= 2 * num_workers:
+                    collect_oldest()
+            while in_flight:
+                collect_oldest()
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+    return evaluator.result(variants)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from all_iou_mask import calculate_mask_diou, calculate_mask_giou
+    from mask_metrics import dice_coefficient
+
+    # Test cases: a whole-slide-like pair written to disk and memory-mapped
+    height, width = 12_000, 16_000
+    regions = np.random.default_rng(0).integers(0, 10_000, (60, 2))
+    with tempfile.TemporaryDirectory() as directory:
+        sources = []
+        for name, shift in (("true", 0), ("pred", 40)):
+            path = os.path.join(directory, f"{name}.npy")
+            mask = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.uint8, shape=(height, width)
+            )
+            # Tissue regions written straight to disk, never one in-memory image
+            for row, col in regions:
+                mask[row + shift : row + shift + 1500, col : col + 2500] = 1
+            mask.flush()
+            del mask
+            sources.append(np.load(path, mmap_mode="r"))
+        true_source, pred_source = sources
+
+        for description, workers in (
+            ("單執行緒 (Single Thread)", 1),
+            ("多執行緒 (Thread Pool)", 4),
+        ):
+            start = time.perf_counter()
+            report = evaluate_tiled(
+                true_source, pred_source, tile_size=4096, num_workers=workers
+            )
+            elapsed = time.perf_counter() - start
+            print(f"{description}, {height}x{width} in {elapsed:.2f} s:")
+            for name in (
+                "mask_iou",
+                "mask_giou",
+                "mask_diou",
+                "dice",
+                "pixel_accuracy",
+            ):
+                print(f"  {name}: {report[name]:.6f}")
+            print(f"  pixel f1: {report['pixel']['f1']:.6f}")
+            print()
+
+        # The dense metrics on the full image agree (this loads both masks)
+        true_mask, pred_mask = np.asarray(true_source), np.asarray(pred_source)
+        print("Dense mask GIoU:", calculate_mask_giou(true_mask, pred_mask))
+        print("Dense mask DIoU:", calculate_mask_diou(true_mask, pred_mask))
+        print("Dense Dice:", dice_coefficient(true_mask, pred_mask))
+        # Memory maps hold the files open; release them before the directory goes
+        del true_source, pred_source, sources, true_mask, pred_mask